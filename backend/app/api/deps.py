@@ -1,23 +1,28 @@
-from collections.abc import Generator
-from typing import Annotated
+from collections.abc import AsyncGenerator
+from datetime import datetime
+from typing import Annotated, Literal
 
 from fastapi import Depends, HTTPException, Query
 from redis import asyncio as aioredis
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.db import engine, redis_db
+from app.core.db import async_engine, redis_db
 from app.core.security import TokenDataDep
-from app.crud import common
-from app.models import User
+from app.core.storage import BlobStore, blob_store
+from app.crud import users as users_crud
+from app.models import TodoStatus, User
+from app.schemas.todo import TodoFilter
 from app.schemas.utils import PageParams, TokenUser
+from app.utils import decode_cursor
 
 
-def get_db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Objects are kept loaded after commit, lazy refresh is not possible in async
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 
 
 def get_redis_db() -> aioredis.Redis:
@@ -27,8 +32,17 @@ def get_redis_db() -> aioredis.Redis:
 RedisSessionDep = Annotated[aioredis.Redis, Depends(get_redis_db)]
 
 
-def get_current_user(session: SessionDep, token_data: TokenDataDep) -> User:
-    user = common.get_object(session, User, token_data.id)
+def get_blob_store() -> BlobStore:
+    return blob_store
+
+
+BlobStoreDep = Annotated[BlobStore, Depends(get_blob_store)]
+
+
+async def get_current_user(
+    session: AsyncSessionDep, token_data: TokenDataDep, redis: RedisSessionDep
+) -> User:
+    user = await users_crud.get_cached_user(session, token_data.id, redis)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -46,12 +60,42 @@ CurrentTokenUser = Annotated[TokenUser, Depends(get_current_token_user)]
 
 
 def get_page_params(
-    skip: int = Query(0, ge=0), limit: int = Query(100, ge=1)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: str | None = Query(None),
+    with_total: bool = Query(False),
 ) -> PageParams:
+    page_cursor = None
+    if cursor:
+        page_cursor = decode_cursor(cursor)
+        if not page_cursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     return PageParams(
-        skip=skip,
+        # Keyset pages continue from the cursor, offset is not combined with it
+        skip=0 if page_cursor else skip,
         limit=limit,
+        cursor=page_cursor,
+        with_total=with_total,
     )
 
 
 PageParamsDep = Annotated[PageParams, Depends(get_page_params)]
+
+
+def get_todo_filter(
+    status: list[TodoStatus] | None = Query(None),
+    q: str | None = Query(None, min_length=1, max_length=256),
+    modified_after: datetime | None = Query(None),
+    modified_before: datetime | None = Query(None),
+    order: Literal["asc", "desc"] = Query("asc"),
+) -> TodoFilter:
+    return TodoFilter(
+        status=status,
+        q=q,
+        modified_after=modified_after,
+        modified_before=modified_before,
+        order=order,
+    )
+
+
+TodoFilterDep = Annotated[TodoFilter, Depends(get_todo_filter)]
@@ -9,4 +9,9 @@ api_router.include_router(users.router, prefix="/users", tags=["users"])
 
 api_router.include_router(images.router, prefix="/images", tags=["images"])
 
+# Included on their own, a RedisRouter nested in another one never starts its broker.
+# Before todos, so "/todos/invites" is not matched as a todo id
+api_router.include_router(
+    todos.invites_router, prefix="/todos/invites", tags=["invites"]
+)
 api_router.include_router(todos.router, prefix="/todos", tags=["todos"])
@@ -1,21 +1,125 @@
+import re
 import uuid
 from typing import Any
 
-from fastapi import APIRouter, HTTPException, Response
+import aiofiles.os
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.responses import FileResponse, Response, StreamingResponse
 
-from app.api.deps import SessionDep
+from app.api.deps import AsyncSessionDep, BlobStoreDep
+from app.core.image_processing import THUMBNAIL_MEDIA_TYPE, pick_thumbnail_size
+from app.core.timing import TimedRoute
 from app.crud import common as crud
 
 from app.models import Image
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Image rows are never modified, a new upload always creates a new image
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def image_etag(image_id: uuid.UUID, thumbnail_size: int | None = None) -> str:
+    if thumbnail_size:
+        return f'"{image_id}-{thumbnail_size}"'
+    return f'"{image_id}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in tags
+
+
+def parse_range(http_range: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single "bytes=start-end" range into [start, end).
+
+    Returns None when the whole blob should be sent. Multipart ranges are
+    answered with the whole blob as allowed by RFC 9110.
+    """
+    if not http_range:
+        return None
+    match = RANGE_RE.match(http_range.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    else:
+        # Suffix range, the last N bytes
+        start = max(size - int(last), 0)
+        end = size
+    if start >= size or start >= end:
+        raise HTTPException(
+            status_code=416, headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
 
 @router.get("/{image_id}")
-def read_image(session: SessionDep, image_id: uuid.UUID) -> Any:
-    image = crud.get_object(session, Image, image_id)
+async def read_image(
+    session: AsyncSessionDep,
+    store: BlobStoreDep,
+    image_id: uuid.UUID,
+    request: Request,
+    size: int | None = Query(None, ge=1, description="Longest side in pixels"),
+) -> Any:
+    thumbnail_size = pick_thumbnail_size(size)
+    etag = image_etag(image_id, thumbnail_size)
+    cache_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    # The id names immutable content, a cached copy is valid without the database
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers)
+
+    image = await crud.get_object(session, Image, image_id)
 
-    if not image:
+    if not image or not image.blob_key:
         raise HTTPException(status_code=404, detail="Image not found")
 
+    blob_key = image.blob_key
+    blob_size = image.size
     media_type = image.attributes.get("media_type", "image/png")
-    return Response(content=image.binary, media_type=media_type)
+
+    # Images uploaded before thumbnails existed fall back to the original
+    thumbnail = image.attributes.get("thumbnails", {}).get(str(thumbnail_size))
+    if thumbnail:
+        blob_key = thumbnail["blob_key"]
+        blob_size = thumbnail["size"]
+        media_type = THUMBNAIL_MEDIA_TYPE
+
+    path = store.local_path(blob_key)
+    if path:
+        # FileResponse would only find out once the response has started
+        if not await aiofiles.os.path.exists(path):
+            raise HTTPException(status_code=404, detail="Image not found")
+        # Served from disk with sendfile, Range is handled by FileResponse
+        return FileResponse(path, media_type=media_type, headers=cache_headers)
+
+    headers = {"Accept-Ranges": "bytes", **cache_headers}
+    byte_range = parse_range(request.headers.get("range"), blob_size)
+    if not byte_range:
+        headers["Content-Length"] = str(blob_size)
+        return StreamingResponse(
+            store.iter_range(blob_key, 0, blob_size),
+            media_type=media_type,
+            headers=headers,
+        )
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start)
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{blob_size}"
+    return StreamingResponse(
+        store.iter_range(blob_key, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
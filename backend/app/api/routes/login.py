@@ -1,27 +1,35 @@
 from datetime import datetime, timedelta
 from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import Cookie, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from faststream.redis.fastapi import RedisRouter
 from starlette.responses import Response
 
-from app.api.deps import RedisSessionDep, SessionDep
+from app.api.deps import AsyncSessionDep, RedisSessionDep
 from app.core import security
 from app.core.config import settings
+from app.core.metrics import BROKER_METRICS
+from app.core.timing import TimedRoute
 from app.crud import users as crud
 from app.schemas.user import UserCreateOpen, UserOut, UserPublicOutShort
 from app.schemas.utils import Message
 from app.utils import send_verification_code, validate_phone
 
-router = APIRouter()
+# A redis router for the revocations, published by logout to every worker
+router = RedisRouter(
+    settings.REDIS_DATABASE_URI, route_class=TimedRoute, middlewares=[BROKER_METRICS]
+)
 
 
 @router.post("/login/code", response_model=UserPublicOutShort)
 async def get_sms_code(
-    session: SessionDep, user_in: UserCreateOpen, redis: RedisSessionDep
+    session: AsyncSessionDep, user_in: UserCreateOpen, redis: RedisSessionDep
 ) -> Any:
     user_phone = validate_phone(user_in.phone)
-    user = crud.get_user_by_phone(session=session, phone=user_phone)
+    user = await crud.get_user_by_phone(
+        session=session, phone=user_phone, options=crud.USER_OUT_OPTIONS
+    )
 
     if user and not user.is_active:
         raise HTTPException(status_code=400, detail="User not found")
@@ -52,7 +60,7 @@ async def get_sms_code(
 
 @router.post("/login", response_model=UserOut)
 async def login(
-    session: SessionDep,
+    session: AsyncSessionDep,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     response: Response,
     request: Request,
@@ -81,6 +89,20 @@ async def login(
 
 
 @router.post("/logout/", response_model=Message)
-def logout(request: Request, response: Response) -> Any:
+async def logout(
+    request: Request,
+    response: Response,
+    session_id: str | None = Cookie(
+        None, alias=settings.security.JWT_COOKIE_NAME, include_in_schema=False
+    ),
+) -> Any:
+    # Rejected by every worker from now on, not only dropped by the browser
+    if session_id:
+        await security.revoke_access_token(session_id, router.broker)
     security.delete_cookie_session(request, response)
     return Message(message="Logged out")
+
+
+@router.subscriber(security.TOKEN_REVOCATIONS_CHANNEL)
+async def token_revoked(revocation_key: str):
+    security.revocations.add(bytes.fromhex(revocation_key))
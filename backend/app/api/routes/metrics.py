@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from starlette.responses import Response
+
+from app.core.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def read_metrics() -> Response:
+    """
+    Prometheus metrics of all workers.
+
+    Served outside the API prefix, nginx does not proxy it. Scrape the
+    backend directly.
+    """
+    data, media_type = render_metrics()
+    return Response(data, media_type=media_type)
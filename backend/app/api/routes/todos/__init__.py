@@ -1 +1,4 @@
-from .main import router as router
\ No newline at end of file
+from .invites import router as invites_router
+from .main import router as router
+
+__all__ = ["invites_router", "router"]
@@ -1,14 +1,15 @@
 import uuid
 from typing import Annotated, Any
 
-from fastapi import Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.params import Path
-from faststream.redis.fastapi import RedisRouter
+from sqlalchemy.exc import IntegrityError
 
-from app.api.deps import CurrentUser, PageParamsDep, SessionDep
-from app.core.config import settings
+from app.api.deps import AsyncSessionDep, CurrentUser, PageParamsDep
+from app.core.timing import TimedRoute
 from app.crud import common
 from app.crud import invites as invites_crud
+from app.crud import todos as todos_crud
 from app.crud import users as users_crud
 from app.schemas.invite import (
     InviteOut,
@@ -20,17 +21,26 @@ from app.models.invite import Invite
 from app.models import Todo
 from app.schemas.todo import TodoOut
 from app.schemas.utils import Message
+from app.utils import encode_cursor
 
-router = RedisRouter(settings.REDIS_DATABASE_URI)
+from .main import commit_changes
+
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.get("/", response_model=InvitesOut)
-def read_invites(current_user: CurrentUser, session: SessionDep, q: PageParamsDep) -> Any:
+async def read_invites(current_user: CurrentUser, session: AsyncSessionDep, q: PageParamsDep) -> Any:
     """
     Retrieve invites.
     """
 
-    invites, total = invites_crud.read_objects(session, current_user, q)
+    invites, total = await invites_crud.read_objects(
+        session, current_user, q, options=invites_crud.INVITE_OUT_OPTIONS
+    )
+
+    next_cursor = None
+    if len(invites) == q.limit:
+        next_cursor = encode_cursor(invites[-1].modified_at, invites[-1].id)
 
     return InvitesOut(
         data=invites,
@@ -38,12 +48,13 @@ def read_invites(current_user: CurrentUser, session: SessionDep, q: PageParamsDe
         total=total,
         limit=q.limit,
         skip=q.skip,
+        next_cursor=next_cursor,
     )
 
 
 @router.post("/", response_model=InviteOut)
 async def create_invite(
-    session: SessionDep,
+    session: AsyncSessionDep,
     todo_id: uuid.UUID,
     user_phone: int,
     current_user: CurrentUser,
@@ -51,19 +62,27 @@ async def create_invite(
     """
     Create new invite.
     """
-    user = users_crud.get_user_by_phone(session, user_phone)
-    todo = common.get_object(session, Todo, todo_id)
+    user = await users_crud.get_user_by_phone(session, user_phone)
+    todo = await common.get_object(
+        session, Todo, todo_id, options=todos_crud.TODO_MEMBERS_OPTIONS
+    )
 
     if todo and current_user in todo.users and user and user.is_active == True and user not in todo.users:
-        db_invite = invites_crud.get_unique_invite(session, todo_id, user.id)
+        db_invite = await invites_crud.get_unique_invite(session, todo_id, user.id)
         if not db_invite:
-            common.create_object(session, None, Invite(todo_id=todo_id, user_id=user.id))
+            try:
+                await common.create_object(session, None, Invite(todo_id=todo_id, user_id=user.id))
+            except IntegrityError:
+                # A concurrent request created it, ix_invites_todo_id_user_id
+                await session.rollback()
 
     return Message(message="OK")
 
 
-def get_user_invite(session: SessionDep, current_user: CurrentUser, invite_id: uuid.UUID = Path()) -> Invite:
-    invite = common.get_object(session, Invite, invite_id)
+async def get_user_invite(session: AsyncSessionDep, current_user: CurrentUser, invite_id: uuid.UUID = Path()) -> Invite:
+    invite = await common.get_object(
+        session, Invite, invite_id, options=invites_crud.INVITE_ACCEPT_OPTIONS
+    )
     if not invite or current_user.id != invite.user_id:
         raise HTTPException(status_code=404, detail="Invite not found")
     return invite
@@ -73,19 +92,31 @@ UserInvite = Annotated[Invite, Depends(get_user_invite)]
 
 
 @router.post("/{invite_id}/accept", response_model=Message)
-async def accept_invite(session: SessionDep, invite: UserInvite) -> Message | None:
+async def accept_invite(session: AsyncSessionDep, invite: UserInvite) -> Message | None:
     """
     Accept invite by ID.
     """
-    invites_crud.accept_invite(session, invite)
-    await router.broker.publish({"todo_id": str(invite.todo_id)}, channel="todo_update")
+    # Locked before the members are read, reloads the ones the invite came with
+    todo = await common.get_object(
+        session, Todo, invite.todo_id, options=todos_crud.TODO_OUT_OPTIONS, for_update=True
+    )
+    before = TodoOut.model_validate(todo).model_dump(mode="json") if todo else None
+
+    await invites_crud.accept_invite(session, invite, commit=False)
+
+    if todo:
+        # Serialized once here instead of being reloaded by every worker
+        todo_out = TodoOut.model_validate(todo)
+        await commit_changes(session, {todo.id: before}, {todo.id: todo_out})
+    else:
+        await session.commit()
     return Message(message="OK")
 
 
 @router.post("/{invite_id}/decline", response_model=Message)
-def decline_invite(session: SessionDep, invite: UserInvite) -> Message | None:
+async def decline_invite(session: AsyncSessionDep, invite: UserInvite) -> Message | None:
     """
     Accept invite by ID.
     """
-    common.delete_object(session, invite)
+    await common.delete_object(session, invite)
     return Message(message="OK")
@@ -1,45 +1,114 @@
-import json
 import uuid
+from collections import Counter
 from typing import Any
 
-from fastapi import HTTPException
+from fastapi import HTTPException, Query, WebSocketException
 from faststream.redis.fastapi import RedisRouter
 from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
 
-from app.api.deps import CurrentUser, PageParamsDep, SessionDep
+from app.api.deps import AsyncSessionDep, CurrentUser, PageParamsDep, TodoFilterDep
 from app.core.config import settings
+from app.core.connections import (
+    SLOW_CONSUMER_CLOSE_CODE,
+    TODO_EVENTS_CHANNEL,
+    ClientConnection,
+    TodoEvent,
+    connections,
+    encode_change,
+    encode_event,
+    publish_changes,
+)
+from app.core.metrics import BROKER_METRICS
+from app.core.timing import TimedRoute
 from app.crud import common as crud
+from app.crud import todo_changes as todo_changes_crud
+from app.crud import todo_counters as todo_counters_crud
 from app.crud import todos as todos_crud
 from app.schemas.todo import (
+    TodoBatchIn,
+    TodoBatchOut,
     TodoCreate,
     TodoOut,
     TodosOut,
+    TodoSummaryOut,
+    TodoSyncOut,
     TodoUpdate,
 )
 
 from app.models.todo import Todo
 from app.schemas.utils import Message
-from .invites import router as invites_router
+from app.utils import encode_cursor
 
-router = RedisRouter(settings.REDIS_DATABASE_URI)
+router = RedisRouter(
+    settings.REDIS_DATABASE_URI, route_class=TimedRoute, middlewares=[BROKER_METRICS]
+)
 
-router.include_router(invites_router, prefix="/invites", tags=["invites"])
 
-active_connections: dict[uuid.UUID, list[WebSocket]] = {}
+async def commit_changes(
+    session: AsyncSessionDep,
+    before: dict[uuid.UUID, dict | None],
+    after: dict[uuid.UUID, TodoOut | None],
+) -> None:
+    """
+    Records the changes of flushed todo writes, commits and publishes them.
 
-async def broadcast_to_user(user_id: uuid.UUID, data: Any):
-    if user_id in active_connections:
-        for connection in active_connections[user_id]:
-            await connection.send_json(data)
+    before maps every written todo id to the todo as TodoOut dumped in json
+    mode before the writes, after to the todo after them. Either is None
+    when the todo did not or no longer exists.
+    """
+    after_data = {
+        todo_id: todo_out.model_dump(mode="json") if todo_out else None
+        for todo_id, todo_out in after.items()
+    }
+    changes = await todo_changes_crud.record_changes(
+        session,
+        {
+            todo_id: todo_changes_crud.diff_todo(before.get(todo_id), data)
+            for todo_id, data in after_data.items()
+        },
+    )
+    count_changes = Counter()
+    for todo_id, data in after_data.items():
+        # update, unlike +, keeps the negative changes
+        count_changes.update(todo_counters_crud.diff_counts(before.get(todo_id), data))
+    await todo_counters_crud.update_counts(session, count_changes)
+    # Committed with the write, a change is never published without its log row
+    await session.commit()
+    # Delivered by todo_event in every worker, not only in this one
+    await publish_changes(
+        router.broker,
+        changes,
+        {todo_id: encode_event(data) if data else None for todo_id, data in after_data.items()},
+    )
 
 
 @router.get("/", response_model=TodosOut)
-def read_todos(current_user: CurrentUser, session: SessionDep, q: PageParamsDep) -> Any:
+async def read_todos(
+    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    q: PageParamsDep,
+    todo_filter: TodoFilterDep,
+) -> Any:
     """
-    Retrieve todos.
+    Retrieve todos, optionally filtered by status, text and modification time.
     """
+    # Read before the page, a change made in between is replayed again, not missed
+    seq = None
+    if not q.cursor:
+        seq = await todo_changes_crud.get_last_seq(session, current_user.id)
+
+    todos, total = await todos_crud.read_objects(
+        session,
+        current_user,
+        q,
+        options=todos_crud.TODO_OUT_OPTIONS,
+        todo_filter=todo_filter,
+    )
 
-    todos, total = todos_crud.read_objects(session, current_user, q)
+    next_cursor = None
+    if len(todos) == q.limit:
+        # Only valid with the same filter and order
+        next_cursor = encode_cursor(todos[-1].modified_at, todos[-1].id)
 
     return TodosOut(
         data=todos,
@@ -47,18 +116,32 @@ def read_todos(current_user: CurrentUser, session: SessionDep, q: PageParamsDep)
         total=total,
         limit=q.limit,
         skip=q.skip,
+        next_cursor=next_cursor,
+        seq=seq,
     )
 
 
+@router.get("/summary", response_model=TodoSummaryOut)
+async def read_todos_summary(current_user: CurrentUser, session: AsyncSessionDep) -> Any:
+    """
+    Number of todos in every status.
+    """
+    # Kept by the writes, a primary key lookup however many todos there are
+    counts = await todo_counters_crud.read_counts(session, current_user.id)
+    return TodoSummaryOut(counts=counts, total=sum(counts.values()))
+
+
 @router.get(
     "/{todo_id}",
     response_model=TodoOut,
 )
-def read_todo(current_user: CurrentUser, session: SessionDep, todo_id: uuid.UUID) -> TodoOut | None:
+async def read_todo(current_user: CurrentUser, session: AsyncSessionDep, todo_id: uuid.UUID) -> TodoOut | None:
     """
     Get todo by ID.
     """
-    todo = crud.get_object(session, Todo, todo_id)
+    todo = await crud.get_object(
+        session, Todo, todo_id, options=todos_crud.TODO_OUT_OPTIONS
+    )
 
     if not todo or current_user not in todo.users:
         raise HTTPException(status_code=404, detail="Todo not found")
@@ -68,25 +151,24 @@ def read_todo(current_user: CurrentUser, session: SessionDep, todo_id: uuid.UUID
 
 @router.post("/", response_model=TodoOut)
 async def create_todo(
-    session: SessionDep,
+    session: AsyncSessionDep,
     todo_in: TodoCreate,
     current_user: CurrentUser,
 ) -> TodoOut | None:
     """
     Create new todo.
     """
-    todo = todos_crud.create_object(session, todo_in, current_user)
+    todo = await todos_crud.create_object(session, todo_in, current_user, commit=False)
 
     todo_out = TodoOut.model_validate(todo)
-    for user in todo.users:
-        await broadcast_to_user(user.id, todo_out.model_dump_json())
+    await commit_changes(session, {todo.id: None}, {todo.id: todo_out})
 
     return todo_out
 
 
 @router.put("/{todo_id}", response_model=TodoOut)
 async def update_todo(
-    session: SessionDep,
+    session: AsyncSessionDep,
     todo_id: uuid.UUID,
     todo_in: TodoUpdate,
     current_user: CurrentUser,
@@ -94,73 +176,169 @@ async def update_todo(
     """
     Update a todo.
     """
-    todo = crud.get_object(session, Todo, todo_id)
+    # Locked, concurrent writes of the todo diff against the committed one
+    todo = await crud.get_object(
+        session, Todo, todo_id, options=todos_crud.TODO_OUT_OPTIONS, for_update=True
+    )
 
     if not todo or current_user not in todo.users:
         raise HTTPException(status_code=404, detail="Todo not found")
 
-    todo = todos_crud.update_object(session, todo, todo_in)
+    before = TodoOut.model_validate(todo).model_dump(mode="json")
+    todo = await todos_crud.update_object(session, todo, todo_in, commit=False)
 
     todo_out = TodoOut.model_validate(todo)
-    for user in todo.users:
-        await broadcast_to_user(user.id, todo_out.model_dump_json())
+    await commit_changes(session, {todo.id: before}, {todo.id: todo_out})
 
     return todo_out
 
 
 @router.delete("/{todo_id}", response_model=Message)
 async def delete_todo(
-    session: SessionDep,
+    session: AsyncSessionDep,
     todo_id: uuid.UUID,
     current_user: CurrentUser,
 ) -> Message:
     """
     Delete a todo.
     """
-    todo = crud.get_object(session, Todo, todo_id)
-    todo_users = todo.users
+    # Locked, concurrent writes of the todo diff against the committed one
+    todo = await crud.get_object(
+        session, Todo, todo_id, options=todos_crud.TODO_OUT_OPTIONS, for_update=True
+    )
 
-    if not todo or current_user not in todo_users:
+    if not todo or current_user not in todo.users:
         raise HTTPException(status_code=404, detail="Todo not found")
 
-    crud.delete_object(session, todo)
+    before = TodoOut.model_validate(todo).model_dump(mode="json")
+    await crud.delete_object(session, todo, commit=False)
 
-    for user in todo_users:
-        await broadcast_to_user(user.id, json.dumps({"id": str(todo.id)}))
+    await commit_changes(session, {todo.id: before}, {todo.id: None})
 
     return Message(message="Item deleted successfully")
 
 
+@router.post("/batch", response_model=TodoBatchOut)
+async def batch_todos(
+    session: AsyncSessionDep,
+    batch_in: TodoBatchIn,
+    current_user: CurrentUser,
+) -> TodoBatchOut:
+    """
+    Create, update and delete todos in one transaction.
+
+    Every affected user gets one websocket event with a change per todo,
+    however many operations touched it.
+    """
+    max_operations = settings.service.TODO_BATCH_MAX_OPERATIONS
+    if len(batch_in.operations) > max_operations:
+        raise HTTPException(
+            status_code=400, detail=f"At most {max_operations} operations per batch"
+        )
+
+    todo_ids = {
+        operation.id for operation in batch_in.operations if operation.op != "create"
+    }
+    db_todos = await todos_crud.read_objects_by_ids(
+        session, todo_ids, options=todos_crud.TODO_OUT_OPTIONS, for_update=True
+    )
+    if len(db_todos) != len(todo_ids) or any(
+        current_user not in todo.users for todo in db_todos.values()
+    ):
+        raise HTTPException(status_code=404, detail="Todo not found")
+
+    before = {
+        todo.id: TodoOut.model_validate(todo).model_dump(mode="json")
+        for todo in db_todos.values()
+    }
+    todos = await todos_crud.apply_batch(
+        session, current_user, batch_in.operations, db_todos
+    )
+
+    after = {
+        todo.id: TodoOut.model_validate(todo) if todo.is_active else None
+        for todo in todos
+    }
+    await commit_changes(session, before, after)
+
+    return TodoBatchOut(data=[after[todo.id] for todo in todos])
+
+
 @router.websocket(
     "/ws",
 )
 async def todo_ws(
     websocket: WebSocket,
     user: CurrentUser,
+    session: AsyncSessionDep,
+    since: int | None = Query(None, ge=0),
 ):
+    """
+    Todo changes of the current user.
+
+    Without `since` every change is sent as the whole todo, or as its id
+    when it is deleted. With `since`, the seq of the todos page or the last
+    frame received, changes are sent as TodoChangeOut: the ones missed
+    since then first, followed by a TodoSyncOut, then live ones. The seqs
+    of a user have no gaps, a client resumes from the highest one it has
+    received every lower one of.
+    """
+    if connections.full:
+        # Refused before the handshake, the client retries, likely on another worker
+        raise WebSocketException(code=SLOW_CONSUMER_CLOSE_CODE)
+
     await websocket.accept()
 
-    if user.id not in active_connections:
-        active_connections[user.id] = []
-    active_connections[user.id].append(websocket)
+    # Connected before the replay is read, so no change falls in between
+    connection = connections.connect(user.id, websocket, delta=since is not None)
 
     try:
+        if since is not None:
+            await replay_changes(session, user.id, since, websocket, connection)
+        # Not needed anymore, the socket must not hold a database connection
+        await session.close()
+
         while True:
             _message = await websocket.receive_json()
+            connection.received()
     except WebSocketDisconnect:
-        # Handle disconnection
-        active_connections[user.id].remove(websocket)
-        if not active_connections[user.id]:  # No active connections left
-            active_connections.pop(user.id)
+        pass
     finally:
-        if websocket.client_state is not WebSocketState.DISCONNECTED:
+        # Closed by the server already: slow, idle or over the user's limit
+        closed = connection.closed
+        connections.disconnect(user.id, connection)
+        if not closed and websocket.client_state is not WebSocketState.DISCONNECTED:
             await websocket.close()
 
 
-@router.subscriber("todo_update")
-async def todo_update_event(todo_id: str, session: SessionDep):
-    todo = crud.get_object(session, Todo, uuid.UUID(todo_id))
-    if todo:
-        todo_out = TodoOut.model_validate(todo)
-        for user in todo.users:
-            await broadcast_to_user(user.id, todo_out.model_dump_json())
+async def replay_changes(
+    session: AsyncSessionDep,
+    user_id: uuid.UUID,
+    since: int,
+    websocket: WebSocket,
+    connection: ClientConnection,
+) -> None:
+    limit = settings.websockets.REPLAY_LIMIT
+    pruned_seq = await todo_changes_crud.get_pruned_seq(session, user_id)
+    changes = await todo_changes_crud.read_changes(session, user_id, since, limit + 1)
+
+    if len(changes) > limit or since < pruned_seq:
+        # Too many, or partly pruned already: the client reloads its todos
+        last_seq = await todo_changes_crud.get_last_seq(session, user_id)
+        sync = TodoSyncOut(op="reset", seq=last_seq)
+        replayed: set[int] = set()
+    else:
+        # Sent directly, the connection is paused and its queue is not used
+        for change in changes:
+            await websocket.send_text(encode_change(change).decode())
+        sync = TodoSyncOut(op="synced", seq=changes[-1].seq if changes else since)
+        replayed = {change.seq for change in changes}
+
+    await websocket.send_text(encode_event(sync).decode())
+    connection.resume(replayed)
+
+
+@router.subscriber(TODO_EVENTS_CHANNEL)
+async def todo_event(event: TodoEvent):
+    # Pub/sub, every worker receives the event and queues it for its own sockets
+    connections.send_to_user(event.user_id, event.frames)
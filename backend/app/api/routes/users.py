@@ -1,20 +1,28 @@
-import io
 import uuid
 from typing import Any
 
-import blurhash
-from fastapi import APIRouter, HTTPException, Request, UploadFile
-from PIL import Image as ImagePIL
+from fastapi import APIRouter, HTTPException, Request
 from starlette.responses import Response
 from starlette.websockets import WebSocket
 
 from app.api.deps import (
+    AsyncSessionDep,
+    BlobStoreDep,
     CurrentUser,
-    SessionDep,
+    RedisSessionDep,
 )
 from app.core import security
+from app.core.security import TokenDataDep
+from app.core.image_processing import (
+    ImageProcessingError,
+    ImageProcessingUnavailableError,
+    process_image_in_pool,
+)
+from app.core.timing import TimedRoute
+from app.core.uploads import ingest_image_upload
 from app.crud.images import create_image, delete_image
 from app.crud import common
+from app.crud import users as users_crud
 from app.models import Image
 from app.schemas.user import (
     UserOut,
@@ -22,18 +30,19 @@ from app.schemas.user import (
 )
 from app.schemas.utils import Message
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 @router.get("/me", response_model=UserOut)
-def read_user_me(
+async def read_user_me(
     current_user: CurrentUser,
+    token_data: TokenDataDep,
     response: Response,
     request: Request,
 ) -> UserOut | None:
     """
     Get current user and refresh token
     """
-    security.set_cookie_session(request, response, current_user)
+    security.refresh_cookie_session(request, response, current_user, token_data)
 
     client_out = UserOut.model_validate(
         current_user,
@@ -47,19 +56,22 @@ def read_user_me(
 
 
 @router.patch("/me", response_model=UserOut)
-def update_user_me(
+async def update_user_me(
     response: Response,
     request: Request,
-    session: SessionDep,
+    session: AsyncSessionDep,
+    redis: RedisSessionDep,
     user_in: UserUpdateMe,
     current_user: CurrentUser,
+    token_data: TokenDataDep,
 ) -> Any:
     """
     Update own user and refresh token
     """
 
-    updated_user = common.update_object(session, current_user, user_in)
-    security.set_cookie_session(request, response, updated_user)
+    updated_user = await common.update_object(session, current_user, user_in)
+    await users_crud.invalidate_cached_user(current_user.id, redis)
+    security.refresh_cookie_session(request, response, updated_user, token_data)
 
     return UserOut.model_validate(
         updated_user,
@@ -72,42 +84,92 @@ def update_user_me(
 
 
 @router.delete("/me")
-def delete_user_me(
-    response: Response, session: SessionDep, current_user: CurrentUser
+async def delete_user_me(
+    response: Response,
+    request: Request,
+    session: AsyncSessionDep,
+    redis: RedisSessionDep,
+    current_user: CurrentUser,
 ) -> Message:
     """
     Delete a user and refresh token
     """
-    common.delete_object(session, current_user)
-    security.delete_cookie_session(response)
+    await common.delete_object(session, current_user)
+    await users_crud.invalidate_cached_user(current_user.id, redis)
+    security.delete_cookie_session(request, response)
     return Message(message="User deleted successfully")
 
 
-@router.post("/me/image", response_model=UserOut)
-async def set_profile_image(
-    session: SessionDep, current_user: CurrentUser, file: UploadFile
-) -> Any:
-    allowed_content_type = ["image/jpeg", "image/png"]
-    if file.content_type not in allowed_content_type:
-        raise HTTPException(status_code=400, detail="Allowed formats are: jpeg, png")
-
-    data = await file.read()
+# The body is read from the request stream by ingest_image_upload,
+# so the multipart form is described here instead of by an UploadFile parameter
+PROFILE_IMAGE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
 
-    image_file = ImagePIL.open(io.BytesIO(data))
-    blur_hash = blurhash.encode(image_file, x_components=4, y_components=3)
 
-    image = Image(binary=data, blur_hash=blur_hash)
-    db_image = create_image(session=session, image=image)
+@router.post("/me/image", response_model=UserOut, openapi_extra=PROFILE_IMAGE_BODY)
+async def set_profile_image(
+    session: AsyncSessionDep,
+    redis: RedisSessionDep,
+    current_user: CurrentUser,
+    request: Request,
+    store: BlobStoreDep,
+) -> Any:
+    upload = await ingest_image_upload(request, store.staging_path())
+    try:
+        try:
+            processed = await process_image_in_pool(upload.path)
+        except ImageProcessingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ImageProcessingUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+        thumbnails = {}
+        for thumbnail in processed.thumbnails:
+            thumbnails[str(thumbnail.size)] = {
+                "blob_key": await store.put(thumbnail.data),
+                "size": len(thumbnail.data),
+            }
+
+        # Hashed while streaming, the staged file is moved into the store
+        blob_key = await store.put_file(upload.path, upload.sha256)
+    finally:
+        await upload.discard()
+
+    image = Image(
+        blob_key=blob_key,
+        size=upload.size,
+        blur_hash=processed.blur_hash,
+        attributes={
+            "media_type": upload.media_type,
+            "width": processed.width,
+            "height": processed.height,
+            "thumbnails": thumbnails,
+        },
+    )
+    db_image = await create_image(session=session, image=image)
 
     if not db_image:
         raise HTTPException(status_code=400, detail="Can not add image")
 
     old_image = current_user.profile_image
     if old_image:
-        delete_image(session, old_image)
+        await delete_image(session, old_image)
 
     current_user.profile_image = db_image
-    updated_user = common.update_object(session, current_user)
+    updated_user = await common.update_object(session, current_user)
+    await users_crud.invalidate_cached_user(current_user.id, redis)
 
     return UserOut.model_validate(
         updated_user,
@@ -0,0 +1,77 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class LRUCache:
+    """
+    Small in-process LRU cache with a time to live for every entry.
+
+    Not shared between workers and not invalidated by them, so it only
+    holds data for which staleness of ttl_seconds is acceptable.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Any) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any, ttl_seconds: float | None = None) -> None:
+        """Stores a value, for ttl_seconds when given and shorter than the cache's."""
+        if self.max_size <= 0:
+            return
+        if ttl_seconds is None or ttl_seconds > self.ttl_seconds:
+            ttl_seconds = self.ttl_seconds
+        self._data[key] = (time.monotonic() + ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class BloomFilter:
+    """
+    Set of digests that can answer "maybe" for a digest never added.
+
+    A digest not in it was never added, which is decided from a few bits
+    without asking the store holding the set itself. Keys are digests
+    already, the bit positions are read from their bytes instead of hashing
+    them again, so they need 4 bytes per hash.
+    """
+
+    def __init__(self, size_bits: int, hashes: int = 7) -> None:
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self._bits = bytearray((size_bits + 7) // 8)
+
+    def _positions(self, digest: bytes) -> list[int]:
+        return [
+            int.from_bytes(digest[i * 4:i * 4 + 4], "little") % self.size_bits
+            for i in range(self.hashes)
+        ]
+
+    def add(self, digest: bytes) -> None:
+        for position in self._positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest)
+        )
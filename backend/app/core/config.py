@@ -1,11 +1,13 @@
 import os
 import secrets
+from typing import Literal
 
 from pydantic import (
     BaseModel,
     PostgresDsn,
     RedisDsn,
     computed_field,
+    model_validator,
 )
 from pydantic_core import MultiHostUrl
 from pydantic_settings import (
@@ -36,6 +38,37 @@ class DatabaseSettings(BaseModel):
     DB: str = ""
 
 
+class PostgresSettings(DatabaseSettings):
+    # Per worker process. Postgres max_connections has to cover
+    # workers * (size + overflow)
+    POOL_SIZE: int = 5
+    MAX_OVERFLOW: int = 10
+    # Waiting longer for a free connection fails the request
+    POOL_TIMEOUT_SECONDS: float = 30
+    # Connections older than this are reopened on checkout, None keeps them
+    POOL_RECYCLE_SECONDS: int | None = None
+    # Tests a connection on checkout, costs a round trip but survives restarts
+    POOL_PRE_PING: bool = False
+    # Statements running longer are cancelled by Postgres, None for no limit
+    STATEMENT_TIMEOUT_SECONDS: float | None = None
+    # psycopg prepares a statement once it ran this many times on a
+    # connection, None never prepares
+    PREPARE_THRESHOLD: int | None = 5
+    # Connecting through PgBouncer in transaction pooling mode. Server
+    # connections change between transactions, so nothing is prepared and no
+    # session settings are sent
+    PGBOUNCER: bool = False
+
+    @model_validator(mode="after")
+    def check_pgbouncer(self) -> "PostgresSettings":
+        if self.PGBOUNCER and self.STATEMENT_TIMEOUT_SECONDS is not None:
+            raise ValueError(
+                "STATEMENT_TIMEOUT_SECONDS is a session setting, behind PgBouncer "
+                "set it on the role instead: ALTER ROLE ... SET statement_timeout"
+            )
+        return self
+
+
 class SecuritySettings(BaseModel):
     SECRET_KEY: str = secrets.token_urlsafe(32)  # openssl rand -hex 32
     # 60 minutes * 24 hours * 30 days = 30 days
@@ -43,14 +76,119 @@ class SecuritySettings(BaseModel):
     VERIFICATION_CODE_EXPIRE_MINUTES: int = 5
     ALGORITHM: str = "HS256"
     JWT_COOKIE_NAME: str = "session_id"
+    # Hash of the login codes kept in redis until they expire. "hmac" is
+    # HMAC-SHA256 keyed by SECRET_KEY, "bcrypt" is slow on purpose and runs
+    # in a thread pool
+    OTP_HASHER: Literal["hmac", "bcrypt"] = "hmac"
+    # "jose" verifies session tokens with python-jose. "builtin" verifies
+    # HS256 ones with the standard library, several times faster
+    JWT_BACKEND: Literal["jose", "builtin"] = "jose"
+    # Verified session tokens kept by every worker until they expire
+    TOKEN_CACHE_MAX_SIZE: int = 10_000
+    # Revoked tokens live in redis. Every worker checks a bloom filter of
+    # them first and rebuilds it from redis this often, a revocation reaches
+    # the other workers at once through pub/sub
+    REVOCATION_FILTER_BITS: int = 2 ** 20
+    REVOCATION_SYNC_SECONDS: float = 60
+    # Fraction of its lifetime after which GET and PATCH /users/me re-issue
+    # the session token, 0 re-issues it on every call
+    TOKEN_REFRESH_AFTER: float = 0.5
+
+    @model_validator(mode="after")
+    def check_jwt_backend(self) -> "SecuritySettings":
+        if self.JWT_BACKEND == "builtin" and self.ALGORITHM != "HS256":
+            raise ValueError('JWT_BACKEND "builtin" only verifies HS256 tokens')
+        return self
+
+    @model_validator(mode="after")
+    def check_token_refresh(self) -> "SecuritySettings":
+        if not 0 <= self.TOKEN_REFRESH_AFTER <= 1:
+            raise ValueError("TOKEN_REFRESH_AFTER is a fraction between 0 and 1")
+        return self
 
 
 class ServiceSettings(BaseModel):
     API_PREFIX: str = "/api/v1"
+    # Encoder of REST responses, "orjson" needs the orjson package installed
+    JSON_RESPONSE: Literal["json", "orjson"] = "json"
+    # Operations accepted by one POST /todos/batch
+    TODO_BATCH_MAX_OPERATIONS: int = 500
+
+
+class GreetingTodo(BaseModel):
+    title: str
+    description: str | None = None
+    # A TodoStatus value
+    status: Literal["new", "in_progress", "done"] = "new"
 
 
 class ContentSettings(BaseModel):
     SPAWN_GREETING_TODOS: bool = True
+    # Todos of every new user, created with the user in one transaction
+    GREETING_TODOS: list[GreetingTodo] = [
+        GreetingTodo(title="Register in Todos", status="done"),
+        GreetingTodo(title="Login in Todos", status="done"),
+        GreetingTodo(title="Learn how to use Todos", status="in_progress"),
+        GreetingTodo(title="Make a new Todo", status="new"),
+    ]
+
+
+class ImageSettings(BaseModel):
+    # Decoding and resizing uploads runs in a process pool of this size
+    PROCESS_WORKERS: int = 2
+    # Uploads are streamed to disk and rejected once they grow past this
+    MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    # Uploads with more pixels are rejected before being decoded
+    MAX_PIXELS: int = 40_000_000
+    THUMBNAIL_SIZES: list[int] = [64, 128, 512]
+    # Blur hash is computed on a copy downscaled to this size
+    BLUR_HASH_SIZE: int = 32
+
+
+class CacheSettings(BaseModel):
+    # Active user records behind CurrentUser, kept in redis
+    USER_TTL_SECONDS: int = 300
+    # Per process copy in front of redis. Other workers do not invalidate it,
+    # so a user change is seen by them after at most this many seconds
+    USER_LOCAL_TTL_SECONDS: float = 5
+    USER_LOCAL_MAX_SIZE: int = 10_000
+
+
+class WebsocketSettings(BaseModel):
+    # Outbound messages buffered for every connection while its client reads
+    SEND_QUEUE_SIZE: int = 100
+    # When the buffer is full: "drop_oldest" message or "disconnect" the client,
+    # which reconnects and reloads its todos
+    SLOW_CONSUMER_POLICY: Literal["drop_oldest", "disconnect"] = "disconnect"
+    # A single send blocked for longer closes the connection
+    SEND_TIMEOUT_SECONDS: float = 10
+    # Changes replayed to a client resuming with `since`, with more it is
+    # told to reload its todos instead
+    REPLAY_LIMIT: int = 500
+    # Older changes are removed by scripts/prune_todo_changes.py
+    CHANGE_LOG_RETENTION_DAYS: int = 7
+    # Protocol level pings sent by uvicorn, a client that does not answer one
+    # within the timeout is disconnected. Catches half-open TCP connections
+    PING_INTERVAL_SECONDS: float = 20
+    PING_TIMEOUT_SECONDS: float = 20
+    # Connections without a message from their client for longer are closed,
+    # None keeps them for as long as they answer the pings
+    IDLE_TIMEOUT_SECONDS: float | None = None
+    # With more, the oldest connection of the user is closed
+    MAX_CONNECTIONS_PER_USER: int = 10
+    # With more, new connections to this worker are refused
+    MAX_CONNECTIONS_PER_WORKER: int = 10_000
+
+
+class StorageSettings(BaseModel):
+    # "local" keeps blobs under LOCAL_PATH, "s3" in any S3-compatible bucket
+    BACKEND: Literal["local", "s3"] = "local"
+    LOCAL_PATH: str = "media"
+    S3_ENDPOINT_URL: str | None = None  # e.g. http://minio:9000
+    S3_BUCKET: str = ""
+    S3_REGION: str | None = None
+    S3_ACCESS_KEY: str | None = None
+    S3_SECRET_KEY: str | None = None
 
 
 class Settings(BaseSettings):
@@ -61,10 +199,14 @@ class Settings(BaseSettings):
     )
 
     service: ServiceSettings
-    database: DatabaseSettings
+    database: PostgresSettings
     redis: DatabaseSettings
     security: SecuritySettings
     content: ContentSettings = ContentSettings()
+    storage: StorageSettings = StorageSettings()
+    images: ImageSettings = ImageSettings()
+    cache: CacheSettings = CacheSettings()
+    websockets: WebsocketSettings = WebsocketSettings()
 
     DEBUG: bool = False
 
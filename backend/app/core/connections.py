@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any
+
+from faststream.redis import RedisBroker
+from pydantic import BaseModel
+from pydantic_core import to_json
+from starlette.websockets import WebSocket
+
+from app.core.config import WebsocketSettings, settings
+from app.core.metrics import WEBSOCKET_GAUGES
+from app.models import TodoChange, TodoChangeOp
+from app.schemas.todo import TodoChangeOut
+
+logger = logging.getLogger(__name__)
+
+# Redis pub/sub channel every worker subscribes to, see routes/todos/main.py
+TODO_EVENTS_CHANNEL = "todo_events"
+
+# "Try Again Later", sent to clients closed for falling behind and to the
+# ones refused by a full worker
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# "Policy Violation", the oldest connection of a user over the limit
+CONNECTION_LIMIT_CLOSE_CODE = 1008
+# "Going Away", connections idle for longer than IDLE_TIMEOUT_SECONDS
+IDLE_CLOSE_CODE = 1001
+
+# A change as published: seq, the legacy text and the TodoChangeOut text
+Frame = tuple[int, str, str]
+
+
+class TodoEvent(BaseModel):
+    """Message on TODO_EVENTS_CHANNEL, the changes of one user."""
+    user_id: uuid.UUID
+    frames: list[Frame]
+
+
+class ClientConnection:
+    """
+    A websocket with its own bounded outbound queue and writer task.
+
+    Delivering a message only queues it, so a slow or stalled client never
+    holds up the sender or the other clients. When the queue is full the
+    SLOW_CONSUMER_POLICY decides between dropping the oldest message and
+    closing the connection.
+
+    A delta connection receives TodoChangeOut frames instead of whole todos.
+    It starts paused while its route replays the missed changes, live
+    changes are held back until resume.
+    """
+
+    def __init__(
+        self, websocket: WebSocket, config: WebsocketSettings, delta: bool = False
+    ) -> None:
+        self.websocket = websocket
+        self.config = config
+        self.delta = delta
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=config.SEND_QUEUE_SIZE)
+        self.closed = False
+        self.dropped = 0
+        self.paused = delta
+        self._paused_changes: list[tuple[int, str]] = []
+        self.last_received_at = time.monotonic()
+        self._writer = asyncio.create_task(self._write())
+        self._closing: asyncio.Task | None = None
+
+    def enqueue(self, data: str) -> bool:
+        """Queues a message, returns False once the connection is closed."""
+        if self.closed:
+            return False
+        if self.queue.full():
+            if self.config.SLOW_CONSUMER_POLICY == "disconnect":
+                logger.info("Closing websocket of a slow consumer")
+                self.close(SLOW_CONSUMER_CLOSE_CODE)
+                return False
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+        return True
+
+    def deliver(self, seq: int, data: str, delta: str) -> bool:
+        """Queues the frame of a change this connection speaks."""
+        if not self.delta:
+            return self.enqueue(data)
+        if self.paused:
+            if len(self._paused_changes) >= self.config.SEND_QUEUE_SIZE:
+                self.close(SLOW_CONSUMER_CLOSE_CODE)
+                return False
+            self._paused_changes.append((seq, delta))
+            return True
+        return self.enqueue(delta)
+
+    def resume(self, replayed: set[int]) -> bool:
+        """Queues the changes held back during the replay it did not include."""
+        self.paused = False
+        held, self._paused_changes = self._paused_changes, []
+        # Published after commit, a held change may also have been replayed
+        return all(self.enqueue(delta) for seq, delta in held if seq not in replayed)
+
+    def close(self, code: int = 1000) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._closing = asyncio.create_task(self._close(code))
+
+    def received(self) -> None:
+        """Called for every message from the client."""
+        self.last_received_at = time.monotonic()
+
+    def stop(self) -> None:
+        """Stops the writer, the socket itself is closed by its route."""
+        self.closed = True
+        self._writer.cancel()
+
+    async def _write(self) -> None:
+        while True:
+            data = await self.queue.get()
+            try:
+                await asyncio.wait_for(
+                    self.websocket.send_text(data), self.config.SEND_TIMEOUT_SECONDS
+                )
+            except Exception:
+                # Timed out or the client is gone
+                self.close(SLOW_CONSUMER_CLOSE_CODE)
+                return
+
+    async def _close(self, code: int) -> None:
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        try:
+            await self.websocket.close(code)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """
+    Websockets held by this worker, grouped by user.
+
+    Writes do not send to sockets directly: they record a TodoChange per
+    affected user and publish them with publish_changes. Every worker
+    delivers them to the sockets of that user it holds, the encoded text is
+    sent as is.
+    """
+
+    def __init__(self, config: WebsocketSettings = settings.websockets) -> None:
+        self.config = config
+        self.active: dict[uuid.UUID, list[ClientConnection]] = {}
+        self.count = 0
+        self._sweeper: asyncio.Task | None = None
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.config.MAX_CONNECTIONS_PER_WORKER
+
+    def connect(
+        self, user_id: uuid.UUID, websocket: WebSocket, delta: bool = False
+    ) -> ClientConnection:
+        # Started lazily, in the event loop of the worker
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+        user_connections = self.active.setdefault(user_id, [])
+        while len(user_connections) >= self.config.MAX_CONNECTIONS_PER_USER:
+            # Most likely a tab left open, the new one is the one in use
+            oldest = user_connections[0]
+            oldest.close(CONNECTION_LIMIT_CLOSE_CODE)
+            self.disconnect(user_id, oldest)
+
+        connection = ClientConnection(websocket, self.config, delta)
+        user_connections.append(connection)
+        self.active[user_id] = user_connections
+        self.count += 1
+        WEBSOCKET_GAUGES["connections"].set(self.count)
+        return connection
+
+    def disconnect(self, user_id: uuid.UUID, connection: ClientConnection) -> None:
+        connection.stop()
+        user_connections = self.active.get(user_id, [])
+        if connection in user_connections:
+            user_connections.remove(connection)
+            self.count -= 1
+            WEBSOCKET_GAUGES["connections"].set(self.count)
+        if not user_connections:
+            self.active.pop(user_id, None)
+
+    def send_to_user(self, user_id: uuid.UUID, frames: list[Frame]) -> None:
+        # Copied, a closed connection is dropped while iterating
+        for connection in list(self.active.get(user_id, [])):
+            if not all(connection.deliver(*frame) for frame in frames):
+                self.disconnect(user_id, connection)
+
+    def gauges(self) -> dict[str, int]:
+        """Current state of this worker's connections."""
+        connections = [c for user_connections in self.active.values() for c in user_connections]
+        return {
+            "connections": self.count,
+            "users": len(self.active),
+            "queued_messages": sum(c.queue.qsize() for c in connections),
+            "paused_connections": sum(c.paused for c in connections),
+        }
+
+    async def _sweep(self) -> None:
+        """
+        Drops connections whose writer is gone and closes idle ones.
+
+        Dead peers are detected by the protocol pings, which end the receive
+        loop of their route. This is the safety net for connections that
+        failed without it, so the registry never grows unbounded.
+        """
+        while True:
+            await asyncio.sleep(self.config.PING_INTERVAL_SECONDS)
+            idle_before = None
+            if self.config.IDLE_TIMEOUT_SECONDS:
+                idle_before = time.monotonic() - self.config.IDLE_TIMEOUT_SECONDS
+            for user_id, user_connections in list(self.active.items()):
+                for connection in list(user_connections):
+                    if idle_before and connection.last_received_at < idle_before:
+                        connection.close(IDLE_CLOSE_CODE)
+                    if connection.closed:
+                        self.disconnect(user_id, connection)
+            gauges = self.gauges()
+            for name, value in gauges.items():
+                WEBSOCKET_GAUGES[name].set(value)
+            logger.debug("Websocket connections: %s", gauges)
+
+
+connections = ConnectionManager()
+
+
+def encode_event(event: Any) -> bytes:
+    """JSON of a schema or of plain data, encoded once per change."""
+    return to_json(event)
+
+
+def encode_change(change: TodoChange) -> bytes:
+    return encode_event(
+        TodoChangeOut(seq=change.seq, op=change.op, id=change.todo_id, data=change.data)
+    )
+
+
+async def publish_changes(
+    broker: RedisBroker, changes: list[TodoChange], todos: dict[uuid.UUID, bytes | None]
+) -> None:
+    """
+    Publishes committed changes, one event per affected user.
+
+    todos maps every changed todo id to its encoded TodoOut, sent whole to
+    clients without `since`. The ones a change deletes the todo for get
+    only its id. An event carries all the changes of its user, in order.
+    """
+    # Carried as text and sent to the sockets as is, never parsed on the way
+    texts = {
+        todo_id: data.decode() if data is not None else None
+        for todo_id, data in todos.items()
+    }
+    frames: dict[uuid.UUID, list[Frame]] = {}
+    for change in changes:
+        if change.op == TodoChangeOp.DELETE:
+            text = encode_event({"id": change.todo_id}).decode()
+        else:
+            text = texts[change.todo_id]
+        frames.setdefault(change.user_id, []).append(
+            (change.seq, text, encode_change(change).decode())
+        )
+    await asyncio.gather(
+        *(
+            broker.publish(
+                TodoEvent(user_id=user_id, frames=user_frames),
+                channel=TODO_EVENTS_CHANNEL,
+            )
+            for user_id, user_frames in frames.items()
+        )
+    )
@@ -1,8 +1,35 @@
-from redis import asyncio as aioredis
-from sqlmodel import create_engine
+from typing import Any
 
-from app.core.config import settings
+from sqlalchemy.ext.asyncio import create_async_engine
 
-engine = create_engine(str(settings.MAIN_DATABASE_URI))
+from app.core.config import PostgresSettings, settings
+from app.core.metrics import instrument_pool
+from app.core.timing import TimedRedis, instrument_engine
 
-redis_db = aioredis.from_url(settings.REDIS_DATABASE_URI, decode_responses=True)
+
+def engine_options(database: PostgresSettings) -> dict[str, Any]:
+    """Pool and psycopg connection arguments from the database settings."""
+    connect_args: dict[str, Any] = {
+        "prepare_threshold": None if database.PGBOUNCER else database.PREPARE_THRESHOLD
+    }
+    if database.STATEMENT_TIMEOUT_SECONDS is not None:
+        timeout_ms = int(database.STATEMENT_TIMEOUT_SECONDS * 1000)
+        connect_args["options"] = f"-c statement_timeout={timeout_ms}"
+    return {
+        "pool_size": database.POOL_SIZE,
+        "max_overflow": database.MAX_OVERFLOW,
+        "pool_timeout": database.POOL_TIMEOUT_SECONDS,
+        "pool_recycle": database.POOL_RECYCLE_SECONDS or -1,
+        "pool_pre_ping": database.POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
+# psycopg 3 serves async connections from the "postgresql+psycopg" url too
+async_engine = create_async_engine(
+    str(settings.MAIN_DATABASE_URI), **engine_options(settings.database)
+)
+instrument_engine(async_engine.sync_engine)
+instrument_pool(async_engine.sync_engine)
+
+redis_db = TimedRedis.from_url(settings.REDIS_DATABASE_URI, decode_responses=True)
@@ -0,0 +1,133 @@
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import partial
+
+import blurhash
+from PIL import Image as ImagePIL
+from PIL import ImageOps
+
+from app.core.config import settings
+
+THUMBNAIL_MEDIA_TYPE = "image/webp"
+
+
+class ImageProcessingError(ValueError):
+    pass
+
+
+class ImageProcessingUnavailableError(RuntimeError):
+    pass
+
+
+@dataclass
+class Thumbnail:
+    size: int
+    data: bytes
+
+
+@dataclass
+class ProcessedImage:
+    blur_hash: str
+    width: int
+    height: int
+    thumbnails: list[Thumbnail] = field(default_factory=list)
+
+
+def process_image(
+    path: str, thumbnail_sizes: list[int], blur_hash_size: int, max_pixels: int
+) -> ProcessedImage:
+    """
+    Validates an upload, renders its WebP thumbnails and its blur hash.
+
+    CPU bound, runs in the process pool. Thumbnails are resized one from
+    another, largest first, and the blur hash is taken from the smallest one.
+    """
+    try:
+        with ImagePIL.open(path) as image:
+            width, height = image.size
+            # Only the header is parsed so far, nothing is decoded yet
+            if width * height > max_pixels:
+                raise ImageProcessingError("Image is too large")
+
+            # JPEG decodes straight to a reduced scale, no-op for other formats
+            largest = max(thumbnail_sizes, default=blur_hash_size)
+            image.draft("RGB", (largest, largest))
+            working = ImageOps.exif_transpose(image).convert("RGB")
+    except ImageProcessingError:
+        raise
+    except ImagePIL.DecompressionBombError:
+        raise ImageProcessingError("Image is too large")
+    except (OSError, SyntaxError, ValueError):
+        # Unidentified or truncated image data, corrupt chunks or EXIF
+        raise ImageProcessingError("Can not read image")
+
+    thumbnails = []
+    for size in sorted(thumbnail_sizes, reverse=True):
+        working.thumbnail((size, size))
+        buffer = io.BytesIO()
+        working.save(buffer, format="WEBP", quality=80)
+        thumbnails.append(Thumbnail(size=size, data=buffer.getvalue()))
+
+    working.thumbnail((blur_hash_size, blur_hash_size))
+    blur_hash = blurhash.encode(working, x_components=4, y_components=3)
+
+    return ProcessedImage(
+        blur_hash=blur_hash, width=width, height=height, thumbnails=thumbnails
+    )
+
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    # Created lazily, so every gunicorn worker gets its own pool after fork.
+    # Spawned children do not inherit the worker's sockets and event loop.
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.images.PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def discard_executor(executor: ProcessPoolExecutor) -> None:
+    global _executor
+    # Concurrent calls may have seen the same pool break, only it is dropped
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def process_image_in_pool(path: str) -> ProcessedImage:
+    # Only the path crosses the process boundary, the worker reads the file
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(
+            executor,
+            partial(
+                process_image,
+                path,
+                settings.images.THUMBNAIL_SIZES,
+                settings.images.BLUR_HASH_SIZE,
+                settings.images.MAX_PIXELS,
+            ),
+        )
+    except BrokenProcessPool:
+        # A child died, e.g. killed for memory, and the pool takes no more
+        # work. Not retried, the image may be what killed it
+        discard_executor(executor)
+        raise ImageProcessingUnavailableError("Image processing is unavailable")
+
+
+def pick_thumbnail_size(size: int | None) -> int | None:
+    """Smallest thumbnail covering the requested size, None for the original."""
+    if not size:
+        return None
+    fitting = [s for s in settings.images.THUMBNAIL_SIZES if s >= size]
+    return min(fitting) if fitting else None
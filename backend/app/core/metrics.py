@@ -0,0 +1,107 @@
+import os
+
+from faststream.redis.prometheus import RedisPrometheusMiddleware
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import Engine, event
+
+# Under gunicorn every worker writes its values to files in this directory,
+# see gunicorn_conf.py. Gauges are summed over the live workers.
+MULTIPROCESS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+STATEMENT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50, 100)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+# Per request, labeled with the route id from custom_generate_unique_id
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to serve a request", ["route"]
+)
+DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per request", ["route"]
+)
+DB_STATEMENTS = Histogram(
+    "http_request_db_statements", "SQL statements per request", ["route"],
+    buckets=STATEMENT_BUCKETS,
+)
+REDIS_SECONDS = Histogram(
+    "http_request_redis_seconds", "Time spent in redis commands per request", ["route"]
+)
+SERIALIZE_SECONDS = Histogram(
+    "http_request_serialize_seconds",
+    "Time from the endpoint returning to the response being rendered",
+    ["route"],
+)
+
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_duration_seconds", "Latency of redis commands", ["command"],
+    buckets=REDIS_BUCKETS,
+)
+
+DB_POOL_SIZE = Gauge(
+    "db_pool_size", "Connections kept open by the pool", multiprocess_mode="livesum"
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections in use", multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections open beyond the pool size", multiprocess_mode="livesum"
+)
+
+# One per key of ConnectionManager.gauges()
+WEBSOCKET_GAUGES = {
+    "connections": Gauge(
+        "websocket_active_connections", "Open websockets", multiprocess_mode="livesum"
+    ),
+    "users": Gauge(
+        "websocket_users", "Users with an open websocket, per worker",
+        multiprocess_mode="livesum",
+    ),
+    "queued_messages": Gauge(
+        "websocket_queued_messages", "Messages waiting in send queues",
+        multiprocess_mode="livesum",
+    ),
+    "paused_connections": Gauge(
+        "websocket_paused_connections", "Websockets replaying missed changes",
+        multiprocess_mode="livesum",
+    ),
+}
+
+# Published and consumed messages of the redis brokers, passed to their routers
+BROKER_METRICS = RedisPrometheusMiddleware(registry=REGISTRY)
+
+
+def instrument_pool(engine: Engine) -> None:
+    """Keeps the pool gauges current, updated on every checkout and checkin."""
+    pool = engine.pool
+
+    def update(checked_out: int) -> None:
+        DB_POOL_SIZE.set(pool.size())
+        DB_POOL_CHECKED_OUT.set(checked_out)
+        # Negative while the pool is not full yet
+        DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    @event.listens_for(engine, "checkout")
+    def checkout(*args) -> None:
+        update(pool.checkedout())
+
+    @event.listens_for(engine, "checkin")
+    def checkin(*args) -> None:
+        # Called before the connection is back in the pool
+        update(pool.checkedout() - 1)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Metrics of every worker in the text exposition format, and its media type."""
+    if os.environ.get(MULTIPROCESS_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,53 +1,220 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import time
 import uuid
-from collections.abc import Mapping
-from datetime import datetime, timedelta
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from typing import Annotated, Any
 
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.params import Cookie
+from faststream.redis import RedisBroker
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from redis.exceptions import RedisError
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import Response
 
-from app.core.config import settings
+from app.core.cache import BloomFilter, LRUCache
+from app.core.config import SecuritySettings, settings
+from app.core.db import redis_db
 from app.models import User
 from app.schemas.utils import TokenPayload
 
+logger = logging.getLogger(__name__)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Sorted set of revoked token digests, scored by their expiry
+REVOKED_TOKENS_KEY = "auth:revoked_tokens"
+TOKEN_REVOCATIONS_CHANNEL = "token_revocations"
+
+# Marks codes hashed with hmac_code_hash, bcrypt hashes start with "$2"
+HMAC_CODE_PREFIX = "hmac-sha256$"
+
 error_403 = HTTPException(
     status_code=status.HTTP_403_FORBIDDEN,
     detail="Could not validate credentials",
 )
 
 
-def decode_access_token(
+def base64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def decode_hs256(token: str) -> dict[str, Any]:
+    """
+    Claims of an HS256 token, verified with the standard library.
+
+    Checks what jwt.decode checks for the tokens create_access_token
+    issues: the signature, the algorithm and the expiry.
+    """
+    try:
+        signing_input, _, signature = token.rpartition(".")
+        header, _, payload = signing_input.partition(".")
+        expected = hmac.new(
+            settings.security.SECRET_KEY.encode(), signing_input.encode("ascii"), hashlib.sha256
+        ).digest()
+        if not hmac.compare_digest(base64url_decode(signature), expected):
+            raise JWTError("Signature verification failed")
+        if json.loads(base64url_decode(header)).get("alg") != "HS256":
+            raise JWTError("The specified alg value is not allowed")
+        claims = json.loads(base64url_decode(payload))
+    except (ValueError, AttributeError, binascii.Error):
+        # Malformed parts, non-ascii text or JSON that is not an object
+        raise JWTError("Invalid token")
+    if not isinstance(claims, dict) or not isinstance(claims.get("exp"), int | float):
+        raise JWTError("Invalid claims")
+    if claims["exp"] <= time.time():
+        raise JWTError("Signature has expired")
+    return claims
+
+
+@dataclass(frozen=True)
+class VerifiedToken:
+    payload: TokenPayload
+    expires_at: float
+    # Digest of the signed part. The signature has several base64 spellings
+    # that verify, so a revocation does not go by the whole token
+    revocation_key: bytes
+
+
+def verify_access_token(token: str) -> VerifiedToken:
+    if settings.security.JWT_BACKEND == "builtin":
+        claims = decode_hs256(token)
+    else:
+        claims = jwt.decode(
+            token,
+            settings.security.SECRET_KEY,
+            algorithms=[settings.security.ALGORITHM],
+        )
+    try:
+        expires_at = float(claims["exp"])
+        payload = TokenPayload(id=uuid.UUID(claims["id"]), exp=expires_at)
+    except (KeyError, TypeError, ValueError):
+        raise JWTError("Invalid claims")
+    signed_part = token.rpartition(".")[0]
+    return VerifiedToken(payload, expires_at, token_digest(signed_part))
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenRevocations:
+    """
+    Revoked session tokens, by VerifiedToken.revocation_key.
+
+    The set lives in redis, scored by the expiry of each token, so expired
+    ones can be dropped. Every worker keeps a bloom filter of it: a token
+    not in the filter is not revoked, which is all most requests need to
+    know. Only tokens in it, revoked ones and rare false positives, are
+    looked up in redis. Revocations reach the filters of the other workers
+    by pub/sub, and every REVOCATION_SYNC_SECONDS the filter is rebuilt
+    from redis, for any message missed meanwhile.
+    """
+
+    def __init__(self, config: SecuritySettings = settings.security) -> None:
+        self.config = config
+        self.filter = BloomFilter(config.REVOCATION_FILTER_BITS)
+        self.synced = False
+        self._rebuilding: BloomFilter | None = None
+        self._sync_lock = asyncio.Lock()
+        self._syncer: asyncio.Task | None = None
+
+    def add(self, digest: bytes) -> None:
+        self.filter.add(digest)
+        # Added to the filter being rebuilt too, it may have read redis already
+        if self._rebuilding is not None:
+            self._rebuilding.add(digest)
+
+    async def revoke(self, broker: RedisBroker, digest: bytes, expires_at: float) -> None:
+        await redis_db.zadd(REVOKED_TOKENS_KEY, {digest.hex(): expires_at})
+        self.add(digest)
+        # Every worker, this one included, adds it to its filter
+        await broker.publish(digest.hex(), channel=TOKEN_REVOCATIONS_CHANNEL)
+
+    async def is_revoked(self, digest: bytes) -> bool:
+        if not self.synced:
+            await self.sync()
+        # Started lazily, in the event loop of the worker
+        if self._syncer is None or self._syncer.done():
+            self._syncer = asyncio.create_task(self._sync_periodically())
+        if digest not in self.filter:
+            return False
+        return await redis_db.zscore(REVOKED_TOKENS_KEY, digest.hex()) is not None
+
+    async def sync(self) -> None:
+        """Rebuilds the filter from redis, dropping expired tokens first."""
+        async with self._sync_lock:
+            self._rebuilding = BloomFilter(self.config.REVOCATION_FILTER_BITS)
+            try:
+                await redis_db.zremrangebyscore(REVOKED_TOKENS_KEY, "-inf", time.time())
+                for digest in await redis_db.zrange(REVOKED_TOKENS_KEY, 0, -1):
+                    self._rebuilding.add(bytes.fromhex(digest))
+                self.filter = self._rebuilding
+                self.synced = True
+            finally:
+                self._rebuilding = None
+
+    async def _sync_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.REVOCATION_SYNC_SECONDS)
+            try:
+                await self.sync()
+            except RedisError:
+                logger.exception("Could not sync the token revocations")
+
+
+revocations = TokenRevocations()
+
+# Verified tokens by the digest of the whole token, as it was verified
+token_cache = LRUCache(
+    max_size=settings.security.TOKEN_CACHE_MAX_SIZE,
+    ttl_seconds=settings.security.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+
+async def decode_access_token(
         session_id: str = Cookie(
             alias=settings.security.JWT_COOKIE_NAME,
             title="Session Id",
             include_in_schema=False,
         ),
 ) -> TokenPayload | None:
+    digest = token_digest(session_id)
+    token = token_cache.get(digest)
+    if token is None:
+        try:
+            token = verify_access_token(session_id)
+        except JWTError:
+            raise error_403
+        token_cache.set(digest, token, ttl_seconds=token.expires_at - time.time())
+    if await revocations.is_revoked(token.revocation_key):
+        raise error_403
+    return token.payload
+
+
+async def revoke_access_token(token: str, broker: RedisBroker) -> None:
+    """Revokes a token for every worker until it expires, invalid ones are ignored."""
     try:
-        payload = jwt.decode(
-            session_id,
-            settings.security.SECRET_KEY,
-            algorithms=[settings.security.ALGORITHM],
-        )
-        payload["id"] = uuid.UUID(payload["id"])
-        return TokenPayload(**payload)
+        verified = verify_access_token(token)
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
-        )
+        return
+    await revocations.revoke(broker, verified.revocation_key, verified.expires_at)
 
 
 TokenDataDep = Annotated[TokenPayload, Depends(decode_access_token)]
 
 
 def create_access_token(token_data: TokenPayload) -> str:
-    expire = datetime.now() + timedelta(
+    # Aware, a naive local time would be encoded as if it was UTC
+    expire = datetime.now(timezone.utc) + timedelta(
         minutes=settings.security.ACCESS_TOKEN_EXPIRE_MINUTES
     )
     to_encode = {
@@ -90,6 +257,25 @@ def set_cookie_session(
     return response
 
 
+def needs_refresh(token_data: TokenPayload) -> bool:
+    """Whether TOKEN_REFRESH_AFTER of the lifetime of the token has passed."""
+    if token_data.exp is None:
+        return True
+    lifetime = settings.security.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    remaining = token_data.exp - time.time()
+    return remaining < lifetime * (1 - settings.security.TOKEN_REFRESH_AFTER)
+
+
+# Sliding session: a new token only once the current one has aged enough,
+# instead of a signed token and Set-Cookie on every call
+def refresh_cookie_session(
+        request: Request, response: Response, user: User, token_data: TokenPayload
+) -> Response:
+    if needs_refresh(token_data):
+        set_cookie_session(request, response, user)
+    return response
+
+
 def delete_cookie_session(request: Request, response: Response) -> Response:
     response.delete_cookie(
         settings.security.JWT_COOKIE_NAME,
@@ -101,11 +287,24 @@ def delete_cookie_session(request: Request, response: Response) -> Response:
     return response
 
 
-def verify_code(plain_code: str, hashed_code: str) -> bool:
+def hmac_code_hash(code: str) -> str:
+    digest = hmac.new(
+        settings.security.SECRET_KEY.encode(), code.encode(), hashlib.sha256
+    ).hexdigest()
+    return f"{HMAC_CODE_PREFIX}{digest}"
+
+
+async def verify_code(plain_code: str, hashed_code: str) -> bool:
     if settings.DEBUG:
         return True
-    return pwd_context.verify(plain_code, hashed_code)
+    # By the stored hash, codes sent before OTP_HASHER changed still verify
+    if hashed_code.startswith(HMAC_CODE_PREFIX):
+        return hmac.compare_digest(hmac_code_hash(plain_code), hashed_code)
+    # Hundreds of milliseconds of CPU, the event loop would be blocked meanwhile
+    return await run_in_threadpool(pwd_context.verify, plain_code, hashed_code)
 
 
-def get_code_hash(code: str) -> str:
-    return pwd_context.hash(code)
+async def get_code_hash(code: str) -> str:
+    if settings.security.OTP_HASHER == "bcrypt":
+        return await run_in_threadpool(pwd_context.hash, code)
+    return hmac_code_hash(code)
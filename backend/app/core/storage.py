@@ -0,0 +1,176 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from typing import Any
+
+import aiofiles
+import aiofiles.os
+
+from app.core.config import StorageSettings, settings
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed storage of binary data.
+
+    Blobs are keyed by the sha256 of their content, so storing the same bytes
+    twice is a no-op and a key always refers to the same content. Blobs are
+    never removed, rows referencing them are only deactivated.
+    """
+
+    async def put(self, data: bytes) -> str:
+        key = content_key(data)
+        if not await self.exists(key):
+            await self._write(key, data)
+        return key
+
+    def staging_path(self) -> str:
+        """Path for a file that is being received, see put_file."""
+        return os.path.join(tempfile.gettempdir(), f"blob-{uuid.uuid4().hex}.tmp")
+
+    async def put_file(self, path: str, key: str) -> str:
+        """
+        Stores a staged file whose content hash is already known.
+
+        The file is consumed, it is moved into the store or removed.
+        """
+        try:
+            if not await self.exists(key):
+                await self._write_file(key, path)
+        finally:
+            if await aiofiles.os.path.exists(path):
+                await aiofiles.os.remove(path)
+        return key
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    async def _write(self, key: str, data: bytes) -> None: ...
+
+    @abstractmethod
+    async def _write_file(self, key: str, path: str) -> None: ...
+
+    @abstractmethod
+    def iter_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yields bytes [start, end) of the blob in chunks."""
+
+    def local_path(self, key: str) -> str | None:
+        """Filesystem path of the blob if it can be served as a file."""
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        # Two levels of fan-out keep directories small
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    async def exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self.local_path(key))
+
+    def staging_path(self) -> str:
+        # On the store's filesystem, so put_file is a rename
+        return os.path.join(self.root, "staging", f"{uuid.uuid4().hex}.tmp")
+
+    async def _write(self, key: str, data: bytes) -> None:
+        path = self.local_path(key)
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write aside and rename, readers never see a partial blob
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(data)
+        await aiofiles.os.replace(tmp_path, path)
+
+    async def _write_file(self, key: str, path: str) -> None:
+        blob_path = self.local_path(key)
+        await aiofiles.os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        await aiofiles.os.replace(path, blob_path)
+
+    async def iter_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.local_path(key), "rb") as f:
+            await f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+class S3BlobStore(BlobStore):
+    def __init__(self, storage: StorageSettings) -> None:
+        # Optional dependency, only needed with this backend: pip install aiobotocore
+        from aiobotocore.session import get_session
+
+        self.bucket = storage.S3_BUCKET
+        self._session = get_session()
+        self._client_kwargs = {
+            "endpoint_url": storage.S3_ENDPOINT_URL,
+            "region_name": storage.S3_REGION,
+            "aws_access_key_id": storage.S3_ACCESS_KEY,
+            "aws_secret_access_key": storage.S3_SECRET_KEY,
+        }
+        self._client: Any = None
+
+    async def _get_client(self) -> Any:
+        # One client per process, it keeps the HTTP connection pool
+        if self._client is None:
+            self._client = await self._session.create_client(
+                "s3", **self._client_kwargs
+            ).__aenter__()
+        return self._client
+
+    async def exists(self, key: str) -> bool:
+        client = await self._get_client()
+        try:
+            await client.head_object(Bucket=self.bucket, Key=key)
+        except client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    async def _write(self, key: str, data: bytes) -> None:
+        client = await self._get_client()
+        await client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    async def _write_file(self, key: str, path: str) -> None:
+        # Read off the event loop, staged files are uploads of at most
+        # images.MAX_UPLOAD_BYTES
+        async with aiofiles.open(path, "rb") as f:
+            data = await f.read()
+        client = await self._get_client()
+        await client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    async def iter_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        if end <= start:
+            return
+        client = await self._get_client()
+        response = await client.get_object(
+            Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end - 1}"
+        )
+        async with response["Body"] as body:
+            while chunk := await body.read(CHUNK_SIZE):
+                yield chunk
+
+
+def get_blob_store(storage: StorageSettings) -> BlobStore:
+    if storage.BACKEND == "s3":
+        return S3BlobStore(storage)
+    return LocalBlobStore(storage.LOCAL_PATH)
+
+
+blob_store = get_blob_store(settings.storage)
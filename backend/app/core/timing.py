@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import functools
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi.routing import APIRoute
+from redis import asyncio as aioredis
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import (
+    DB_SECONDS,
+    DB_STATEMENTS,
+    REDIS_COMMAND_SECONDS,
+    REDIS_SECONDS,
+    REQUEST_SECONDS,
+    SERIALIZE_SECONDS,
+)
+
+
+@dataclass
+class RequestTimings:
+    db_seconds: float = 0.0
+    db_statements: int = 0
+    redis_seconds: float = 0.0
+    serialize_seconds: float = 0.0
+    endpoint_returned_at: float | None = None
+
+    def server_timing(self, total_seconds: float) -> str:
+        return ", ".join(
+            [
+                f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_statements} statements"',
+                f"redis;dur={self.redis_seconds * 1000:.1f}",
+                f"serialize;dur={self.serialize_seconds * 1000:.1f}",
+                f"total;dur={total_seconds * 1000:.1f}",
+            ]
+        )
+
+
+# Timings of the request being served, None outside of requests
+request_timings: contextvars.ContextVar[RequestTimings | None] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Adds the time of every statement to the timings of its request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Statements on a connection do not overlap, a failed one is overwritten
+        conn.info["query_started_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info.pop("query_started_at")
+        timings = request_timings.get()
+        if timings is not None:
+            timings.db_seconds += time.perf_counter() - started_at
+            timings.db_statements += 1
+
+
+class TimedRedis(aioredis.Redis):
+    """
+    Redis client recording the latency of every command.
+
+    During a request the time is also added to the timings of the request.
+    """
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        started_at = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            REDIS_COMMAND_SECONDS.labels(str(args[0]).upper()).observe(elapsed)
+            timings = request_timings.get()
+            if timings is not None:
+                timings.redis_seconds += elapsed
+
+
+class TimedRoute(APIRoute):
+    """
+    Measures serialization: from the endpoint returning to the response.
+
+    That is validating the returned value against the response_model and
+    rendering it, the part of a request that grows with the response size.
+    """
+
+    def get_route_handler(self) -> Callable:
+        endpoint = self.dependant.call
+
+        def endpoint_returned() -> None:
+            timings = request_timings.get()
+            # Shared with the context copy a sync endpoint runs in
+            if timings is not None:
+                timings.endpoint_returned_at = time.perf_counter()
+
+        # The wrapper keeps the endpoint sync or async, FastAPI checks which
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args: Any, **kwargs: Any) -> Any:
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    endpoint_returned()
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args: Any, **kwargs: Any) -> Any:
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    endpoint_returned()
+
+        self.dependant.call = timed_endpoint
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request) -> Response:
+            response = await handler(request)
+            timings = request_timings.get()
+            if timings is not None and timings.endpoint_returned_at is not None:
+                timings.serialize_seconds = time.perf_counter() - timings.endpoint_returned_at
+            return response
+
+        return timed_handler
+
+
+class TimingMiddleware:
+    """
+    Collects the timings of every HTTP request.
+
+    They are recorded in histograms labeled with the route id, and with
+    server_timing also sent back in a Server-Timing header.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = settings.DEBUG) -> None:
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        started_at = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and self.server_timing:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing", timings.server_timing(time.perf_counter() - started_at)
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+            route = scope.get("route")
+            # Unmatched paths would each get their own label otherwise
+            name = route.unique_id if isinstance(route, APIRoute) else "unmatched"
+            REQUEST_SECONDS.labels(name).observe(time.perf_counter() - started_at)
+            DB_SECONDS.labels(name).observe(timings.db_seconds)
+            DB_STATEMENTS.labels(name).observe(timings.db_statements)
+            REDIS_SECONDS.labels(name).observe(timings.redis_seconds)
+            SERIALIZE_SECONDS.labels(name).observe(timings.serialize_seconds)
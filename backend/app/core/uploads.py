@@ -0,0 +1,188 @@
+import hashlib
+import io
+import os
+from dataclasses import dataclass
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from PIL import Image as ImagePIL
+
+from app.core.config import settings
+
+IMAGE_MAGIC = {
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+}
+MAGIC_SIZE = max(len(magic) for magic in IMAGE_MAGIC)
+# Enough for PNG and for most JPEG headers, larger EXIF blocks are checked later
+HEADER_PEEK_SIZE = 64 * 1024
+
+error_413 = HTTPException(status_code=413, detail="Image is too large")
+
+
+@dataclass
+class IngestedUpload:
+    path: str
+    size: int
+    sha256: str
+    media_type: str
+
+    async def discard(self) -> None:
+        if await aiofiles.os.path.exists(self.path):
+            await aiofiles.os.remove(self.path)
+
+
+class ImageUploadIngestor:
+    """
+    Streams one file field of a multipart body to a staging file.
+
+    The body is never held in memory: data is hashed and written as it
+    arrives. The upload is rejected as soon as it exceeds the size limit,
+    its magic bytes are not an allowed image type, or its header announces
+    too many pixels.
+    """
+
+    def __init__(self, field_name: str) -> None:
+        self.field_name = field_name
+        self.max_bytes = settings.images.MAX_UPLOAD_BYTES
+        self.max_pixels = settings.images.MAX_PIXELS
+
+        self.size = 0
+        self.hash = hashlib.sha256()
+        self.media_type: str | None = None
+        self.found = False
+
+        self._header = bytearray()
+        self._header_checked = False
+        self._in_field = False
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        # Filled by the parser callbacks, flushed to disk after every chunk
+        self._pending: list[bytes] = []
+
+    # Parser callbacks, called synchronously from MultipartParser.write
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._in_field = (
+            not self.found
+            and options.get(b"name") == self.field_name.encode()
+            and b"filename" in options
+        )
+        self.found = self.found or self._in_field
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._in_field:
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise error_413
+        self.hash.update(chunk)
+        self._pending.append(chunk)
+        if not self._header_checked:
+            self._header.extend(chunk[: HEADER_PEEK_SIZE - len(self._header)])
+            self._check_header(complete=False)
+
+    def on_part_end(self) -> None:
+        if self._in_field and not self._header_checked:
+            self._check_header(complete=True)
+        self._in_field = False
+
+    def _check_header(self, complete: bool) -> None:
+        if self.media_type is None and (len(self._header) >= MAGIC_SIZE or complete):
+            self.media_type = next(
+                (
+                    media_type
+                    for magic, media_type in IMAGE_MAGIC.items()
+                    if self._header.startswith(magic)
+                ),
+                None,
+            )
+            if self.media_type is None:
+                raise HTTPException(status_code=400, detail="Allowed formats are: jpeg, png")
+
+        if len(self._header) < HEADER_PEEK_SIZE and not complete:
+            return
+        self._header_checked = True
+        header, self._header = bytes(self._header), bytearray()
+        try:
+            with ImagePIL.open(io.BytesIO(header)) as image:
+                width, height = image.size
+        except Exception:
+            # Header did not fit the peek, the process pool checks the full image
+            return
+        if width * height > self.max_pixels:
+            raise error_413
+
+    async def flush(self, f) -> None:
+        for chunk in self._pending:
+            await f.write(chunk)
+        self._pending.clear()
+
+
+async def ingest_image_upload(
+    request: Request, staging_path: str, field_name: str = "file"
+) -> IngestedUpload:
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > settings.images.MAX_UPLOAD_BYTES + HEADER_PEEK_SIZE:
+        # Rejected before reading the body, allowance is for multipart framing
+        raise error_413
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    ingestor = ImageUploadIngestor(field_name)
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": ingestor.on_part_begin,
+            "on_header_field": ingestor.on_header_field,
+            "on_header_value": ingestor.on_header_value,
+            "on_header_end": ingestor.on_header_end,
+            "on_headers_finished": ingestor.on_headers_finished,
+            "on_part_data": ingestor.on_part_data,
+            "on_part_end": ingestor.on_part_end,
+        },
+    )
+
+    await aiofiles.os.makedirs(os.path.dirname(staging_path), exist_ok=True)
+    try:
+        async with aiofiles.open(staging_path, "wb") as f:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                await ingestor.flush(f)
+            parser.finalize()
+    except BaseException:
+        if await aiofiles.os.path.exists(staging_path):
+            await aiofiles.os.remove(staging_path)
+        raise
+
+    upload = IngestedUpload(
+        path=staging_path,
+        size=ingestor.size,
+        sha256=ingestor.hash.hexdigest(),
+        media_type=ingestor.media_type or "",
+    )
+    if not ingestor.found or not ingestor.media_type:
+        await upload.discard()
+        raise HTTPException(status_code=400, detail=f'Expected an image in "{field_name}"')
+    return upload
@@ -1,18 +1,38 @@
 import uuid
+from collections.abc import Sequence
 from typing import Protocol
 
-from sqlalchemy import true
-from sqlmodel import SQLModel, Session, select
+from sqlalchemy import Select, func, true, tuple_
+from sqlalchemy.sql.base import ExecutableOption
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.schemas.utils import PageParams
 
-def get_object(session: Session, model: SQLModel, object_id: uuid.UUID) -> SQLModel | None:
-    statement = select(model).where(model.id == object_id, model.is_active == true())
-    db_object = session.exec(statement).first()
+
+async def get_object(
+    session: AsyncSession,
+    model: SQLModel,
+    object_id: uuid.UUID,
+    options: Sequence[ExecutableOption] = (),
+    for_update: bool = False,
+) -> SQLModel | None:
+    statement = (
+        select(model)
+        .where(model.id == object_id, model.is_active == true())
+        .options(*options)
+    )
+    if for_update:
+        # Locked until commit, reloaded over anything the session read before
+        statement = statement.with_for_update(of=model).execution_options(
+            populate_existing=True
+        )
+    db_object = (await session.exec(statement)).first()
     return db_object
 
 
-def create_object(
-    session: Session,
+async def create_object(
+    session: AsyncSession,
     model: SQLModel | None,
     object_create: SQLModel,
     commit: bool = True,
@@ -23,24 +43,26 @@ def create_object(
         db_object = object_create
     session.add(db_object)
     if commit:
-        session.commit()
+        await session.commit()
     else:
-        session.flush()
+        await session.flush()
     return db_object
 
 
-def update_object(
-    session: Session,
+async def update_object(
+    session: AsyncSession,
     db_object: SQLModel,
     object_in: SQLModel | None = None,
+    commit: bool = True,
 ) -> SQLModel:
     """
     Updates an object in the database.
 
     Args:
-        session (Session): The database session to use for updating the object.
+        session (AsyncSession): The database session to use for updating the object.
         db_object (SQLModel): An instance of the model that you want to update.
         object_in (like SQLModelUpdate): An instance of the model with the data to update the object.
+        commit (bool): Commit the session, or only flush it.
 
     Returns:
         _T0: The updated database object.
@@ -49,19 +71,56 @@ def update_object(
         object_data = object_in.model_dump(exclude_unset=True)
         db_object.sqlmodel_update(object_data)
     session.add(db_object)
-    session.commit()
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
 
     return db_object
 
 
+def paginate(
+    statement: Select, model: SQLModel, q: PageParams, descending: bool = False
+) -> Select:
+    """
+    Orders a statement by (modified_at, id) and applies the page.
+
+    With a cursor the page is located by a row comparison against the last
+    seen key, so deep pages cost the same as the first one. Without a cursor
+    the plain offset is used.
+    """
+    key = tuple_(model.modified_at, model.id)
+    if descending:
+        statement = statement.order_by(model.modified_at.desc(), model.id.desc())
+    else:
+        statement = statement.order_by(model.modified_at, model.id)
+    if q.cursor:
+        cursor = tuple_(q.cursor.modified_at, q.cursor.id)
+        statement = statement.where(key < cursor if descending else key > cursor)
+    else:
+        statement = statement.offset(q.skip)
+    return statement.limit(q.limit)
+
+
+async def count_objects(session: AsyncSession, statement: Select) -> int:
+    count_statement = select(func.count()).select_from(
+        statement.order_by(None).subquery()
+    )
+    return (await session.exec(count_statement)).one()
+
+
 class HasIsActive(Protocol):
     is_active: bool
 
 
-def delete_object(
-    session: Session,
+async def delete_object(
+    session: AsyncSession,
     object_in: HasIsActive,
+    commit: bool = True,
 ) -> None:
     object_in.is_active = False
     session.add(object_in)
-    session.commit()
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
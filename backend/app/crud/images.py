@@ -1,21 +1,22 @@
 import datetime
 import uuid
 
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.models import Image
 
 
-def read_image(session: Session, image_id: uuid.UUID) -> Image | None:
+async def read_image(session: AsyncSession, image_id: uuid.UUID) -> Image | None:
     statement = select(Image).where(
         Image.id == image_id,
         Image.is_active == True,
     )
-    db_image = session.exec(statement).first()
+    db_image = (await session.exec(statement)).first()
     return db_image
 
 
-def create_image(session: Session, image: Image) -> Image:
+async def create_image(session: AsyncSession, image: Image) -> Image:
     db_image = Image.model_validate(
         image,
         update={
@@ -24,11 +25,11 @@ def create_image(session: Session, image: Image) -> Image:
         },
     )
     session.add(db_image)
-    session.commit()
+    await session.commit()
     return db_image
 
 
-def delete_image(session: Session, db_image: Image) -> None:
+async def delete_image(session: AsyncSession, db_image: Image) -> None:
     db_image.is_active = False
     session.add(db_image)
-    session.commit()
+    await session.commit()
@@ -1,50 +1,72 @@
 import uuid
+from collections.abc import Sequence
 
 from fastapi import HTTPException
-from sqlalchemy import func, true
+from sqlalchemy import true
 from sqlalchemy.orm import joinedload
-from sqlmodel import Session, select
+from sqlalchemy.sql.base import ExecutableOption
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.crud import common
 from app.models import Invite, TodoUserLink, User
 from app.models.todo import Todo
 from app.schemas.todo import TodoUpdate
 from app.schemas.utils import PageParams
 
+# InviteOut renders the short todo only
+INVITE_OUT_OPTIONS = (joinedload(Invite.todo),)
+# Accepting adds the invited user to the todo members
+INVITE_ACCEPT_OPTIONS = (
+    # The new member is rendered in the TodoOut of the change
+    joinedload(Invite.user).joinedload(User.profile_image),
+    joinedload(Invite.todo).selectinload(Todo.users),
+)
 
-def read_objects(
-        session: Session, user: User, q: PageParams | None = None
-) -> tuple[list[Invite], int]:
+
+async def read_objects(
+        session: AsyncSession,
+        user: User,
+        q: PageParams | None = None,
+        options: Sequence[ExecutableOption] = (),
+) -> tuple[list[Invite], int | None]:
     statement = (
-        select(Invite, func.count(Invite.id).over().label("total"))
+        select(Invite)
         .where(Invite.user_id == user.id)
         .where(Invite.is_active == true())
-        .distinct(Invite.id)
     )
-    if q:
-        statement = statement.offset(q.skip).limit(q.limit)
-    db_results = session.exec(statement).all() or []
+    if not q:
+        db_objects = list((await session.exec(statement.options(*options))).all())
+        return db_objects, len(db_objects)
 
-    db_objects = [object_db for object_db, total in db_results]
-    db_total = db_results[0][1] if len(db_results) > 0 else 0
+    db_total = await common.count_objects(session, statement) if q.with_total else None
+    statement = common.paginate(statement, Invite, q).options(*options)
+    db_objects = list((await session.exec(statement)).all())
     return db_objects, db_total
 
 
-def get_unique_invite(session: Session, todo_id: uuid.UUID, user_id: uuid.UUID) -> Invite:
+async def get_unique_invite(session: AsyncSession, todo_id: uuid.UUID, user_id: uuid.UUID) -> Invite:
     statement = select(Invite).where(
         Invite.todo_id == todo_id,
         Invite.user_id == user_id,
         Invite.is_active == true()
     )
-    db_object = session.exec(statement).first()
+    db_object = (await session.exec(statement)).first()
     return db_object
 
 
-def accept_invite(
-    session: Session,
+async def accept_invite(
+    session: AsyncSession,
     invite: Invite,
+    commit: bool = True,
 ):
-    invite.todo.users.append(invite.user)
+    # Already a member when a concurrent accept of the invite got there first
+    if invite.user not in invite.todo.users:
+        invite.todo.users.append(invite.user)
     session.add(invite.todo)
     invite.is_active = False
     session.add(invite)
-    session.commit()
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
@@ -0,0 +1,140 @@
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import TodoChange, TodoChangeOp, TodoChangeSeq
+
+# Changes of one todo for every affected user: user id -> operation and data
+TodoChanges = dict[uuid.UUID, tuple[TodoChangeOp, dict]]
+
+
+def diff_todo(before: dict | None, after: dict | None) -> TodoChanges:
+    """
+    Changes of a todo for every user who could or can see it.
+
+    before and after are TodoOut dumped in json mode, None when the todo
+    does not exist on that side. Members who joined get the whole todo,
+    members who left get a delete, the others only the changed fields.
+    """
+    before_users = {uuid.UUID(user["id"]) for user in before["users"]} if before else set()
+    after_users = {uuid.UUID(user["id"]) for user in after["users"]} if after else set()
+
+    changes: TodoChanges = {}
+    for user_id in after_users - before_users:
+        changes[user_id] = (TodoChangeOp.CREATE, after)
+    for user_id in before_users - after_users:
+        changes[user_id] = (TodoChangeOp.DELETE, {})
+
+    changed_fields = {
+        key: value
+        for key, value in (after or {}).items()
+        if before is not None and before.get(key) != value
+    }
+    if changed_fields:
+        for user_id in before_users & after_users:
+            changes[user_id] = (TodoChangeOp.UPDATE, changed_fields)
+    return changes
+
+
+async def allocate_seqs(
+    session: AsyncSession, counts: Counter[uuid.UUID]
+) -> dict[uuid.UUID, int]:
+    """
+    Takes the next count seqs of every user, returns the first of each.
+
+    A single upsert in the caller's transaction. The rows stay locked until
+    it ends, so a user's changes commit in the order of their seqs and a
+    client that saw one has seen every lower one.
+    """
+    # Sorted, concurrent writes lock the rows of shared members in one order
+    rows = [
+        {"user_id": user_id, "seq": count, "pruned_seq": 0}
+        for user_id, count in sorted(counts.items())
+        if count
+    ]
+    if not rows:
+        return {}
+    statement = insert(TodoChangeSeq).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[TodoChangeSeq.user_id],
+        set_={"seq": TodoChangeSeq.seq + statement.excluded.seq},
+    ).returning(TodoChangeSeq.user_id, TodoChangeSeq.seq)
+    last_seqs = dict((await session.exec(statement)).all())
+    return {user_id: last_seqs[user_id] - count + 1 for user_id, count in counts.items()}
+
+
+async def record_changes(
+    session: AsyncSession, changes: dict[uuid.UUID, TodoChanges]
+) -> list[TodoChange]:
+    """Records the changes of every todo id, in a single INSERT."""
+    next_seqs = await allocate_seqs(
+        session,
+        Counter(user_id for todo_changes in changes.values() for user_id in todo_changes),
+    )
+    db_changes = []
+    for todo_id, todo_changes in changes.items():
+        for user_id, (op, data) in todo_changes.items():
+            db_changes.append(
+                TodoChange(
+                    user_id=user_id, seq=next_seqs[user_id], todo_id=todo_id, op=op, data=data
+                )
+            )
+            next_seqs[user_id] += 1
+    # Committed together with the change itself
+    session.add_all(db_changes)
+    await session.flush()
+    return db_changes
+
+
+async def read_changes(
+    session: AsyncSession, user_id: uuid.UUID, since: int, limit: int
+) -> list[TodoChange]:
+    statement = (
+        select(TodoChange)
+        .where(TodoChange.user_id == user_id, TodoChange.seq > since)
+        .order_by(TodoChange.seq)
+        .limit(limit)
+    )
+    return list((await session.exec(statement)).all())
+
+
+async def get_last_seq(session: AsyncSession, user_id: uuid.UUID) -> int:
+    statement = select(TodoChangeSeq.seq).where(TodoChangeSeq.user_id == user_id)
+    return (await session.exec(statement)).first() or 0
+
+
+async def get_pruned_seq(session: AsyncSession, user_id: uuid.UUID) -> int:
+    """Highest pruned change of the user, every one up to it may be gone."""
+    statement = select(TodoChangeSeq.pruned_seq).where(TodoChangeSeq.user_id == user_id)
+    return (await session.exec(statement)).first() or 0
+
+
+async def prune_changes(session: AsyncSession, before: datetime) -> int:
+    """Removes the older changes and raises the pruned_seq of their users."""
+    result = await session.exec(
+        text(
+            """
+            WITH pruned AS (
+                DELETE FROM todo_changes WHERE created_at < :before
+                RETURNING user_id, seq
+            ), watermarks AS (
+                UPDATE todo_change_seqs
+                SET pruned_seq = greatest(todo_change_seqs.pruned_seq, last_pruned.seq)
+                FROM (
+                    SELECT user_id, max(seq) AS seq FROM pruned GROUP BY user_id
+                ) AS last_pruned
+                WHERE todo_change_seqs.user_id = last_pruned.user_id
+            )
+            SELECT count(*) FROM pruned
+            """
+        ),
+        params={"before": before},
+    )
+    pruned = result.scalar_one()
+    await session.commit()
+    return pruned
@@ -0,0 +1,91 @@
+import uuid
+from collections import Counter
+
+from sqlalchemy import func, text, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Todo, TodoCounter, TodoStatus, TodoUserLink, User
+
+# (user id, status) -> change of the count
+CountChanges = Counter[tuple[uuid.UUID, TodoStatus]]
+
+
+def diff_counts(before: dict | None, after: dict | None) -> CountChanges:
+    """
+    Count changes of a todo write, for every member before and after it.
+
+    before and after are TodoOut dumped in json mode like in
+    todo_changes.diff_todo, None when the todo does not exist on that side.
+    """
+    changes: CountChanges = Counter()
+    for data, step in ((before, -1), (after, 1)):
+        if data:
+            status = TodoStatus(data["status"])
+            for user in data["users"]:
+                changes[(uuid.UUID(user["id"]), status)] += step
+    return changes
+
+
+async def update_counts(session: AsyncSession, changes: CountChanges) -> None:
+    """Applies the count changes in a single upsert, in the caller's transaction."""
+    # Sorted, concurrent writes lock the rows of shared members in one order
+    rows = [
+        {"user_id": user_id, "status": status, "count": count}
+        for (user_id, status), count in sorted(
+            changes.items(), key=lambda item: (item[0][0], item[0][1].value)
+        )
+        if count
+    ]
+    if not rows:
+        return
+    statement = insert(TodoCounter).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[TodoCounter.user_id, TodoCounter.status],
+        set_={"count": TodoCounter.count + statement.excluded.count},
+    )
+    await session.exec(statement)
+
+
+def add_counts(session: AsyncSession, user: User, statuses: list[TodoStatus]) -> None:
+    """Adds the counters of a new user to the session, inserted by its flush."""
+    session.add_all(
+        TodoCounter(user=user, status=status, count=count)
+        for status, count in Counter(statuses).items()
+    )
+
+
+async def read_counts(session: AsyncSession, user_id: uuid.UUID) -> dict[TodoStatus, int]:
+    statement = select(TodoCounter).where(TodoCounter.user_id == user_id)
+    counts = {status: 0 for status in TodoStatus}
+    for db_counter in (await session.exec(statement)).all():
+        counts[db_counter.status] = db_counter.count
+    return counts
+
+
+async def recount(session: AsyncSession) -> CountChanges:
+    """
+    Corrects every counter from the todos themselves and commits.
+
+    For writes that bypassed the API. Todo writes wait for the table lock
+    and are counted on top, so none is lost. Returns the corrections.
+    """
+    await session.exec(text("LOCK TABLE todo_counters IN EXCLUSIVE MODE"))
+    actual = await session.exec(
+        select(TodoUserLink.user_id, Todo.status, func.count())
+        .join(Todo, Todo.id == TodoUserLink.todo_id)
+        .where(Todo.is_active == true())
+        .group_by(TodoUserLink.user_id, Todo.status)
+    )
+    changes: CountChanges = Counter(
+        {(user_id, status): count for user_id, status, count in actual.all()}
+    )
+    stored = await session.exec(select(TodoCounter))
+    for db_counter in stored.all():
+        changes[(db_counter.user_id, db_counter.status)] -= db_counter.count
+
+    changes = Counter({key: count for key, count in changes.items() if count})
+    await update_counts(session, changes)
+    await session.commit()
+    return changes
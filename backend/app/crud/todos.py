@@ -1,48 +1,115 @@
+import uuid
+from collections.abc import Sequence
+
 from fastapi import HTTPException
-from sqlalchemy import func, true
-from sqlmodel import Session, select
+from sqlalchemy import Select, func, true
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.base import ExecutableOption
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.models import TodoUserLink, User
-from app.models.todo import Todo
-from app.schemas.todo import TodoUpdate
+from app.core.config import settings
+from app.crud import common
+from app.models import TodoStatus, TodoUserLink, User
+from app.models.todo import SEARCH_CONFIG, Todo
+from app.schemas.todo import (
+    TodoBatchCreate,
+    TodoBatchDelete,
+    TodoBatchUpdate,
+    TodoFilter,
+    TodoUpdate,
+)
 from app.schemas.utils import PageParams
 
+# Relationships are raise_on_sql, every query states what it is going to serialize
+# Members only, enough for access checks and broadcasting
+TODO_MEMBERS_OPTIONS = (selectinload(Todo.users),)
+# Everything TodoOut renders: members and their profile images
+TODO_OUT_OPTIONS = (selectinload(Todo.users).joinedload(User.profile_image),)
+
+
+def apply_filter(statement: Select, todo_filter: TodoFilter) -> Select:
+    if todo_filter.status:
+        statement = statement.where(Todo.status.in_(todo_filter.status))
+    if todo_filter.q:
+        # Matched against the generated column, served by ix_todos_search_vector
+        statement = statement.where(
+            Todo.__table__.c.search_vector.bool_op("@@")(
+                func.websearch_to_tsquery(SEARCH_CONFIG, todo_filter.q)
+            )
+        )
+    if todo_filter.modified_after:
+        statement = statement.where(Todo.modified_at > todo_filter.modified_after)
+    if todo_filter.modified_before:
+        statement = statement.where(Todo.modified_at < todo_filter.modified_before)
+    return statement
+
 
-def read_objects(
-        session: Session, user: User, q: PageParams | None = None
-) -> tuple[list[Todo], int]:
+async def read_objects(
+        session: AsyncSession,
+        user: User,
+        q: PageParams | None = None,
+        options: Sequence[ExecutableOption] = (),
+        todo_filter: TodoFilter | None = None,
+) -> tuple[list[Todo], int | None]:
     statement = (
-        select(Todo, func.count(Todo.id).over().label("total"))
+        select(Todo)
         .join(TodoUserLink, Todo.id == TodoUserLink.todo_id)
         .where(TodoUserLink.user_id == user.id)
         .where(Todo.is_active == true())
     )
-    if q:
-        statement = statement.offset(q.skip).limit(q.limit)
-    db_results = session.exec(statement).all() or []
+    if todo_filter:
+        statement = apply_filter(statement, todo_filter)
+    if not q:
+        db_objects = list((await session.exec(statement.options(*options))).all())
+        return db_objects, len(db_objects)
 
-    db_objects = [object_db for object_db, total in db_results]
-    db_total = db_results[0][1] if len(db_results) > 0 else 0
+    db_total = await common.count_objects(session, statement) if q.with_total else None
+    descending = todo_filter is not None and todo_filter.order == "desc"
+    statement = common.paginate(statement, Todo, q, descending).options(*options)
+    db_objects = list((await session.exec(statement)).all())
     return db_objects, db_total
 
 
-def create_object(
-        session: Session,
+async def read_objects_by_ids(
+        session: AsyncSession,
+        todo_ids: Sequence[uuid.UUID],
+        options: Sequence[ExecutableOption] = (),
+        for_update: bool = False,
+) -> dict[uuid.UUID, Todo]:
+    statement = (
+        select(Todo)
+        .where(Todo.id.in_(todo_ids))
+        .where(Todo.is_active == true())
+        .options(*options)
+    )
+    if for_update:
+        # Locked in id order, concurrent batches sharing todos do not deadlock
+        statement = (
+            statement.order_by(Todo.id)
+            .with_for_update(of=Todo)
+            .execution_options(populate_existing=True)
+        )
+    return {db_todo.id: db_todo for db_todo in (await session.exec(statement)).all()}
+
+
+async def create_object(
+        session: AsyncSession,
         object_create: Todo,
         user: User,
+        commit: bool = True,
 ) -> Todo:
     db_todo = Todo.model_validate(object_create)
     db_todo.users = [user]
     session.add(db_todo)
-    session.commit()
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
     return db_todo
 
 
-def update_object(
-        session: Session,
-        db_todo: Todo,
-        todo_in: TodoUpdate,
-) -> Todo:
+def apply_update(db_todo: Todo, todo_in: TodoUpdate) -> None:
     todo_data = todo_in.model_dump(exclude_unset=True)
     db_todo.sqlmodel_update(todo_data)
 
@@ -53,15 +120,82 @@ def update_object(
             status_code=400, detail="Can not delete all users from todo."
         )
     else:
-        statement = select(User).where(User.id.in_(todo_in.user_ids))
-        db_users = session.exec(statement).all()
-        new_users_appeared = set(db_users) - set(db_todo.users)
-        if len(db_users) != len(todo_in.user_ids) or new_users_appeared:
+        # Members can only be removed, so the loaded ones are all that can match
+        db_users = [user for user in db_todo.users if user.id in todo_in.user_ids]
+        if len(db_users) != len(todo_in.user_ids):
             raise HTTPException(
                 status_code=400, detail="One or more user IDs are invalid."
             )
         db_todo.users = db_users
 
+
+def seed_greeting_todos(session: AsyncSession, user: User) -> list[Todo]:
+    """
+    Adds the greeting todos of a new user to the session, flushed by its commit.
+
+    Nothing is sent until then: the user, the todos and their member links
+    go out in one flush, each as a single multi-row INSERT.
+    """
+    db_todos = []
+    for template in settings.content.GREETING_TODOS:
+        db_todo = Todo(
+            title=template.title,
+            description=template.description,
+            status=TodoStatus(template.status),
+        )
+        # Added before the members are set, the backref would otherwise cascade it
+        session.add(db_todo)
+        db_todo.users = [user]
+        db_todos.append(db_todo)
+    return db_todos
+
+
+async def update_object(
+        session: AsyncSession,
+        db_todo: Todo,
+        todo_in: TodoUpdate,
+        commit: bool = True,
+) -> Todo:
+    apply_update(db_todo, todo_in)
+
     session.add(db_todo)
-    session.commit()
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
     return db_todo
+
+
+async def apply_batch(
+        session: AsyncSession,
+        user: User,
+        operations: Sequence[TodoBatchCreate | TodoBatchUpdate | TodoBatchDelete],
+        db_todos: dict[uuid.UUID, Todo],
+) -> list[Todo]:
+    """
+    Applies batch operations in order and flushes them together.
+
+    db_todos are the todos the updates and deletes refer to, loaded with
+    their members. One flush lets the ORM send the new todos and their
+    member links as multi-row INSERTs and group the UPDATEs. Returns the
+    todo of every operation, deleted ones with is_active False.
+    """
+    results = []
+    for operation in operations:
+        if isinstance(operation, TodoBatchCreate):
+            db_todo = Todo.model_validate(operation.data)
+            db_todo.users = [user]
+        else:
+            db_todo = db_todos.get(operation.id)
+            if not db_todo or not db_todo.is_active:
+                # Missing or deleted by an earlier operation
+                raise HTTPException(status_code=404, detail="Todo not found")
+            if isinstance(operation, TodoBatchUpdate):
+                apply_update(db_todo, operation.data)
+            else:
+                db_todo.is_active = False
+        session.add(db_todo)
+        results.append(db_todo)
+
+    await session.flush()
+    return results
@@ -1,52 +1,144 @@
+import json
+import uuid
+from collections.abc import Sequence
 from datetime import datetime
+from typing import Any
 
 from alembic.util import status
 from redis import asyncio as aioredis
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.sql.base import ExecutableOption
 from sqlalchemy.testing.suite.test_reflection import users
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.core.cache import LRUCache
 from app.core.config import settings
 from app.crud import common
+from app.crud import todo_counters as todo_counters_crud
+from app.crud import todos as todos_crud
 from app.core.security import get_code_hash, verify_code
-from app.models import Todo, TodoStatus, User
+from app.models import Image, User
 from app.schemas.user import UserCreate
 
+# UserOut renders the profile image
+USER_OUT_OPTIONS = (joinedload(User.profile_image),)
 
-def get_user_by_phone(session: Session, phone: int | str) -> User | None:
+user_local_cache = LRUCache(
+    max_size=settings.cache.USER_LOCAL_MAX_SIZE,
+    ttl_seconds=settings.cache.USER_LOCAL_TTL_SECONDS,
+)
+
+
+def user_cache_key(user_id: uuid.UUID) -> str:
+    return f"cache:user:{user_id}"
+
+
+def dump_cached_user(user: User) -> dict[str, Any]:
+    data = user.model_dump(mode="json")
+    data["profile_image"] = (
+        user.profile_image.model_dump(mode="json") if user.profile_image else None
+    )
+    return data
+
+
+def load_cached_user(data: dict[str, Any]) -> User:
+    user_data = dict(data)
+    image_data = user_data.pop("profile_image")
+    user = User.model_validate(user_data)
+    if image_data:
+        user.profile_image = Image.model_validate(image_data)
+        make_transient_to_detached(user.profile_image)
+    # Rows with an identity, as if loaded earlier and detached from their session
+    make_transient_to_detached(user)
+    return user
+
+
+async def get_cached_user(
+    session: AsyncSession, user_id: uuid.UUID, redis: aioredis.Redis
+) -> User | None:
+    """
+    Reads an active user with USER_OUT_OPTIONS loaded, through the cache.
+
+    Checks the in-process cache, then redis, then the database. A cached
+    record is merged into the session without a query, so the returned user
+    can be modified and compared with loaded objects as usual.
+    """
+    key = user_cache_key(user_id)
+    data = user_local_cache.get(key)
+    if data is None:
+        cached = await redis.get(key)
+        if cached:
+            data = json.loads(cached)
+            user_local_cache.set(key, data)
+
+    if data is not None:
+        return await session.merge(load_cached_user(data), load=False)
+
+    user = await common.get_object(session, User, user_id, options=USER_OUT_OPTIONS)
+    if not user:
+        return None
+    data = dump_cached_user(user)
+    await redis.set(key, json.dumps(data), ex=settings.cache.USER_TTL_SECONDS)
+    user_local_cache.set(key, data)
+    return user
+
+
+async def invalidate_cached_user(user_id: uuid.UUID | str, redis: aioredis.Redis) -> None:
+    key = user_cache_key(user_id)
+    user_local_cache.pop(key)
+    await redis.delete(key)
+
+
+async def get_user_by_phone(
+    session: AsyncSession,
+    phone: int | str,
+    options: Sequence[ExecutableOption] = (),
+) -> User | None:
     # Un active user is needed in routers/login/get_sms_code
     # Consider to change un active user registration behaviour there
     # statement = select(User).where(User.phone == int(phone), User.is_active is True)
-    statement = select(User).where(User.phone == int(phone))
-    session_user = session.exec(statement).first()
+    statement = select(User).where(User.phone == int(phone)).options(*options)
+    session_user = (await session.exec(statement)).first()
     return session_user
 
 
 async def authenticate(
-    session: Session, phone: int, code: str, redis: aioredis.Redis
+    session: AsyncSession, phone: int, code: str, redis: aioredis.Redis
 ) -> User | None:
     phone_key = f"verification:phone:{phone}"
     stored_code = await redis.get(phone_key)
     if not stored_code:
         return None
 
-    if not verify_code(code, str(stored_code)):
+    if not await verify_code(code, str(stored_code)):
         return None
 
     await redis.delete(phone_key)
 
-    db_user = get_user_by_phone(session=session, phone=phone)
+    return await get_or_create_user(session, phone)
+
+
+async def get_or_create_user(session: AsyncSession, phone: int) -> User:
+    db_user = await get_user_by_phone(
+        session=session, phone=phone, options=USER_OUT_OPTIONS
+    )
     if not db_user:
         user_create = UserCreate(phone=phone)
-        db_user = common.create_object(session, User, user_create)
+        db_user = User.model_validate(user_create)
+        session.add(db_user)
         if settings.content.SPAWN_GREETING_TODOS:
-            common.create_object(session, Todo, Todo(title="Register in Todos", status=TodoStatus.DONE, users=[db_user], created_at=datetime.now(), modified_at=datetime.now()))
-            common.create_object(session, Todo, Todo(title="Login in Todos", status=TodoStatus.DONE, users=[db_user], created_at=datetime.now(), modified_at=datetime.now()))
-            common.create_object(session, Todo, Todo(title="Learn how to use Todos", status=TodoStatus.IN_PROGRESS, users=[db_user], created_at=datetime.now(), modified_at=datetime.now()))
-            common.create_object(session, Todo, Todo(title="Make a new Todo", status=TodoStatus.NEW, users=[db_user], created_at=datetime.now(), modified_at=datetime.now()))
+            db_todos = todos_crud.seed_greeting_todos(session, db_user)
+            todo_counters_crud.add_counts(
+                session, db_user, [db_todo.status for db_todo in db_todos]
+            )
+        # The user and its todos in a single transaction
+        await session.commit()
     return db_user
 
 
 async def set_verification(
     phone: int, code: str, expiration: datetime, redis: aioredis.Redis
 ) -> None:
-    await redis.set(f"verification:phone:{phone}", get_code_hash(code), exat=expiration)
+    code_hash = await get_code_hash(code)
+    await redis.set(f"verification:phone:{phone}", code_hash, exat=expiration)
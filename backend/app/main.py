@@ -2,10 +2,13 @@ import logging.config
 
 import yaml
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.routing import APIRoute
 
 from app.api.main import api_router
+from app.api.routes import metrics
 from app.core.config import settings
+from app.core.timing import TimingMiddleware
 
 DEBUG = settings.DEBUG
 
@@ -16,6 +19,15 @@ def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+def get_response_class() -> type[JSONResponse]:
+    if settings.service.JSON_RESPONSE == "orjson":
+        # Optional dependency, fails at startup instead of on the first response
+        import orjson  # noqa: F401
+
+        return ORJSONResponse
+    return JSONResponse
+
+
 api_description = """
 ## Login Instructions
 2. **Request OTP Code**: To log in, request an OTP code by posting to `login/code/` with your phone number.
@@ -29,6 +41,7 @@ app = FastAPI(
     if DEBUG
     else None,
     generate_unique_id_function=custom_generate_unique_id,
+    default_response_class=get_response_class(),
     docs_url=f"{settings.service.API_PREFIX}/docs"
     if DEBUG
     else None,
@@ -36,3 +49,6 @@ app = FastAPI(
 )
 
 app.include_router(api_router, prefix=settings.service.API_PREFIX)
+app.include_router(metrics.router, tags=["metrics"])
+# DB, redis and serialization time of every request, as Server-Timing in DEBUG
+app.add_middleware(TimingMiddleware, server_timing=DEBUG)
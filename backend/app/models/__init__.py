@@ -7,5 +7,8 @@ from .image import Image
 from .user import User
 from .todo import Todo
 from .invite import Invite
+from .todo_change import TodoChange
+from .todo_change_seq import TodoChangeSeq
+from .todo_counter import TodoCounter
 
 from .association_tables import TodoUserLink
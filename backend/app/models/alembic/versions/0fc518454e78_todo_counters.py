@@ -0,0 +1,44 @@
+"""todo_counters
+
+Revision ID: 0fc518454e78
+Revises: 9a3ecfca05cb
+Create Date: 2026-10-18 16:49:23.240286
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0fc518454e78'
+down_revision: Union[str, None] = '9a3ecfca05cb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('todo_counters',
+    sa.Column('user_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    # The type exists already, created with todos.status
+    sa.Column('status', postgresql.ENUM('NEW', 'IN_PROGRESS', 'DONE', name='todostatus', create_type=False), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'status')
+    )
+    # Counts of the existing todos, kept by the writes from now on
+    op.execute(
+        """
+        INSERT INTO todo_counters (user_id, status, count)
+        SELECT todouserlink.user_id, todos.status, count(*)
+        FROM todouserlink JOIN todos ON todos.id = todouserlink.todo_id
+        WHERE todos.is_active
+        GROUP BY todouserlink.user_id, todos.status
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('todo_counters')
@@ -0,0 +1,29 @@
+"""todo_search
+
+Revision ID: 9a3ecfca05cb
+Revises: a91c3e5f0b24
+Create Date: 2026-10-18 16:40:57.890925
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '9a3ecfca05cb'
+down_revision: Union[str, None] = 'a91c3e5f0b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A stored generated column rewrites the table, todos are locked meanwhile
+    op.add_column('todos', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))", persisted=True), nullable=True))
+    op.create_index('ix_todos_search_vector', 'todos', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_todos_search_vector', table_name='todos', postgresql_using='gin')
+    op.drop_column('todos', 'search_vector')
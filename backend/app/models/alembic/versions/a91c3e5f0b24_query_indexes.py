@@ -0,0 +1,46 @@
+"""query_indexes
+
+Revision ID: a91c3e5f0b24
+Revises: e7f2c4a91d30
+Create Date: 2026-10-18 18:20:14.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a91c3e5f0b24'
+down_revision: Union[str, None] = 'e7f2c4a91d30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Duplicate pending invites would fail the unique index, the newest one is kept
+    op.execute(
+        """
+        UPDATE invites SET is_active = false
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY todo_id, user_id ORDER BY modified_at DESC, id DESC
+                ) AS position
+                FROM invites
+                WHERE is_active
+            ) AS ranked
+            WHERE position > 1
+        )
+        """
+    )
+    op.create_index('ix_users_phone', 'users', ['phone'], unique=False)
+    op.create_index('ix_todouserlink_todo_id_user_id', 'todouserlink', ['todo_id', 'user_id'], unique=False)
+    op.create_index('ix_invites_todo_id_user_id', 'invites', ['todo_id', 'user_id'], unique=True, postgresql_where=sa.text('is_active'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_invites_todo_id_user_id', table_name='invites', postgresql_where=sa.text('is_active'))
+    op.drop_index('ix_todouserlink_todo_id_user_id', table_name='todouserlink')
+    op.drop_index('ix_users_phone', table_name='users')
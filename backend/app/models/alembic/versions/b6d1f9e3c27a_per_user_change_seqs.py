@@ -0,0 +1,74 @@
+"""per_user_change_seqs
+
+Revision ID: b6d1f9e3c27a
+Revises: 0fc518454e78
+Create Date: 2026-10-18 19:32:08.517406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d1f9e3c27a'
+down_revision: Union[str, None] = '0fc518454e78'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('todo_change_seqs',
+    sa.Column('user_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+    sa.Column('seq', sa.BigInteger(), nullable=False),
+    sa.Column('pruned_seq', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # The kept seqs stay valid. What was pruned before is only known globally:
+    # below the oldest kept change, or every seq handed out when none is kept.
+    # Every user starts at least there, so the seq of its todos page never
+    # falls below pruned_seq
+    op.execute(
+        """
+        WITH pruned AS (
+            SELECT coalesce(
+                (SELECT min(seq) - 1 FROM todo_changes),
+                (SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END
+                 FROM todo_changes_seq_seq)
+            ) AS seq
+        )
+        INSERT INTO todo_change_seqs (user_id, seq, pruned_seq)
+        SELECT users.id, greatest(max(todo_changes.seq), pruned.seq), pruned.seq
+        FROM users
+        CROSS JOIN pruned
+        LEFT JOIN todo_changes ON todo_changes.user_id = users.id
+        GROUP BY users.id, pruned.seq
+        """
+    )
+    op.drop_index('ix_todo_changes_user_id_seq', table_name='todo_changes')
+    op.drop_constraint('todo_changes_pkey', 'todo_changes', type_='primary')
+    op.execute("ALTER TABLE todo_changes ALTER COLUMN seq DROP DEFAULT")
+    op.execute("DROP SEQUENCE todo_changes_seq_seq")
+    op.create_primary_key('todo_changes_pkey', 'todo_changes', ['user_id', 'seq'])
+
+
+def downgrade() -> None:
+    # Per-user seqs repeat across users, so the log is dropped. Global seqs
+    # continue above every handed out one, no resuming client skips them
+    op.execute("DELETE FROM todo_changes")
+    op.drop_constraint('todo_changes_pkey', 'todo_changes', type_='primary')
+    op.execute("CREATE SEQUENCE todo_changes_seq_seq OWNED BY todo_changes.seq")
+    op.execute(
+        "SELECT setval('todo_changes_seq_seq', "
+        "(SELECT coalesce(max(seq), 0) + 1 FROM todo_change_seqs), false)"
+    )
+    op.execute(
+        "ALTER TABLE todo_changes ALTER COLUMN seq "
+        "SET DEFAULT nextval('todo_changes_seq_seq')"
+    )
+    op.create_primary_key('todo_changes_pkey', 'todo_changes', ['seq'])
+    op.create_index('ix_todo_changes_user_id_seq', 'todo_changes', ['user_id', 'seq'], unique=False)
+    op.drop_table('todo_change_seqs')
@@ -1,9 +1,16 @@
 import uuid
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
 class TodoUserLink(SQLModel, table=True):
+    __table_args__ = (
+        # The primary key leads with user_id, this one serves the members of
+        # a todo (selectinload of Todo.users) from the index alone
+        Index('ix_todouserlink_todo_id_user_id', 'todo_id', 'user_id'),
+    )
+
     user_id: uuid.UUID | None = Field(
         default=None, foreign_key="users.id", primary_key=True
     )
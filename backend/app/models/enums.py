@@ -5,3 +5,9 @@ class TodoStatus(PythonEnum):
     NEW = 'new'
     IN_PROGRESS = 'in_progress'
     DONE = 'done'
+
+
+class TodoChangeOp(PythonEnum):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
@@ -1,4 +1,4 @@
-from sqlmodel import Column, Field, LargeBinary
+from sqlmodel import Field
 
 from .helpers.base_model import BaseSQLModel
 from .helpers.mixins import ModifiedAtMixin
@@ -8,4 +8,6 @@ class Image(BaseSQLModel, ModifiedAtMixin, table=True):
     __tablename__ = 'images'
 
     blur_hash: str
-    binary: bytes = Field(default_factory=bytes, sa_column=Column(LargeBinary))
+    # Content lives in the blob store (app.core.storage) under this key
+    blob_key: str | None = Field(default=None, nullable=True)
+    size: int = 0
@@ -1,6 +1,7 @@
 import uuid
 from typing import Optional
 
+from sqlalchemy import Index, text
 from sqlmodel import Field, Relationship
 
 from .helpers.base_model import BaseSQLModel
@@ -9,12 +10,27 @@ from .helpers.mixins import ModifiedAtMixin
 
 class Invite(BaseSQLModel, ModifiedAtMixin, table=True):
     __tablename__ = 'invites'
+    __table_args__ = (
+        # Keyset pagination of the user's active invites
+        Index(
+            'ix_invites_user_id_modified_at_id',
+            'user_id', 'modified_at', 'id',
+            postgresql_where=text('is_active'),
+        ),
+        # One pending invite per user and todo, also serves get_unique_invite
+        Index(
+            'ix_invites_todo_id_user_id',
+            'todo_id', 'user_id',
+            unique=True,
+            postgresql_where=text('is_active'),
+        ),
+    )
 
     user_id: uuid.UUID | None = Field(
         default=None, foreign_key="users.id"
     )
     user: Optional["User"] = Relationship(
-        sa_relationship_kwargs=dict(foreign_keys="[Invite.user_id]")
+        sa_relationship_kwargs=dict(foreign_keys="[Invite.user_id]", lazy="raise_on_sql")
     )
     owner_id: uuid.UUID | None = Field(
         default=None, foreign_key="users.id"
@@ -25,4 +41,6 @@ class Invite(BaseSQLModel, ModifiedAtMixin, table=True):
     todo_id: uuid.UUID | None = Field(
         default=None, foreign_key="todos.id"
     )
-    todo: Optional["Todo"] = Relationship()
+    todo: Optional["Todo"] = Relationship(
+        sa_relationship_kwargs=dict(lazy="raise_on_sql")
+    )
@@ -1,3 +1,5 @@
+from sqlalchemy import Column, Computed, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlmodel import Relationship
 
 from . import TodoStatus
@@ -5,13 +7,40 @@ from .association_tables import TodoUserLink
 from .helpers.base_model import BaseSQLModel
 from .helpers.mixins import ModifiedAtMixin
 
+# Text search configuration of the search vector and of the queries against
+# it. "simple" does no stemming, titles are in any language
+SEARCH_CONFIG = 'simple'
+
 
 class Todo(BaseSQLModel, ModifiedAtMixin, table=True):
     __tablename__ = 'todos'
+    __table_args__ = (
+        # Keyset pagination order, see crud.common.paginate
+        Index('ix_todos_modified_at_id', 'modified_at', 'id'),
+    )
 
     title: str
     description: str | None = None
     status: TodoStatus = TodoStatus.NEW
 
-    users: list["User"] = Relationship(back_populates="todos", link_model=TodoUserLink)
+    users: list["User"] = Relationship(
+        back_populates="todos",
+        link_model=TodoUserLink,
+        sa_relationship_kwargs=dict(lazy="raise_on_sql"),
+    )
     invites: list["Invite"] = Relationship(back_populates="todo")
+
+
+# Kept up to date by Postgres and only filtered on, so it is left out of the
+# mapping: the todos are loaded and written without it
+search_vector = Column(
+    'search_vector',
+    TSVECTOR,
+    Computed(
+        f"to_tsvector('{SEARCH_CONFIG}', "
+        "coalesce(title, '') || ' ' || coalesce(description, ''))",
+        persisted=True,
+    ),
+)
+Todo.__table__.append_column(search_vector)
+Index('ix_todos_search_vector', search_vector, postgresql_using='gin')
@@ -0,0 +1,28 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import BigInteger
+from sqlmodel import JSON, Column, Field, SQLModel
+
+from . import TodoChangeOp
+
+
+class TodoChange(SQLModel, table=True):
+    """
+    Change log of todos, a row per change and affected user.
+
+    seq counts the changes of one user, taken from its TodoChangeSeq row.
+    Websocket clients resume from the last seq they have seen, the primary
+    key serves the replay.
+    """
+    __tablename__ = 'todo_changes'
+
+    user_id: uuid.UUID = Field(foreign_key="users.id", primary_key=True)
+    seq: int = Field(
+        sa_column=Column(BigInteger(), primary_key=True, autoincrement=False),
+    )
+    todo_id: uuid.UUID = Field(foreign_key="todos.id")
+    op: TodoChangeOp
+    # Full TodoOut on create, changed fields only on update, empty on delete
+    data: dict = Field(default_factory=dict, sa_type=JSON)
+    created_at: datetime = Field(default_factory=datetime.now, nullable=False)
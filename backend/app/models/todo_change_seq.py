@@ -0,0 +1,20 @@
+import uuid
+
+from sqlalchemy import BigInteger
+from sqlmodel import Column, Field, SQLModel
+
+
+class TodoChangeSeq(SQLModel, table=True):
+    """
+    Change log position of a user, see crud.todo_changes.
+
+    seq is the last one handed out to the user's changes. The row stays
+    locked by the write that took it until commit, so the changes of a user
+    commit in seq order. pruned_seq is the highest one removed by pruning.
+    A user without a row has no changes yet.
+    """
+    __tablename__ = 'todo_change_seqs'
+
+    user_id: uuid.UUID = Field(foreign_key="users.id", primary_key=True)
+    seq: int = Field(default=0, sa_column=Column(BigInteger(), nullable=False))
+    pruned_seq: int = Field(default=0, sa_column=Column(BigInteger(), nullable=False))
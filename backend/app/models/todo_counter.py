@@ -0,0 +1,22 @@
+import uuid
+
+from sqlmodel import Field, Relationship, SQLModel
+
+from . import TodoStatus
+
+
+class TodoCounter(SQLModel, table=True):
+    """
+    Active todos of a user in one status, kept by the writes themselves.
+
+    Updated in the transaction of every todo write, see crud.todo_counters.
+    A user without a row for a status has no todos in it.
+    """
+    __tablename__ = 'todo_counters'
+
+    user_id: uuid.UUID = Field(foreign_key="users.id", primary_key=True)
+    status: TodoStatus = Field(primary_key=True)
+    count: int = 0
+
+    # Inserted after its user when both are new, the flush orders by relationships
+    user: "User" = Relationship(sa_relationship_kwargs=dict(lazy="raise_on_sql"))
@@ -1,7 +1,7 @@
 import uuid
 from typing import Optional
 
-from sqlalchemy import BigInteger
+from sqlalchemy import BigInteger, Index
 from sqlmodel import Column, Field, Relationship
 
 from app.models.image import Image
@@ -13,6 +13,10 @@ from .helpers.mixins import ModifiedAtMixin
 
 class User(BaseSQLModel, ModifiedAtMixin, table=True):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Login, get_user_by_phone
+        Index('ix_users_phone', 'phone'),
+    )
 
     phone: int = Field(sa_column=Column(BigInteger()))
     email: str | None = Field(index=True, nullable=True, unique=True)
@@ -21,7 +25,9 @@ class User(BaseSQLModel, ModifiedAtMixin, table=True):
     profile_image_id: uuid.UUID | None = Field(
         default=None, foreign_key="images.id", nullable=True
     )
-    profile_image: Optional["Image"] = Relationship()
+    profile_image: Optional["Image"] = Relationship(
+        sa_relationship_kwargs=dict(lazy="raise_on_sql")
+    )
 
     todos: list["Todo"] = Relationship(
         back_populates="users",
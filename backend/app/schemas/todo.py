@@ -1,9 +1,10 @@
 import uuid
 from datetime import datetime
+from typing import Annotated, Literal
 
-from sqlmodel import SQLModel
+from sqlmodel import Field, SQLModel
 
-from app.models import TodoStatus
+from app.models import TodoChangeOp, TodoStatus
 
 from .user import UserOut
 from .utils import PaginatedOut
@@ -28,6 +29,56 @@ class TodoOut(SQLModel):
     modified_at: datetime
 
 
+# Query parameters of GET /todos/, all of them optional
+class TodoFilter(SQLModel):
+    # Any of these
+    status: list[TodoStatus] | None = None
+    # Full-text query over title and description in web search syntax:
+    # words, "quoted phrases", OR and -excluded words
+    q: str | None = None
+    modified_after: datetime | None = None
+    modified_before: datetime | None = None
+    # By modified_at, "desc" lists the last modified first
+    order: Literal["asc", "desc"] = "asc"
+
+
+class TodoSummaryOut(SQLModel):
+    # Active todos of the user in every status, zero included
+    counts: dict[TodoStatus, int]
+    total: int
+
+
+class TodoBatchCreate(SQLModel):
+    op: Literal["create"]
+    data: TodoCreate
+
+
+class TodoBatchUpdate(SQLModel):
+    op: Literal["update"]
+    id: uuid.UUID
+    data: TodoUpdate
+
+
+class TodoBatchDelete(SQLModel):
+    op: Literal["delete"]
+    id: uuid.UUID
+
+
+class TodoBatchIn(SQLModel):
+    # Applied in order, all or none
+    operations: list[
+        Annotated[
+            TodoBatchCreate | TodoBatchUpdate | TodoBatchDelete,
+            Field(discriminator="op"),
+        ]
+    ]
+
+
+class TodoBatchOut(SQLModel):
+    # One per operation: the todo as the batch left it, None for deletes
+    data: list[TodoOut | None]
+
+
 class TodoOutShort(SQLModel):
     id: uuid.UUID
     title: str
@@ -36,3 +87,21 @@ class TodoOutShort(SQLModel):
 
 class TodosOut(PaginatedOut):
     data: list[TodoOut]
+    # Last change the first page includes, pass as `since` to /todos/ws
+    seq: int | None = None
+
+
+# Delta frame of the todos websocket, sent to clients that resume with `since`
+class TodoChangeOut(SQLModel):
+    seq: int
+    op: TodoChangeOp
+    id: uuid.UUID
+    # Full TodoOut on create, changed fields only on update, empty on delete
+    data: dict
+
+
+# Sent after a replay: "synced" up to seq, or "reset" when the missed changes
+# are no longer kept and the todos have to be reloaded
+class TodoSyncOut(SQLModel):
+    op: Literal["synced", "reset"]
+    seq: int
@@ -1,4 +1,5 @@
 import uuid
+from datetime import datetime
 
 from sqlmodel import SQLModel
 
@@ -14,6 +15,8 @@ class TokenGuest(SQLModel):
 # Contents of JWT token
 class TokenPayload(SQLModel):
     id: uuid.UUID
+    # Expiry as a unix timestamp, set on verified tokens
+    exp: float | None = None
 
 
 # Generic message
@@ -23,11 +26,22 @@ class Message(SQLModel):
 
 class PaginatedOut(SQLModel):
     count: int
-    total: int
+    # Counted only when requested with `with_total=true`
+    total: int | None = None
     limit: int
     skip: int
+    # Pass as `cursor` to get the next page, None on the last page
+    next_cursor: str | None = None
+
+
+# Decoded keyset position, the last (modified_at, id) seen by the client
+class PageCursor(SQLModel):
+    modified_at: datetime
+    id: uuid.UUID
 
 
 class PageParams(SQLModel):
     limit: int
     skip: int
+    cursor: PageCursor | None = None
+    with_total: bool = False
@@ -0,0 +1,39 @@
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.storage import blob_store, content_key
+from app.models import Image
+from app.tests.utils import session_maker
+
+BLUR_HASH = "L00000fQfQfQfQfQfQfQfQfQfQfQ"
+
+
+async def create_image(connection: AsyncConnection, blob_key: str, size: int) -> Image:
+    async with session_maker(connection)() as session:
+        image = Image(blur_hash=BLUR_HASH, blob_key=blob_key, size=size)
+        session.add(image)
+        await session.commit()
+    return image
+
+
+@pytest.mark.anyio
+async def test_read_image(client: httpx.AsyncClient, connection: AsyncConnection) -> None:
+    data = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+    image = await create_image(connection, await blob_store.put(data), len(data))
+
+    response = await client.get(f"/images/{image.id}")
+
+    assert response.status_code == 200
+    assert response.content == data
+
+
+@pytest.mark.anyio
+async def test_read_image_missing_blob(
+        client: httpx.AsyncClient, connection: AsyncConnection
+) -> None:
+    image = await create_image(connection, content_key(b"never stored"), 12)
+
+    response = await client.get(f"/images/{image.id}")
+
+    assert response.status_code == 404
@@ -0,0 +1,138 @@
+"""
+SQL statements every endpoint issues, against a budget.
+
+The data is seeded twice, with a small and a large number of todos. A route
+fails if it issues more statements than its budget or if its count grows
+with the data (an N+1).
+"""
+from collections.abc import AsyncGenerator
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_engine, redis_db
+from app.core.storage import blob_store
+from app.crud import users as users_crud
+from app.models import Image, Invite, Todo, User
+from app.tests.utils import api_client, login, rolled_back_connection, session_maker
+
+SMALL, LARGE = 5, 50
+MEMBERS_PER_TODO = 3
+
+# method, path, request headers, statements budget.
+# The current user is cached by the first request, the routes do not load it
+ROUTES = [
+    ("GET", "/users/me", {}, 0),
+    ("GET", "/todos/", {}, 3),
+    ("GET", "/todos/?with_total=true", {}, 4),
+    ("GET", "/todos/?cursor={cursor}", {}, 2),
+    ("GET", "/todos/?q=todo&status=new&order=desc", {}, 3),
+    ("GET", "/todos/summary", {}, 1),
+    ("GET", "/todos/{todo_id}", {}, 2),
+    ("PUT", "/todos/{todo_id}", {}, 5),
+    ("GET", "/todos/invites/", {}, 1),
+    ("GET", "/images/{image_id}", {}, 1),
+    ("GET", "/images/{image_id}", {"If-None-Match": '"{image_id}"'}, 0),
+]
+
+# Transaction control of the outer transaction is not part of the route
+IGNORED_PREFIXES = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+def route_name(method: str, path: str, headers: dict[str, str]) -> str:
+    return " ".join([method, path, *headers])
+
+
+class StatementCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if not statement.lstrip().upper().startswith(IGNORED_PREFIXES):
+            self.count += 1
+
+
+async def seed(session: AsyncSession, todos_count: int, phone_base: int) -> dict[str, str]:
+    # Content-addressed, stored once and shared by every seeded image
+    blob_key = await blob_store.put(b"\x00" * 1024)
+    members = [
+        User(
+            phone=phone_base + i + 1,
+            profile_image=Image(blur_hash="L00000fQfQfQfQfQfQfQfQfQfQfQ", blob_key=blob_key, size=1024),
+        )
+        for i in range(MEMBERS_PER_TODO)
+    ]
+    owner_image = Image(blur_hash="L00000fQfQfQfQfQfQfQfQfQfQfQ", blob_key=blob_key, size=1024)
+    owner = User(phone=phone_base, profile_image=owner_image)
+    todos = [
+        Todo(title=f"Todo {i}", users=[owner, *members]) for i in range(todos_count)
+    ]
+    invites = [Invite(todo=todo, user=owner, owner=members[0]) for todo in todos]
+    session.add_all([owner, *members, *todos, *invites])
+    await session.commit()
+
+    return {
+        "user_id": str(owner.id),
+        "todo_id": str(todos[0].id),
+        "image_id": str(owner_image.id),
+    }
+
+
+async def measure(
+    connection: AsyncConnection, counter: StatementCounter, todos_count: int, phone_base: int
+) -> dict[str, int]:
+    async with session_maker(connection)() as session:
+        ids = await seed(session, todos_count, phone_base)
+
+    counts = {}
+    async with api_client(connection) as client:
+        login(client, ids["user_id"])
+        first_page = await client.get("/todos/", params={"limit": 2})
+        ids["cursor"] = first_page.json()["next_cursor"]
+
+        for method, path, headers, _budget in ROUTES:
+            url = path.format(**ids)
+            request_headers = {name: value.format(**ids) for name, value in headers.items()}
+            body = {"title": "Updated"} if method == "PUT" else None
+            counter.count = 0
+            response = await client.request(method, url, json=body, headers=request_headers)
+            assert response.status_code < 400, f"{method} {url}: {response.text}"
+            counts[route_name(method, path, headers)] = counter.count
+
+    # The seeded user is rolled back, its cached record must not outlive it
+    await users_crud.invalidate_cached_user(ids["user_id"], redis_db)
+    return counts
+
+
+@pytest.fixture(scope="module")
+async def counts() -> AsyncGenerator[dict[int, dict[str, int]], None]:
+    counter = StatementCounter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", counter)
+    try:
+        async with rolled_back_connection() as connection:
+            yield {
+                SMALL: await measure(connection, counter, SMALL, 70000000000),
+                LARGE: await measure(connection, counter, LARGE, 70000001000),
+            }
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", counter)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    ("method", "path", "headers", "budget"),
+    ROUTES,
+    ids=[route_name(method, path, headers) for method, path, headers, _ in ROUTES],
+)
+async def test_query_count(
+        counts: dict[int, dict[str, int]],
+        method: str,
+        path: str,
+        headers: dict[str, str],
+        budget: int,
+) -> None:
+    key = route_name(method, path, headers)
+    assert counts[LARGE][key] == counts[SMALL][key], "grows with data"
+    assert counts[LARGE][key] <= budget, "over budget"
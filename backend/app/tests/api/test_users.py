@@ -0,0 +1,96 @@
+import io
+import multiprocessing
+import os
+import struct
+import zlib
+from collections.abc import AsyncGenerator
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import httpx
+import pytest
+from PIL import Image as ImagePIL
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core import image_processing
+from app.core.config import settings
+from app.core.db import redis_db
+from app.crud import users as users_crud
+from app.models import User
+from app.tests.utils import login, session_maker
+
+
+@pytest.fixture
+async def user(
+        client: httpx.AsyncClient, connection: AsyncConnection
+) -> AsyncGenerator[User, None]:
+    async with session_maker(connection)() as session:
+        user = User(phone=71000000000)
+        session.add(user)
+        await session.commit()
+    login(client, user.id)
+    yield user
+    # The user is rolled back, its cached record must not outlive it
+    await users_crud.invalidate_cached_user(user.id, redis_db)
+
+
+def png(*chunks: tuple[bytes, bytes]) -> bytes:
+    """A valid PNG, with extra chunks after its header."""
+    buffer = io.BytesIO()
+    ImagePIL.new("RGB", (64, 48), (200, 10, 10)).save(buffer, format="PNG")
+    data = buffer.getvalue()
+    # Signature and IHDR come first, 8 + 25 bytes
+    extra = b"".join(
+        struct.pack(">I", len(body)) + name + body + struct.pack(">I", zlib.crc32(name + body))
+        for name, body in chunks
+    )
+    return data[:33] + extra + data[33:]
+
+
+async def upload(client: httpx.AsyncClient, data: bytes) -> httpx.Response:
+    return await client.post("/users/me/image", files={"file": ("image.png", data, "image/png")})
+
+
+@pytest.mark.anyio
+async def test_set_profile_image(client: httpx.AsyncClient, user: User) -> None:
+    response = await upload(client, png())
+
+    assert response.status_code == 200, response.text
+    assert response.json()["profile_image"]["blur_hash"]
+
+
+@pytest.mark.anyio
+async def test_set_profile_image_corrupt(client: httpx.AsyncClient, user: User) -> None:
+    # Valid magic bytes and header, EXIF that is not TIFF data
+    response = await upload(client, png((b"eXIf", b"garbage!")))
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Can not read image"}
+
+
+@pytest.mark.anyio
+async def test_set_profile_image_broken_pool(
+        client: httpx.AsyncClient, user: User, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    broken = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    with pytest.raises(BrokenProcessPool):
+        broken.submit(os._exit, 1).result()
+    monkeypatch.setattr(image_processing, "_executor", broken)
+
+    response = await upload(client, png())
+
+    assert response.status_code == 503
+    # The next upload gets a new pool
+    assert image_processing._executor is None
+    response = await upload(client, png())
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.anyio
+async def test_delete_user_me(client: httpx.AsyncClient, user: User) -> None:
+    response = await client.delete("/users/me")
+
+    assert response.status_code == 200, response.text
+    # The session cookie is removed
+    assert f'{settings.security.JWT_COOKIE_NAME}=""' in response.headers["set-cookie"]
+    assert "Max-Age=0" in response.headers["set-cookie"]
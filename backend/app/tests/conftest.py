@@ -0,0 +1,40 @@
+import os
+from collections.abc import AsyncGenerator
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Before the app is imported, settings are read once. CONFIG_NAME set in
+# the environment, e.g. by CI, wins over the config next to the tests
+os.environ.setdefault("CONFIG_NAME", str(Path(__file__).parent / "config.yaml"))
+
+from app.core.db import async_engine, redis_db  # noqa: E402
+from app.tests.utils import api_client, rolled_back_connection  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(scope="session", autouse=True)
+async def pools(anyio_backend: str) -> AsyncGenerator[None, None]:
+    # Keeps one event loop for the whole run, connections in the engine
+    # and redis pools are bound to the loop that opened them
+    yield
+    await async_engine.dispose()
+    await redis_db.aclose()
+
+
+@pytest.fixture
+async def connection() -> AsyncGenerator[AsyncConnection, None]:
+    async with rolled_back_connection() as connection:
+        yield connection
+
+
+@pytest.fixture
+async def client(connection: AsyncConnection) -> AsyncGenerator[httpx.AsyncClient, None]:
+    async with api_client(connection) as client:
+        yield client
@@ -0,0 +1,251 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from typing import Any
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+from jose import JWTError, jwt
+
+from app.core import security
+from app.core.cache import BloomFilter
+from app.core.config import settings
+from app.schemas.utils import TokenPayload
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def sign(header: dict[str, Any], claims: dict[str, Any]) -> str:
+    """Token signed with HMAC-SHA256, whatever alg its header names."""
+    signing_input = f"{b64(json.dumps(header).encode())}.{b64(json.dumps(claims).encode())}"
+    signature = hmac.new(
+        settings.security.SECRET_KEY.encode(), signing_input.encode(), hashlib.sha256
+    ).digest()
+    return f"{signing_input}.{b64(signature)}"
+
+
+def claims(**extra: Any) -> dict[str, Any]:
+    return {"exp": int(time.time()) + 3600, "id": str(uuid.uuid4()), **extra}
+
+
+@pytest.fixture(params=["builtin", "jose"])
+def jwt_backend(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> str:
+    monkeypatch.setattr(settings.security, "JWT_BACKEND", request.param)
+    return request.param
+
+
+def test_decode_hs256_matches_jose() -> None:
+    tokens = [
+        security.create_access_token(TokenPayload(id=uuid.uuid4())),
+        jwt.encode(claims(), settings.security.SECRET_KEY, algorithm="HS256"),
+        jwt.encode(
+            claims(sub="user", nested={"a": [1, 2]}, exp=time.time() + 60.5),
+            settings.security.SECRET_KEY,
+            algorithm="HS256",
+        ),
+    ]
+    for token in tokens:
+        assert security.decode_hs256(token) == jwt.decode(
+            token, settings.security.SECRET_KEY, algorithms=["HS256"]
+        )
+
+
+def test_verify_access_token_same_for_both_backends(monkeypatch: pytest.MonkeyPatch) -> None:
+    token = security.create_access_token(TokenPayload(id=uuid.uuid4()))
+    verified = []
+    for backend in ("builtin", "jose"):
+        monkeypatch.setattr(settings.security, "JWT_BACKEND", backend)
+        verified.append(security.verify_access_token(token))
+    assert verified[0] == verified[1]
+    assert verified[0].revocation_key == security.token_digest(token.rpartition(".")[0])
+
+
+def test_tampered_signature(jwt_backend: str) -> None:
+    token = sign({"alg": "HS256", "typ": "JWT"}, claims())
+    signing_input, _, signature = token.rpartition(".")
+    flipped = signature[:-2] + ("A" if signature[-2] != "A" else "B") + signature[-1]
+    with pytest.raises(JWTError):
+        security.verify_access_token(f"{signing_input}.{flipped}")
+
+
+def test_tampered_payload(jwt_backend: str) -> None:
+    token = sign({"alg": "HS256", "typ": "JWT"}, claims())
+    header, _, signature = token.split(".")
+    forged = b64(json.dumps(claims()).encode())
+    with pytest.raises(JWTError):
+        security.verify_access_token(f"{header}.{forged}.{signature}")
+
+
+@pytest.mark.parametrize("alg", ["HS384", "HS512", "RS256", "none", None])
+def test_other_alg(jwt_backend: str, alg: str | None) -> None:
+    # Signed as HS256 would be, only the header tells them apart
+    header = {"typ": "JWT"} if alg is None else {"alg": alg, "typ": "JWT"}
+    with pytest.raises(JWTError):
+        security.verify_access_token(sign(header, claims()))
+
+
+def test_alg_none_unsigned(jwt_backend: str) -> None:
+    header = b64(json.dumps({"alg": "none", "typ": "JWT"}).encode())
+    payload = b64(json.dumps(claims()).encode())
+    for token in (f"{header}.{payload}.", f"{header}.{payload}"):
+        with pytest.raises(JWTError):
+            security.verify_access_token(token)
+
+
+def test_expired(jwt_backend: str) -> None:
+    token = sign({"alg": "HS256", "typ": "JWT"}, claims(exp=int(time.time()) - 1))
+    with pytest.raises(JWTError):
+        security.verify_access_token(token)
+
+
+def test_missing_exp(jwt_backend: str) -> None:
+    token_claims = claims()
+    del token_claims["exp"]
+    with pytest.raises(JWTError):
+        security.verify_access_token(sign({"alg": "HS256", "typ": "JWT"}, token_claims))
+
+
+def test_missing_exp_builtin() -> None:
+    token_claims = claims()
+    del token_claims["exp"]
+    with pytest.raises(JWTError, match="Invalid claims"):
+        security.decode_hs256(sign({"alg": "HS256", "typ": "JWT"}, token_claims))
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "",
+        "abc",
+        "abc.def",
+        "a.b.c.d",
+        "....",
+        "not base64!.not base64!.not base64!",
+        "é.é.é",
+    ],
+)
+def test_malformed(jwt_backend: str, token: str) -> None:
+    with pytest.raises(JWTError):
+        security.verify_access_token(token)
+
+
+def test_wrong_segment_count_validly_signed() -> None:
+    # A valid signature over two segments, or over three of them
+    key = settings.security.SECRET_KEY.encode()
+    header = b64(json.dumps({"alg": "HS256"}).encode())
+    payload = b64(json.dumps(claims()).encode())
+    for signing_input in (header, f"{header}.{payload}.{payload}"):
+        signature = b64(hmac.new(key, signing_input.encode(), hashlib.sha256).digest())
+        with pytest.raises(JWTError):
+            security.decode_hs256(f"{signing_input}.{signature}")
+
+
+def test_bad_base64_validly_signed() -> None:
+    key = settings.security.SECRET_KEY.encode()
+    header = b64(json.dumps({"alg": "HS256"}).encode())
+    payload = b64(json.dumps(claims()).encode())
+    for signing_input in (f"{header[:-1]}.{payload}", f"{header}.{payload[:-1]}*"):
+        signature = b64(hmac.new(key, signing_input.encode(), hashlib.sha256).digest())
+        with pytest.raises(JWTError):
+            security.decode_hs256(f"{signing_input}.{signature}")
+
+
+def test_claims_not_an_object() -> None:
+    with pytest.raises(JWTError):
+        security.decode_hs256(sign({"alg": "HS256"}, ["exp"]))  # type: ignore[arg-type]
+
+
+def test_bloom_filter() -> None:
+    bloom = BloomFilter(1 << 16)
+    added = [hashlib.sha256(f"added {i}".encode()).digest() for i in range(100)]
+    for digest in added:
+        bloom.add(digest)
+    assert all(digest in bloom for digest in added)
+    others = [hashlib.sha256(f"other {i}".encode()).digest() for i in range(100)]
+    assert not any(digest in bloom for digest in others)
+
+
+class Broker:
+    def __init__(self) -> None:
+        self.published: list[tuple[str, str]] = []
+
+    async def publish(self, message: str, channel: str) -> None:
+        self.published.append((message, channel))
+
+
+@pytest.fixture
+async def revocations(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(security, "redis_db", FakeRedis(decode_responses=True))
+    revocations = security.TokenRevocations()
+    yield revocations
+    if revocations._syncer is not None:
+        revocations._syncer.cancel()
+
+
+@pytest.mark.anyio
+async def test_revoked_token(revocations: security.TokenRevocations) -> None:
+    broker = Broker()
+    revoked = hashlib.sha256(b"revoked").digest()
+    await revocations.revoke(broker, revoked, time.time() + 60)  # type: ignore[arg-type]
+    assert await revocations.is_revoked(revoked)
+    assert broker.published == [(revoked.hex(), security.TOKEN_REVOCATIONS_CHANNEL)]
+    assert not await revocations.is_revoked(hashlib.sha256(b"not revoked").digest())
+
+
+@pytest.mark.anyio
+async def test_filter_false_positive_checked_in_redis(
+        revocations: security.TokenRevocations,
+) -> None:
+    await revocations.sync()
+    digest = hashlib.sha256(b"only in the filter").digest()
+    revocations.add(digest)
+    assert digest in revocations.filter
+    assert not await revocations.is_revoked(digest)
+
+
+@pytest.mark.anyio
+async def test_revocations_from_other_workers(revocations: security.TokenRevocations) -> None:
+    # Revoked by another worker before this one synced
+    digest = hashlib.sha256(b"revoked elsewhere").digest()
+    await security.redis_db.zadd(security.REVOKED_TOKENS_KEY, {digest.hex(): time.time() + 60})
+    assert await revocations.is_revoked(digest)
+
+
+@pytest.mark.anyio
+async def test_sync_drops_expired(revocations: security.TokenRevocations) -> None:
+    expired = hashlib.sha256(b"expired").digest()
+    live = hashlib.sha256(b"live").digest()
+    await security.redis_db.zadd(
+        security.REVOKED_TOKENS_KEY,
+        {expired.hex(): time.time() - 1, live.hex(): time.time() + 60},
+    )
+    revocations.add(expired)
+
+    await revocations.sync()
+
+    assert await security.redis_db.zrange(security.REVOKED_TOKENS_KEY, 0, -1) == [live.hex()]
+    assert expired not in revocations.filter
+    assert live in revocations.filter
+    assert await revocations.is_revoked(live)
+    assert not await revocations.is_revoked(expired)
+
+
+@pytest.mark.anyio
+async def test_revoke_access_token(
+        revocations: security.TokenRevocations, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(security, "revocations", revocations)
+    token = security.create_access_token(TokenPayload(id=uuid.uuid4()))
+    verified = security.verify_access_token(token)
+    assert not await revocations.is_revoked(verified.revocation_key)
+
+    await security.revoke_access_token(token, Broker())  # type: ignore[arg-type]
+
+    assert await revocations.is_revoked(verified.revocation_key)
+    # Invalid tokens are ignored
+    await security.revoke_access_token("not a token", Broker())  # type: ignore[arg-type]
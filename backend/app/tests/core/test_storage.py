@@ -0,0 +1,75 @@
+import os
+from collections.abc import AsyncGenerator
+
+import pytest
+
+from app.core.config import settings
+from app.core.storage import BlobStore, LocalBlobStore, S3BlobStore, content_key
+
+
+async def read(store: BlobStore, key: str, start: int, end: int) -> bytes:
+    return b"".join([chunk async for chunk in store.iter_range(key, start, end)])
+
+
+@pytest.fixture
+async def s3_store() -> AsyncGenerator[S3BlobStore, None]:
+    # The S3 endpoint of the test config, a moto server in CI
+    store = S3BlobStore(settings.storage)
+    client = await store._get_client()
+    try:
+        await client.create_bucket(Bucket=store.bucket)
+    except client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    yield store
+    await client.__aexit__(None, None, None)
+
+
+@pytest.fixture
+def local_store(tmp_path: os.PathLike) -> LocalBlobStore:
+    return LocalBlobStore(str(tmp_path))
+
+
+@pytest.fixture(params=["local", "s3"])
+def store(request: pytest.FixtureRequest) -> BlobStore:
+    return request.getfixturevalue(f"{request.param}_store")
+
+
+@pytest.mark.anyio
+async def test_put(store: BlobStore) -> None:
+    data = os.urandom(200 * 1024)
+    key = await store.put(data)
+
+    assert key == content_key(data)
+    assert await store.exists(key)
+    assert await store.put(data) == key
+    assert await read(store, key, 0, len(data)) == data
+    assert await read(store, key, 1000, 70000) == data[1000:70000]
+    assert await read(store, key, 5, 5) == b""
+    assert not await store.exists(content_key(b"never stored"))
+
+
+@pytest.mark.anyio
+async def test_put_file(store: BlobStore) -> None:
+    data = os.urandom(100 * 1024)
+    path = store.staging_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+    key = await store.put_file(path, content_key(data))
+
+    assert not os.path.exists(path)
+    assert await read(store, key, 0, len(data)) == data
+
+
+@pytest.mark.anyio
+async def test_put_file_stored_already(store: BlobStore) -> None:
+    data = os.urandom(1024)
+    key = await store.put(data)
+    path = store.staging_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+    assert await store.put_file(path, key) == key
+    assert not os.path.exists(path)
@@ -0,0 +1,63 @@
+from collections.abc import AsyncGenerator, Callable
+from contextlib import asynccontextmanager
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.deps import get_async_db
+from app.core import security
+from app.core.config import settings
+from app.core.db import async_engine
+from app.main import app
+from app.schemas.utils import TokenPayload
+
+
+@asynccontextmanager
+async def rolled_back_connection() -> AsyncGenerator[AsyncConnection, None]:
+    """Connection in a transaction that is rolled back, whatever is committed on it."""
+    async with async_engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+            yield connection
+        finally:
+            await transaction.rollback()
+
+
+def session_maker(connection: AsyncConnection) -> Callable[[], AsyncSession]:
+    def new_session() -> AsyncSession:
+        # Commits of the session release a savepoint of the outer transaction
+        return AsyncSession(
+            bind=connection,
+            expire_on_commit=False,
+            join_transaction_mode="create_savepoint",
+        )
+
+    return new_session
+
+
+@asynccontextmanager
+async def api_client(connection: AsyncConnection) -> AsyncGenerator[httpx.AsyncClient, None]:
+    """Client of the app, its routes use sessions on connection."""
+    new_session = session_maker(connection)
+
+    # Every request gets its own session, identity map must not hide queries
+    async def get_test_db() -> AsyncGenerator[AsyncSession, None]:
+        async with new_session() as session:
+            yield session
+
+    app.dependency_overrides[get_async_db] = get_test_db
+    try:
+        # Started for the redis broker, writes publish their changes
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url=f"http://test{settings.service.API_PREFIX}",
+        ) as client:
+            yield client
+    finally:
+        app.dependency_overrides.pop(get_async_db)
+
+
+def login(client: httpx.AsyncClient, user_id: object) -> None:
+    token = security.create_access_token(TokenPayload(id=user_id))
+    client.cookies.set(settings.security.JWT_COOKIE_NAME, token)
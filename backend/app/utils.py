@@ -1,9 +1,15 @@
+import base64
+import binascii
+import json
 import logging
 import random
 import re
 import string
+import uuid
+from datetime import datetime
 
 from app.core.config import settings
+from app.schemas.utils import PageCursor
 
 logger = logging.getLogger(__name__)
 
@@ -31,3 +37,20 @@ def send_verification_code(_phone: int) -> str | None:
 
 def validate_phone(str_phone: str | int) -> int:
     return int(re.sub(r"\D", "", str(str_phone)))
+
+
+def encode_cursor(modified_at: datetime, object_id: uuid.UUID) -> str:
+    raw = json.dumps([modified_at.isoformat(), str(object_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> PageCursor | None:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        modified_at, object_id = json.loads(base64.urlsafe_b64decode(padded))
+        return PageCursor(
+            modified_at=datetime.fromisoformat(modified_at),
+            id=uuid.UUID(object_id),
+        )
+    except (binascii.Error, TypeError, ValueError):
+        return None
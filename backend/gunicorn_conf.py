@@ -1,5 +1,44 @@
+import os
+import shutil
+import tempfile
+
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+from app.core.config import settings
+
+# Workers write their metrics to files here and /metrics adds them up.
+# Set before the workers import prometheus_client, it reads it on import
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus")
+)
+
 # Gunicorn config variables
 loglevel = "info"
 workers = 3
 bind = "0.0.0.0:8000"
 errorlog = "-"
+worker_class = "gunicorn_conf.UvicornWorker"
+
+
+class UvicornWorker(BaseUvicornWorker):
+    # Websocket pings detect half-open connections, only the websockets
+    # implementation sends them
+    CONFIG_KWARGS = {
+        **BaseUvicornWorker.CONFIG_KWARGS,
+        "ws": "websockets",
+        "ws_ping_interval": settings.websockets.PING_INTERVAL_SECONDS,
+        "ws_ping_timeout": settings.websockets.PING_TIMEOUT_SECONDS,
+    }
+
+
+def on_starting(server) -> None:
+    # Values of a previous run would be added to the new ones
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def child_exit(server, worker) -> None:
+    from prometheus_client import multiprocess
+
+    # Drops the gauges of the worker, livesum only counts live ones
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,94 @@
+"""
+Cost of authenticating a request, per session token check.
+
+Times security.decode_access_token, the dependency behind CurrentUser,
+against the check it replaced: python-jose on every request. Covers the
+uncached verification with both JWT backends, a cached token with --revoked
+other tokens in the revocation filter, and a revoked token, which is looked
+up in redis. Uses the redis from config.yaml, the revocations it adds are
+removed at the end.
+
+    python -m scripts.bench_auth --iterations 20000 --revoked 10000
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+from fastapi import HTTPException
+from jose import jwt
+
+from app.core import security
+from app.core.config import settings
+from app.core.db import redis_db
+from app.schemas.utils import TokenPayload
+
+
+def decode_with_jose(token: str) -> TokenPayload:
+    """The check before the token cache, run for every request."""
+    payload = jwt.decode(
+        token, settings.security.SECRET_KEY, algorithms=[settings.security.ALGORITHM]
+    )
+    payload["id"] = uuid.UUID(payload["id"])
+    return TokenPayload(**payload)
+
+
+async def measure(check, iterations: int) -> float:
+    """Microseconds per call, awaiting the call when it is a coroutine."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = check()
+        if asyncio.iscoroutine(result):
+            await result
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--revoked", type=int, default=10_000, help="Other revoked tokens")
+    args = parser.parse_args()
+
+    token = security.create_access_token(TokenPayload(id=uuid.uuid4()))
+    revoked = security.create_access_token(TokenPayload(id=uuid.uuid4()))
+    expires_at = time.time() + 3600
+    keys = {os.urandom(32).hex(): expires_at for _ in range(args.revoked)}
+    revoked_key = security.verify_access_token(revoked).revocation_key.hex()
+    keys[revoked_key] = expires_at
+    await redis_db.zadd(security.REVOKED_TOKENS_KEY, keys)
+
+    try:
+        await security.revocations.sync()
+        results = {"jose, every request (before)": await measure(
+            lambda: decode_with_jose(token), args.iterations
+        )}
+        for backend in ("jose", "builtin"):
+            settings.security.JWT_BACKEND = backend
+            results[f"{backend}, uncached"] = await measure(
+                lambda: security.verify_access_token(token), args.iterations
+            )
+        results["cached, not revoked"] = await measure(
+            lambda: security.decode_access_token(token), args.iterations
+        )
+
+        async def check_revoked() -> None:
+            try:
+                await security.decode_access_token(revoked)
+            except HTTPException:
+                pass
+
+        results["cached, revoked (redis)"] = await measure(
+            check_revoked, max(args.iterations // 20, 1)
+        )
+    finally:
+        await redis_db.zrem(security.REVOKED_TOKENS_KEY, *keys)
+        await redis_db.aclose()
+
+    print(f"{args.revoked + 1} revoked tokens, {settings.security.REVOCATION_FILTER_BITS} filter bits")
+    for name, microseconds in results.items():
+        print(f"{name:32} {microseconds:>9.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
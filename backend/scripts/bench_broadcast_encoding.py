@@ -0,0 +1,111 @@
+"""
+Micro-benchmark of the JSON encoding cost of todo broadcasts and responses.
+
+For every fan-out size (number of users a change is sent to) compares
+encoding the event per user and sending it with send_json, which encoded
+it a second time, against encoding it once with encode_event. Then
+compares JSONResponse and ORJSONResponse rendering a page of todos.
+No database or redis is needed.
+
+    python -m scripts.bench_broadcast_encoding --fanout 1 10 100 1000
+"""
+import argparse
+import datetime
+import json
+import timeit
+import uuid
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.core.connections import encode_event
+from app.models import TodoStatus
+from app.schemas.image import ImageOutShort
+from app.schemas.todo import TodoOut, TodosOut
+from app.schemas.user import UserOut
+
+try:
+    import orjson
+except ImportError:  # Optional, the orjson rows are skipped
+    orjson = None
+
+
+def make_todo(members: int) -> TodoOut:
+    return TodoOut(
+        id=uuid.uuid4(),
+        title="Buy groceries for the weekend",
+        description="Milk, bread, eggs, coffee and something for dinner",
+        status=TodoStatus.IN_PROGRESS,
+        users=[
+            UserOut(
+                id=uuid.uuid4(),
+                phone=79000000000 + i,
+                name=f"User {i}",
+                profile_image=ImageOutShort(
+                    id=uuid.uuid4(), blur_hash="L00000fQfQfQfQfQfQfQfQfQfQfQ"
+                ),
+            )
+            for i in range(members)
+        ],
+        modified_at=datetime.datetime.now(),
+    )
+
+
+def per_user(todo: TodoOut, fanout: int) -> None:
+    # Before: model_dump_json in the per-user loop, send_json encoding it again
+    for _ in range(fanout):
+        json.dumps(todo.model_dump_json())
+
+
+def once(todo: TodoOut, fanout: int) -> None:
+    encode_event(todo).decode()
+
+
+def once_orjson(todo: TodoOut, fanout: int) -> None:
+    orjson.dumps(todo.model_dump(mode="json")).decode()
+
+
+def measure(function, *args, number: int) -> float:
+    """Best of 5 runs, microseconds per call."""
+    runs = timeit.repeat(lambda: function(*args), number=number, repeat=5)
+    return min(runs) / number * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fanout", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--members", type=int, default=3, help="Users listed in a todo")
+    parser.add_argument("--page", type=int, default=100, help="Todos in a REST page")
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    todo = make_todo(args.members)
+    cases = [("per user + send_json", per_user), ("once, encode_event", once)]
+    if orjson:
+        cases.append(("once, orjson", once_orjson))
+
+    print(f"broadcast of one change, {len(encode_event(todo))} bytes, us per change")
+    print(f"{'fan-out':>8} " + " ".join(f"{name:>22}" for name, _ in cases))
+    for fanout in args.fanout:
+        number = max(args.number // fanout, 5)
+        timings = [measure(function, todo, fanout, number=number) for _, function in cases]
+        print(f"{fanout:>8} " + " ".join(f"{timing:>22.1f}" for timing in timings))
+
+    page = TodosOut(
+        data=[make_todo(args.members) for _ in range(args.page)],
+        count=args.page,
+        limit=args.page,
+        skip=0,
+    )
+    print(f"\nREST page of {args.page} todos, us per response")
+    response_classes = [JSONResponse] + ([ORJSONResponse] if orjson else [])
+    for response_class in response_classes:
+        # What FastAPI does with a response_model: dump to JSON-able data, then render
+        timing = measure(
+            lambda: response_class(page.model_dump(mode="json")).body,
+            number=args.number // 10 or 1,
+        )
+        print(f"{response_class.__name__:>22} {timing:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
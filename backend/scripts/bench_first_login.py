@@ -0,0 +1,129 @@
+"""
+Measures the database part of a first login: creating the user and seeding
+its greeting todos from settings.content.GREETING_TODOS.
+
+Compares users_crud.get_or_create_user, one transaction and one flush,
+with the seeding it replaced, which committed the user and then every
+todo on its own. Runs against the database from config.yaml, the created
+users and todos are deleted at the end. The OTP check is the same for
+both and is left out.
+
+    python -m scripts.bench_first_login --logins 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import delete, event
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import async_engine
+from app.crud import common
+from app.crud import users as users_crud
+from app.models import Todo, TodoCounter, TodoStatus, TodoUserLink, User
+from app.schemas.user import UserCreate
+
+PHONE_BASE = 79990000000
+
+
+async def create_user_per_commit(session: AsyncSession, phone: int) -> User:
+    """The seeding before: the user and every greeting todo committed on its own."""
+    db_user = await users_crud.get_user_by_phone(
+        session=session, phone=phone, options=users_crud.USER_OUT_OPTIONS
+    )
+    if not db_user:
+        db_user = await common.create_object(session, User, UserCreate(phone=phone))
+        for template in settings.content.GREETING_TODOS:
+            await common.create_object(
+                session,
+                Todo,
+                Todo(
+                    title=template.title,
+                    status=TodoStatus(template.status),
+                    users=[db_user],
+                    created_at=datetime.now(),
+                    modified_at=datetime.now(),
+                ),
+            )
+    return db_user
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.statements = 0
+        self.commits = 0
+
+    def on_statement(self, *args) -> None:
+        self.statements += 1
+
+    def on_commit(self, *args) -> None:
+        self.commits += 1
+
+
+async def run(create_user, phones: range, counter: Counter, user_ids: list[uuid.UUID]) -> list[float]:
+    timings = []
+    for phone in phones:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            started = time.perf_counter()
+            user = await create_user(session, phone)
+            timings.append(time.perf_counter() - started)
+            user_ids.append(user.id)
+    return timings
+
+
+async def cleanup(user_ids: list[uuid.UUID]) -> None:
+    async with AsyncSession(async_engine) as session:
+        links = await session.exec(
+            delete(TodoUserLink)
+            .where(TodoUserLink.user_id.in_(user_ids))
+            .returning(TodoUserLink.todo_id)
+        )
+        todo_ids = list(links.scalars())
+        await session.exec(delete(Todo).where(Todo.id.in_(todo_ids)))
+        await session.exec(delete(TodoCounter).where(TodoCounter.user_id.in_(user_ids)))
+        await session.exec(delete(User).where(User.id.in_(user_ids)))
+        await session.commit()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    counter = Counter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", counter.on_statement)
+    event.listen(async_engine.sync_engine, "commit", counter.on_commit)
+
+    cases = [
+        ("per-todo commits", create_user_per_commit),
+        ("one transaction", users_crud.get_or_create_user),
+    ]
+    templates = len(settings.content.GREETING_TODOS)
+    print(f"{args.logins} first logins, {templates} greeting todos each")
+    print(f"{'':18} {'stmts':>6} {'commits':>8} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    user_ids: list[uuid.UUID] = []
+    try:
+        for index, (name, create_user) in enumerate(cases):
+            phones = range(
+                PHONE_BASE + index * args.logins, PHONE_BASE + (index + 1) * args.logins
+            )
+            counter.statements = counter.commits = 0
+            timings = sorted(await run(create_user, phones, counter, user_ids))
+            print(
+                f"{name:18} {counter.statements / args.logins:6.1f} "
+                f"{counter.commits / args.logins:8.1f} "
+                f"{statistics.mean(timings) * 1000:8.2f} "
+                f"{timings[len(timings) // 2] * 1000:8.2f} "
+                f"{timings[int(len(timings) * 0.95)] * 1000:8.2f}"
+            )
+    finally:
+        await cleanup(user_ids)
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+Login throughput and event loop stalls per OTP hasher (security.OTP_HASHER).
+
+Every login is POST /auth/login/code followed by POST /auth/login for an
+existing user, --concurrency at a time, driving app.main:app in-process
+through httpx. The code is hashed by the first request and verified by the
+second. A ticker measures how late the event loop wakes it, which is the
+time every other request of the worker waits while a code is hashed.
+
+The code is fixed instead of random and DEBUG is turned off, so it is really
+verified. Runs against the database and redis from config.yaml, the seeded
+users are deleted at the end.
+
+    python -m scripts.bench_login --logins 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+from sqlalchemy import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.routes import login as login_routes
+from app.core.config import settings
+from app.core.db import async_engine
+from app.main import app
+from app.models import User
+from scripts.stats import percentile
+
+PHONE_BASE = 78860000000
+OTP_CODE = "1234"
+TICK_SECONDS = 0.005
+
+
+async def tick(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(time.perf_counter() - started - TICK_SECONDS)
+
+
+async def run(client: httpx.AsyncClient, phones: range, concurrency: int) -> dict:
+    latencies: list[float] = []
+    failures = 0
+    pending = iter(phones)
+
+    async def worker() -> None:
+        nonlocal failures
+        for phone in pending:
+            started = time.perf_counter()
+            code = await client.post("/auth/login/code", json={"phone": str(phone)})
+            login = await client.post(
+                "/auth/login", data={"username": str(phone), "password": OTP_CODE}
+            )
+            latencies.append(time.perf_counter() - started)
+            failures += code.status_code != 200 or login.status_code != 200
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(tick(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    return {
+        "logins": len(latencies),
+        "failures": failures,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "lag_p99_ms": percentile(lags, 0.99) * 1000,
+        "lag_max_ms": max(lags) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=200, help="Logins per hasher")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--hasher", action="append", choices=["hmac", "bcrypt"],
+        help="Hashers to compare, repeatable, both by default",
+    )
+    args = parser.parse_args()
+
+    logging.getLogger("faststream.access.redis").setLevel(logging.WARNING)
+    # Verified for real, and with a code the benchmark knows
+    settings.DEBUG = False
+    login_routes.send_verification_code = lambda phone: OTP_CODE
+
+    phones = range(PHONE_BASE, PHONE_BASE + args.logins)
+    async with AsyncSession(async_engine) as session:
+        session.add_all(User(phone=phone) for phone in phones)
+        await session.commit()
+
+    transport = httpx.ASGITransport(app=app)
+    base_url = f"http://test{settings.service.API_PREFIX}"
+    print(
+        f"{'hasher':8} {'logins':>6} {'fail':>5} {'logins/s':>9} {'p50 ms':>8} "
+        f"{'p99 ms':>8} {'lag p99':>8} {'lag max':>8}"
+    )
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+            for hasher in args.hasher or ["hmac", "bcrypt"]:
+                settings.security.OTP_HASHER = hasher
+                result = await run(client, phones, args.concurrency)
+                print(
+                    f"{hasher:8} {result['logins']:>6} {result['failures']:>5} "
+                    f"{result['throughput']:>9.1f} {result['p50_ms']:>8.1f} "
+                    f"{result['p99_ms']:>8.1f} {result['lag_p99_ms']:>8.1f} "
+                    f"{result['lag_max_ms']:>8.1f}"
+                )
+    finally:
+        async with AsyncSession(async_engine) as session:
+            await session.exec(delete(User).where(User.phone.in_(phones)))
+            await session.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
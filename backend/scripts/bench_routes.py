@@ -0,0 +1,534 @@
+"""
+Latency, throughput and SQL statements of every API route.
+
+Seeds a user with thousands of todos shared with a few members, a todo
+shared with many members and large profile images, then drives app.main:app
+in-process through httpx. Every route gets the same number of requests,
+--concurrency at a time. Data a request consumes (a todo to delete, an
+invite to accept) is created before the route is timed. Runs against the
+database and redis from config.yaml, the seeded rows are deleted at the end.
+Blobs are content-addressed and stay in the store.
+
+Results are printed as a table and written as JSON, to diff between commits.
+The websocket is not covered, see scripts/bench_ws_fanout.py.
+
+    python -m scripts.bench_routes --todos 2000 --requests 200 --output bench.json
+"""
+import argparse
+import asyncio
+import contextvars
+import io
+import json
+import logging
+import os
+import statistics
+import subprocess
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import httpx
+from PIL import Image as ImagePIL
+from sqlalchemy import delete, event, or_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import security
+from app.core.config import settings
+from app.core.db import async_engine, redis_db
+from app.core.storage import blob_store
+from app.crud import users as users_crud
+from app.main import app
+from app.models import (
+    Image,
+    Invite,
+    Todo,
+    TodoChange,
+    TodoChangeSeq,
+    TodoCounter,
+    TodoUserLink,
+    User,
+)
+from app.schemas.utils import TokenPayload
+from app.utils import encode_cursor
+from scripts.stats import percentile
+
+PHONE_BASE = 78880000000
+# Seeded, logged in and deleted users all get a phone in this range
+PHONE_RANGE = 1_000_000
+OTP_CODE = "123456"
+BLUR_HASH = "L00000fQfQfQfQfQfQfQfQfQfQfQ"
+
+# Statement counter of the request being sent, set per request
+statements_counter: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar(
+    "statements_counter", default=None
+)
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany) -> None:
+    counter = statements_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+@dataclass
+class Call:
+    """One request of a route, prepared before the route is timed."""
+    method: str
+    url: str
+    token: str | None = None
+    kwargs: dict = field(default_factory=dict)
+    on_response: Callable[[httpx.Response], None] | None = None
+
+
+@dataclass
+class Fixtures:
+    owner: User
+    members: list[User]
+    shared_todo_id: uuid.UUID
+    owner_todo_ids: list[uuid.UUID]
+    image_id: uuid.UUID
+    cursor: str
+    upload: bytes
+    # Stored for every login, hashed once as the bcrypt hasher is slow on purpose
+    code_hash: str
+    image_ids: set[uuid.UUID] = field(default_factory=set)
+    next_phone: int = PHONE_BASE
+
+    def phone(self) -> int:
+        self.next_phone += 1
+        return self.next_phone - 1
+
+
+def token(user: User) -> str:
+    return security.create_access_token(TokenPayload(id=user.id))
+
+
+def make_upload(pixels: int) -> bytes:
+    # Noise does not compress, a realistic worst case for the thumbnailer
+    image = ImagePIL.merge(
+        "RGB", [ImagePIL.effect_noise((pixels, pixels), 64) for _ in range(3)]
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def add_owned_todo(session: AsyncSession, users: list[User]) -> uuid.UUID:
+    todo = Todo(title="Prepared")
+    session.add(todo)
+    await session.flush()
+    session.add_all(TodoUserLink(user_id=user.id, todo_id=todo.id) for user in users)
+    await session.commit()
+    return todo.id
+
+
+async def seed(session: AsyncSession, args: argparse.Namespace) -> Fixtures:
+    avatar = await blob_store.put(os.urandom(args.avatar_kb * 1024))
+    images = [
+        Image(blur_hash=BLUR_HASH, blob_key=avatar, size=args.avatar_kb * 1024)
+        for _ in range(args.members + 1)
+    ]
+    session.add_all(images)
+    await session.flush()
+    users = [
+        User(phone=PHONE_BASE + i, name=f"Bench {i}", profile_image_id=image.id)
+        for i, image in enumerate(images)
+    ]
+    session.add_all(users)
+    await session.flush()
+
+    fixtures = Fixtures(
+        owner=users[0],
+        members=users[1:],
+        shared_todo_id=uuid.uuid4(),
+        owner_todo_ids=[],
+        image_id=images[0].id,
+        cursor="",
+        upload=make_upload(args.upload_pixels),
+        code_hash=await security.get_code_hash(OTP_CODE),
+        image_ids={image.id for image in images},
+        next_phone=PHONE_BASE + len(users),
+    )
+
+    # The owner's todos, each shared with a few members
+    for start in range(0, args.todos, 500):
+        todos = [Todo(title=f"Todo {n}") for n in range(start, min(start + 500, args.todos))]
+        session.add_all(todos)
+        await session.flush()
+        for n, todo in enumerate(todos, start=start):
+            members = [
+                fixtures.members[(n + j) % args.members] for j in range(args.todo_members)
+            ]
+            session.add_all(
+                TodoUserLink(user_id=user.id, todo_id=todo.id)
+                for user in [fixtures.owner, *members]
+            )
+        fixtures.owner_todo_ids.extend(todo.id for todo in todos)
+
+    shared = Todo(title="Shared with everyone")
+    session.add(shared)
+    await session.flush()
+    session.add_all(TodoUserLink(user_id=user.id, todo_id=shared.id) for user in users)
+    fixtures.shared_todo_id = shared.id
+
+    # Pending invites of the owner, to todos of the first member
+    for n in range(args.invites):
+        todo = Todo(title=f"Invited {n}")
+        session.add(todo)
+        await session.flush()
+        session.add(TodoUserLink(user_id=fixtures.members[0].id, todo_id=todo.id))
+        session.add(
+            Invite(todo_id=todo.id, user_id=fixtures.owner.id, owner_id=fixtures.members[0].id)
+        )
+    await session.commit()
+
+    middle = (
+        await session.exec(
+            select(Todo)
+            .join(TodoUserLink, Todo.id == TodoUserLink.todo_id)
+            .where(TodoUserLink.user_id == fixtures.owner.id)
+            .order_by(Todo.modified_at, Todo.id)
+            .offset(args.todos // 2)
+            .limit(1)
+        )
+    ).one()
+    fixtures.cursor = encode_cursor(middle.modified_at, middle.id)
+    return fixtures
+
+
+# Routes: name, share of --requests, prepare(session, fixtures, index) -> Call
+
+async def users_me(session, f, i):
+    return Call("GET", "/users/me", token(f.owner))
+
+
+async def users_me_patch(session, f, i):
+    return Call("PATCH", "/users/me", token(f.owner), {"json": {"name": f"Bench {i}"}})
+
+
+async def users_me_delete(session, f, i):
+    user = User(phone=f.phone())
+    session.add(user)
+    await session.commit()
+    return Call("DELETE", "/users/me", token(user))
+
+
+async def users_me_image(session, f, i):
+    def track(response: httpx.Response) -> None:
+        image = response.json().get("profile_image") if response.is_success else None
+        if image:
+            f.image_ids.add(uuid.UUID(image["id"]))
+
+    files = {"file": ("avatar.png", f.upload, "image/png")}
+    return Call("POST", "/users/me/image", token(f.members[-1]), {"files": files}, track)
+
+
+async def login_code(session, f, i):
+    phone = f.members[i % len(f.members)].phone
+    return Call("POST", "/auth/login/code", kwargs={"json": {"phone": str(phone)}})
+
+
+async def login(session, f, i):
+    phone = f.phone()
+    await redis_db.set(f"verification:phone:{phone}", f.code_hash, ex=timedelta(minutes=10))
+    form = {"username": str(phone), "password": OTP_CODE}
+    return Call("POST", "/auth/login", kwargs={"data": form})
+
+
+async def logout(session, f, i):
+    return Call("POST", "/auth/logout/", token(f.owner))
+
+
+async def todos_page(session, f, i):
+    return Call("GET", "/todos/", token(f.owner))
+
+
+async def todos_page_total(session, f, i):
+    return Call("GET", "/todos/?with_total=true", token(f.owner))
+
+
+async def todos_page_cursor(session, f, i):
+    return Call("GET", f"/todos/?cursor={f.cursor}", token(f.owner))
+
+
+async def todos_search(session, f, i):
+    # Matches the one seeded "Todo <i>" title
+    return Call("GET", f"/todos/?q={i}&status=new&order=desc", token(f.owner))
+
+
+async def todos_summary(session, f, i):
+    return Call("GET", "/todos/summary", token(f.owner))
+
+
+async def todo_shared(session, f, i):
+    return Call("GET", f"/todos/{f.shared_todo_id}", token(f.owner))
+
+
+async def todo_create(session, f, i):
+    return Call("POST", "/todos/", token(f.owner), {"json": {"title": f"Created {i}"}})
+
+
+async def todo_update(session, f, i):
+    todo_id = f.owner_todo_ids[i % len(f.owner_todo_ids)]
+    return Call("PUT", f"/todos/{todo_id}", token(f.owner), {"json": {"title": f"Updated {i}"}})
+
+
+async def todo_update_shared(session, f, i):
+    body = {"json": {"title": f"Updated {i}"}}
+    return Call("PUT", f"/todos/{f.shared_todo_id}", token(f.owner), body)
+
+
+async def todo_delete(session, f, i):
+    todo_id = await add_owned_todo(session, [f.owner, *f.members[:3]])
+    return Call("DELETE", f"/todos/{todo_id}", token(f.owner))
+
+
+async def todos_batch(session, f, i):
+    updated = await add_owned_todo(session, [f.owner, *f.members[:3]])
+    deleted = await add_owned_todo(session, [f.owner, *f.members[:3]])
+    operations = [
+        *({"op": "create", "data": {"title": f"Batch {i}.{n}"}} for n in range(8)),
+        {"op": "update", "id": str(updated), "data": {"title": f"Batch {i}"}},
+        {"op": "delete", "id": str(deleted)},
+    ]
+    return Call("POST", "/todos/batch", token(f.owner), {"json": {"operations": operations}})
+
+
+async def invites_page(session, f, i):
+    return Call("GET", "/todos/invites/", token(f.owner))
+
+
+async def invite_create(session, f, i):
+    user = User(phone=f.phone())
+    session.add(user)
+    await session.commit()
+    params = {"todo_id": str(f.shared_todo_id), "user_phone": user.phone}
+    return Call("POST", "/todos/invites/", token(f.owner), {"params": params})
+
+
+async def prepare_invite(session: AsyncSession, f: Fixtures) -> uuid.UUID:
+    todo_id = await add_owned_todo(session, f.members[:3])
+    invite = Invite(todo_id=todo_id, user_id=f.owner.id, owner_id=f.members[0].id)
+    session.add(invite)
+    await session.commit()
+    return invite.id
+
+
+async def invite_accept(session, f, i):
+    invite_id = await prepare_invite(session, f)
+    return Call("POST", f"/todos/invites/{invite_id}/accept", token(f.owner))
+
+
+async def invite_decline(session, f, i):
+    invite_id = await prepare_invite(session, f)
+    return Call("POST", f"/todos/invites/{invite_id}/decline", token(f.owner))
+
+
+async def image_original(session, f, i):
+    return Call("GET", f"/images/{f.image_id}")
+
+
+async def image_thumbnail(session, f, i):
+    return Call("GET", f"/images/{f.image_id}?size=64")
+
+
+async def image_not_modified(session, f, i):
+    headers = {"If-None-Match": f'"{f.image_id}"'}
+    return Call("GET", f"/images/{f.image_id}", kwargs={"headers": headers})
+
+
+ROUTES: list[tuple[str, float, Callable[..., Awaitable[Call]]]] = [
+    ("POST /auth/login/code", 1, login_code),
+    ("POST /auth/login", 1, login),
+    ("POST /auth/logout/", 1, logout),
+    ("GET /users/me", 1, users_me),
+    ("PATCH /users/me", 1, users_me_patch),
+    ("POST /users/me/image", 0.1, users_me_image),
+    ("DELETE /users/me", 1, users_me_delete),
+    ("GET /images/{image_id}", 1, image_original),
+    ("GET /images/{image_id}?size=64", 1, image_thumbnail),
+    ("GET /images/{image_id} If-None-Match", 1, image_not_modified),
+    ("GET /todos/invites/", 1, invites_page),
+    ("POST /todos/invites/", 1, invite_create),
+    ("POST /todos/invites/{invite_id}/accept", 1, invite_accept),
+    ("POST /todos/invites/{invite_id}/decline", 1, invite_decline),
+    ("GET /todos/", 1, todos_page),
+    ("GET /todos/?with_total=true", 1, todos_page_total),
+    ("GET /todos/?cursor={middle}", 1, todos_page_cursor),
+    ("GET /todos/?q={word}&status=new&order=desc", 1, todos_search),
+    ("GET /todos/summary", 1, todos_summary),
+    ("GET /todos/{shared_todo_id}", 1, todo_shared),
+    ("POST /todos/", 1, todo_create),
+    ("PUT /todos/{todo_id}", 1, todo_update),
+    ("PUT /todos/{shared_todo_id}", 1, todo_update_shared),
+    ("DELETE /todos/{todo_id}", 1, todo_delete),
+    ("POST /todos/batch", 0.5, todos_batch),
+]
+
+
+async def run_route(
+    client: httpx.AsyncClient, calls: list[Call], concurrency: int
+) -> dict:
+    latencies: list[float] = []
+    statements: list[int] = []
+    statuses: dict[str, int] = {}
+    pending = iter(calls)
+
+    async def worker() -> None:
+        for call in pending:
+            counter = [0]
+            statements_counter.set(counter)
+            headers = call.kwargs.pop("headers", {})
+            if call.token:
+                headers["Cookie"] = f"{settings.security.JWT_COOKIE_NAME}={call.token}"
+            started = time.perf_counter()
+            response = await client.request(call.method, call.url, headers=headers, **call.kwargs)
+            latencies.append(time.perf_counter() - started)
+            statements_counter.set(None)
+            statements.append(counter[0])
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if call.on_response:
+                call.on_response(response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(calls),
+        "statuses": statuses,
+        "errors": sum(count for status, count in statuses.items() if int(status) >= 500),
+        "throughput_rps": round(len(calls) / elapsed, 1),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": round(percentile(latencies, 0.5) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+        },
+        "statements": {
+            "mean": round(statistics.mean(statements), 2),
+            "max": max(statements),
+        },
+    }
+
+
+async def cleanup(f: Fixtures) -> None:
+    phones = (User.phone >= PHONE_BASE) & (User.phone < PHONE_BASE + PHONE_RANGE)
+    async with AsyncSession(async_engine) as session:
+        user_ids = list((await session.exec(select(User.id).where(phones))).all())
+        todo_ids = list(
+            (
+                await session.exec(
+                    select(TodoUserLink.todo_id).where(TodoUserLink.user_id.in_(user_ids))
+                )
+            ).all()
+        )
+        await session.exec(
+            delete(TodoChange).where(
+                or_(TodoChange.user_id.in_(user_ids), TodoChange.todo_id.in_(todo_ids))
+            )
+        )
+        await session.exec(
+            delete(Invite).where(
+                or_(
+                    Invite.todo_id.in_(todo_ids),
+                    Invite.user_id.in_(user_ids),
+                    Invite.owner_id.in_(user_ids),
+                )
+            )
+        )
+        await session.exec(delete(TodoUserLink).where(TodoUserLink.todo_id.in_(todo_ids)))
+        await session.exec(delete(Todo).where(Todo.id.in_(todo_ids)))
+        await session.exec(delete(TodoCounter).where(TodoCounter.user_id.in_(user_ids)))
+        await session.exec(delete(TodoChangeSeq).where(TodoChangeSeq.user_id.in_(user_ids)))
+        await session.exec(delete(User).where(User.id.in_(user_ids)))
+        await session.exec(delete(Image).where(Image.id.in_(f.image_ids)))
+        await session.commit()
+    for user_id in user_ids:
+        await users_crud.invalidate_cached_user(user_id, redis_db)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--todos", type=int, default=2000, help="Todos of the benchmarked user")
+    parser.add_argument("--todo-members", type=int, default=3, help="Other members of each of them")
+    parser.add_argument("--members", type=int, default=50, help="Members of the shared todo")
+    parser.add_argument("--invites", type=int, default=100, help="Pending invites of the user")
+    parser.add_argument("--avatar-kb", type=int, default=1024, help="Size of the profile images")
+    parser.add_argument("--upload-pixels", type=int, default=1024, help="Side of the upload")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--route", action="append", help="Only routes containing this, repeatable")
+    parser.add_argument("--output", help="JSON results file, stdout when not given")
+    args = parser.parse_args()
+
+    # Every event of a write is also delivered to this process, its log is noise here
+    logging.getLogger("faststream.access.redis").setLevel(logging.WARNING)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    routes = [
+        route for route in ROUTES
+        if not args.route or any(part in route[0] for part in args.route)
+    ]
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        seeded_at = time.perf_counter()
+        fixtures = await seed(session, args)
+        seed_seconds = time.perf_counter() - seeded_at
+
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    base_url = f"http://test{settings.service.API_PREFIX}"
+    try:
+        # Started for the redis broker, writes publish their changes
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            transport=transport, base_url=base_url, timeout=60
+        ) as client:
+            print(
+                f"{'route':44} {'req':>5} {'err':>4} {'rps':>8} "
+                f"{'p50 ms':>8} {'p99 ms':>8} {'stmts':>6}"
+            )
+            for name, share, prepare in routes:
+                requests = max(int(args.requests * share), 5)
+                async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                    calls = [await prepare(session, fixtures, i) for i in range(requests)]
+                result = await run_route(client, calls, args.concurrency)
+                results[name] = result
+                print(
+                    f"{name:44} {result['requests']:>5} {result['errors']:>4} "
+                    f"{result['throughput_rps']:>8.1f} {result['latency_ms']['p50']:>8.2f} "
+                    f"{result['latency_ms']['p99']:>8.2f} {result['statements']['mean']:>6.1f}"
+                )
+    finally:
+        await cleanup(fixtures)
+        await async_engine.dispose()
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "seed_seconds": round(seed_seconds, 2),
+        "params": {
+            key: value for key, value in vars(args).items() if key not in ("output", "route")
+        },
+        "routes": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,286 @@
+"""
+Latency of filtered and full-text todo reads for a user with many todos.
+
+Seeds one user with --todos todos whose titles and descriptions are drawn
+from a small vocabulary, so words match from a few percent of the todos down
+to a handful, and whose modification times are spread over a year. Each case
+reads pages through todos_crud.read_objects like GET /todos/ does, --repeat
+times. The total of every case is checked against the seeded data and the
+plan of its page query is shown, to see which index serves it. With
+--client-side the former way is timed too: every page read unfiltered and
+filtered by the client. The seeded rows are deleted at the end.
+
+    python -m scripts.bench_todo_search --todos 100000 --repeat 50
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_engine
+from app.crud import todos as todos_crud
+from app.models import Todo, TodoCounter, TodoStatus, TodoUserLink, User
+from app.schemas.todo import TodoFilter
+from app.schemas.utils import PageCursor, PageParams
+from scripts.stats import percentile
+
+PHONE = 78890000000
+PAGE_SIZE = 100
+CHUNK = 5000
+
+# Every title is "<verb> <noun>", every tenth todo also gets a description
+VERBS = ["buy", "call", "fix", "read", "write", "send", "plan", "clean", "pay", "book"]
+NOUNS = [f"item{n}" for n in range(200)]
+# One todo in a thousand mentions it
+RARE_WORD = "passport"
+
+
+@dataclass
+class Case:
+    name: str
+    todo_filter: TodoFilter
+    # The seeded todos it matches, to check the total
+    expected: int
+
+
+def make_rows(count: int, now: datetime) -> list[dict]:
+    rng = random.Random(0)
+    rows = []
+    for n in range(count):
+        title = f"{rng.choice(VERBS)} {rng.choice(NOUNS)}"
+        description = None
+        if n % 10 == 0:
+            description = f"remember to {rng.choice(VERBS)} it today"
+        if n % 1000 == 0:
+            title = f"{title} {RARE_WORD}"
+        modified_at = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        rows.append(
+            {
+                "id": uuid.uuid4(),
+                "attributes": {},
+                "is_active": True,
+                "title": title,
+                "description": description,
+                "status": rng.choice(list(TodoStatus)),
+                "created_at": modified_at,
+                "modified_at": modified_at,
+            }
+        )
+    return rows
+
+
+def make_cases(rows: list[dict], now: datetime) -> list[Case]:
+    def words(row: dict) -> set[str]:
+        return set(f"{row['title']} {row['description'] or ''}".split())
+
+    week_ago = now - timedelta(days=7)
+    return [
+        Case("no filter", TodoFilter(), len(rows)),
+        Case("order desc", TodoFilter(order="desc"), len(rows)),
+        Case(
+            "status done",
+            TodoFilter(status=[TodoStatus.DONE]),
+            sum(row["status"] == TodoStatus.DONE for row in rows),
+        ),
+        Case(
+            "modified last week",
+            TodoFilter(modified_after=week_ago),
+            sum(row["modified_at"] > week_ago for row in rows),
+        ),
+        Case("q common word", TodoFilter(q="buy"), sum("buy" in words(row) for row in rows)),
+        Case(
+            "q word and noun",
+            TodoFilter(q="buy item7"),
+            sum({"buy", "item7"} <= words(row) for row in rows),
+        ),
+        Case(
+            "q description word",
+            TodoFilter(q="remember"),
+            sum("remember" in words(row) for row in rows),
+        ),
+        Case("q rare word", TodoFilter(q=RARE_WORD), sum(RARE_WORD in words(row) for row in rows)),
+        Case(
+            "q rare word, status done, desc",
+            TodoFilter(q=RARE_WORD, status=[TodoStatus.DONE], order="desc"),
+            sum(
+                RARE_WORD in words(row) and row["status"] == TodoStatus.DONE for row in rows
+            ),
+        ),
+        Case("q no match", TodoFilter(q="nothingmatches"), 0),
+    ]
+
+
+async def seed(session: AsyncSession, rows: list[dict]) -> User:
+    user = User(phone=PHONE, name="Search bench")
+    session.add(user)
+    await session.flush()
+    # Core inserts, ORM objects for this many rows would dominate the seeding
+    connection = await session.connection()
+    for start in range(0, len(rows), CHUNK):
+        chunk = rows[start:start + CHUNK]
+        await connection.execute(insert(Todo.__table__), chunk)
+        await connection.execute(
+            insert(TodoUserLink.__table__),
+            [{"user_id": user.id, "todo_id": row["id"]} for row in chunk],
+        )
+    await session.commit()
+
+    # Merges the GIN pending list and gathers statistics, as autovacuum would
+    async with async_engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        for table in ("todos", "todouserlink"):
+            await connection.exec_driver_sql(f"VACUUM ANALYZE {table}")
+    return user
+
+
+async def plan(session: AsyncSession, user: User, case: Case) -> str:
+    """The plan of the page query, captured as it is sent."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany) -> None:
+        statements.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        await todos_crud.read_objects(
+            session, user, PageParams(limit=PAGE_SIZE, skip=0, with_total=False),
+            todo_filter=case.todo_filter,
+        )
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    statement, parameters = statements[-1]
+    connection = await session.connection()
+    result = await connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+    # Scan nodes only, the rest is the same for every case
+    return "; ".join(
+        line.strip(" ->").split("  (")[0]
+        for (line,) in result
+        if "Scan" in line
+    )
+
+
+async def run_case(
+    session: AsyncSession, user: User, case: Case, repeat: int, pages: int
+) -> tuple[list[float], int | None]:
+    latencies = []
+    total = None
+    for _ in range(repeat):
+        cursor = None
+        started = time.perf_counter()
+        for page in range(pages):
+            # Totals are counted with the first page only, as clients do
+            q = PageParams(limit=PAGE_SIZE, skip=0, cursor=cursor, with_total=page == 0)
+            todos, page_total = await todos_crud.read_objects(
+                session, user, q, options=todos_crud.TODO_OUT_OPTIONS,
+                todo_filter=case.todo_filter,
+            )
+            if page == 0:
+                total = page_total
+            session.expunge_all()
+            if len(todos) < PAGE_SIZE:
+                break
+            cursor = PageCursor(modified_at=todos[-1].modified_at, id=todos[-1].id)
+        latencies.append(time.perf_counter() - started)
+    return latencies, total
+
+
+async def client_side(session: AsyncSession, user: User, case: Case) -> tuple[float, int]:
+    """Every page read unfiltered, filtered afterwards. Only text-free cases."""
+    f = case.todo_filter
+    started = time.perf_counter()
+    matched = 0
+    cursor = None
+    while True:
+        q = PageParams(limit=PAGE_SIZE, skip=0, cursor=cursor, with_total=False)
+        todos, _ = await todos_crud.read_objects(
+            session, user, q, options=todos_crud.TODO_OUT_OPTIONS
+        )
+        matched += sum(
+            (not f.status or todo.status in f.status)
+            and (not f.modified_after or todo.modified_at > f.modified_after)
+            for todo in todos
+        )
+        session.expunge_all()
+        if len(todos) < PAGE_SIZE:
+            break
+        cursor = PageCursor(modified_at=todos[-1].modified_at, id=todos[-1].id)
+    return time.perf_counter() - started, matched
+
+
+async def cleanup() -> None:
+    async with AsyncSession(async_engine) as session:
+        user = (await session.exec(select(User).where(User.phone == PHONE))).first()
+        if not user:
+            return
+        todo_ids = list(
+            (
+                await session.exec(
+                    select(TodoUserLink.todo_id).where(TodoUserLink.user_id == user.id)
+                )
+            ).all()
+        )
+        await session.exec(delete(TodoUserLink).where(TodoUserLink.user_id == user.id))
+        for start in range(0, len(todo_ids), CHUNK):
+            await session.exec(delete(Todo).where(Todo.id.in_(todo_ids[start:start + CHUNK])))
+        await session.exec(delete(TodoCounter).where(TodoCounter.user_id == user.id))
+        await session.exec(delete(User).where(User.id == user.id))
+        await session.commit()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--todos", type=int, default=100_000, help="Todos of the user")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs of every case")
+    parser.add_argument("--pages", type=int, default=1, help="Pages read per run, by cursor")
+    parser.add_argument("--client-side", action="store_true", help="Time client filtering too")
+    args = parser.parse_args()
+
+    # Left behind by an interrupted run
+    await cleanup()
+    now = datetime.now()
+    rows = make_rows(args.todos, now)
+    cases = make_cases(rows, now)
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            started = time.perf_counter()
+            user = await seed(session, rows)
+            print(f"Seeded {args.todos} todos in {time.perf_counter() - started:.1f}s\n")
+            del rows
+
+            print(
+                f"{'case':32} {'total':>7} {'check':>6} {'p50 ms':>8} {'p99 ms':>8}  plan"
+            )
+            for case in cases:
+                latencies, total = await run_case(
+                    session, user, case, args.repeat, args.pages
+                )
+                check = "ok" if total == case.expected else f"!{case.expected}"
+                print(
+                    f"{case.name:32} {total:>7} {check:>6} "
+                    f"{percentile(latencies, 0.5) * 1000:>8.2f} "
+                    f"{percentile(latencies, 0.99) * 1000:>8.2f}  "
+                    f"{await plan(session, user, case)}"
+                )
+
+            if args.client_side:
+                print(f"\n{'client side':32} {'total':>7} {'check':>6} {'s':>8}")
+                for case in cases:
+                    if case.todo_filter.q:
+                        continue
+                    seconds, matched = await client_side(session, user, case)
+                    check = "ok" if matched == case.expected else f"!{case.expected}"
+                    print(f"{case.name:32} {matched:>7} {check:>6} {seconds:>8.2f}")
+    finally:
+        await cleanup()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
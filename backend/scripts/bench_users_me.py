@@ -0,0 +1,129 @@
+"""
+Throughput of GET /users/me and how often it re-issues the session token.
+
+Seeds --users users with a session token each and polls GET /users/me with
+them, --concurrency at a time, driving app.main:app in-process through
+httpx. Runs once with TOKEN_REFRESH_AFTER set to 0, which re-issues the
+token on every call as before, and once with the configured fraction, for
+fresh tokens and for tokens past that fraction of their lifetime. Every
+response with a Set-Cookie header counts as a refresh. Runs against the
+database and redis from config.yaml, the seeded users are deleted at the end.
+
+    python -m scripts.bench_users_me --requests 5000 --users 50 --concurrency 20
+"""
+import argparse
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from jose import jwt
+from sqlalchemy import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import async_engine, redis_db
+from app.main import app
+from app.models import User
+from scripts.stats import percentile
+
+PHONE_BASE = 78870000000
+
+
+def make_token(user_id: uuid.UUID, age: float) -> str:
+    """A token issued `age` of ACCESS_TOKEN_EXPIRE_MINUTES ago."""
+    lifetime = timedelta(minutes=settings.security.ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode = {
+        "exp": datetime.now(timezone.utc) + lifetime * (1 - age),
+        "id": str(user_id),
+    }
+    return jwt.encode(
+        to_encode, settings.security.SECRET_KEY, algorithm=settings.security.ALGORITHM
+    )
+
+
+async def run(client: httpx.AsyncClient, tokens: list[str], requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    failures = 0
+    refreshed = 0
+    pending = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal failures, refreshed
+        for n in pending:
+            cookies = {settings.security.JWT_COOKIE_NAME: tokens[n % len(tokens)]}
+            started = time.perf_counter()
+            response = await client.get("/users/me", cookies=cookies)
+            latencies.append(time.perf_counter() - started)
+            failures += response.status_code != 200
+            refreshed += "set-cookie" in response.headers
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "failures": failures,
+        "refreshed": refreshed,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per case")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger("faststream.access.redis").setLevel(logging.WARNING)
+    refresh_after = settings.security.TOKEN_REFRESH_AFTER
+    # Just past the point the configured fraction refreshes them
+    old_age = min(refresh_after + 0.01, 0.99)
+
+    phones = range(PHONE_BASE, PHONE_BASE + args.users)
+    users = [User(phone=phone) for phone in phones]
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        session.add_all(users)
+        await session.commit()
+    fresh = [make_token(user.id, 0) for user in users]
+    old = [make_token(user.id, old_age) for user in users]
+    cases = [
+        ("every call, fresh", 0, fresh),
+        (f"after {refresh_after:g}, fresh", refresh_after, fresh),
+        (f"after {refresh_after:g}, aged {old_age:g}", refresh_after, old),
+    ]
+
+    transport = httpx.ASGITransport(app=app)
+    base_url = f"http://test{settings.service.API_PREFIX}"
+    print(
+        f"{'refresh':24} {'reqs':>6} {'fail':>5} {'set-cookie':>10} {'reqs/s':>8} "
+        f"{'p50 ms':>8} {'p99 ms':>8}"
+    )
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+            # Warms the user and token caches, which every case then shares
+            await run(client, fresh + old, len(fresh + old), args.concurrency)
+            for name, fraction, tokens in cases:
+                settings.security.TOKEN_REFRESH_AFTER = fraction
+                result = await run(client, tokens, args.requests, args.concurrency)
+                print(
+                    f"{name:24} {result['requests']:>6} {result['failures']:>5} "
+                    f"{result['refreshed']:>10} {result['throughput']:>8.1f} "
+                    f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+                )
+    finally:
+        settings.security.TOKEN_REFRESH_AFTER = refresh_after
+        async with AsyncSession(async_engine) as session:
+            await session.exec(delete(User).where(User.phone.in_(phones)))
+            await session.commit()
+        await async_engine.dispose()
+        await redis_db.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+"""
+Measures websocket fan-out through redis pub/sub across worker processes.
+
+Starts N worker processes, each subscribed to the todo events channel like
+an API worker and holding its share of M fake websocket connections. The
+main process publishes changes for random users with publish_changes and
+every worker delivers them with ConnectionManager.send_to_user. Reported
+are publish and delivery throughput and the publish to delivery latency.
+
+With --slow-connections some clients never finish reading, the latency of
+the others should not change.
+
+    python -m scripts.bench_ws_fanout --workers 3 --connections 3000 --events 5000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+import uuid
+
+from faststream.redis import RedisBroker
+
+from app.core.config import settings
+from app.core.connections import (
+    TODO_EVENTS_CHANNEL,
+    ConnectionManager,
+    TodoEvent,
+    encode_event,
+    publish_changes,
+)
+from app.models import TodoChange, TodoChangeOp
+from scripts.stats import percentile
+
+
+class StalledSocket:
+    """A client that stopped reading, every send blocks."""
+
+    async def send_text(self, data: str) -> None:
+        await asyncio.Event().wait()
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+class BenchSocket:
+    """Stands in for a websocket, records the latency of every message."""
+
+    def __init__(self, latencies: list[float], expected: int, done: asyncio.Event) -> None:
+        self.latencies = latencies
+        self.expected = expected
+        self.done = done
+        self.last_at = 0.0
+
+    async def send_text(self, data: str) -> None:
+        self.last_at = time.time()
+        self.latencies.append(self.last_at - json.loads(data)["sent_at"])
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def plan(args: argparse.Namespace) -> tuple[list[uuid.UUID], list[int]]:
+    # Same seed in every process, workers know what they will receive
+    rng = random.Random(args.seed)
+    users_count = max(args.connections // args.connections_per_user, 1)
+    user_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(users_count)]
+    targets = [rng.randrange(users_count) for _ in range(args.events)]
+    return user_ids, targets
+
+
+def connection_owner(connection: int, args: argparse.Namespace) -> tuple[int, int]:
+    """User index and worker index of a connection."""
+    users_count = max(args.connections // args.connections_per_user, 1)
+    return connection % users_count, connection % args.workers
+
+
+async def run_worker(
+    index: int, args: argparse.Namespace, ready, results: multiprocessing.Queue
+) -> None:
+    user_ids, targets = plan(args)
+    owned: list[int] = []
+    stalled: list[int] = []
+    sockets_per_user = [0] * len(user_ids)
+    for connection in range(args.connections):
+        user, worker = connection_owner(connection, args)
+        if worker != index:
+            continue
+        if connection < args.slow_connections:
+            stalled.append(user)
+        else:
+            owned.append(user)
+            sockets_per_user[user] += 1
+    expected = sum(sockets_per_user[target] for target in targets)
+
+    manager = ConnectionManager()
+    latencies: list[float] = []
+    done = asyncio.Event()
+    sockets = [BenchSocket(latencies, expected, done) for _ in owned]
+    for user, socket in zip(owned, sockets):
+        manager.connect(user_ids[user], socket)
+    for user in stalled:
+        manager.connect(user_ids[user], StalledSocket())
+
+    broker = RedisBroker(args.redis_url, logger=None)
+
+    @broker.subscriber(TODO_EVENTS_CHANNEL)
+    async def todo_event(event: TodoEvent) -> None:
+        manager.send_to_user(event.user_id, event.frames)
+
+    await broker.start()
+    ready.release()
+    if expected:
+        try:
+            await asyncio.wait_for(done.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            pass
+    await broker.close()
+    last_at = max((socket.last_at for socket in sockets), default=0.0)
+    results.put((expected, latencies, last_at))
+
+
+def worker_main(index: int, args: argparse.Namespace, ready, results) -> None:
+    asyncio.run(run_worker(index, args, ready, results))
+
+
+async def publish(args: argparse.Namespace) -> tuple[float, float]:
+    user_ids, targets = plan(args)
+    broker = RedisBroker(args.redis_url, logger=None)
+    await broker.connect()
+    started = time.time()
+    todo_id = uuid.uuid4()
+    for seq, target in enumerate(targets, start=1):
+        event = {"sent_at": time.time(), "padding": "x" * args.payload}
+        # Not stored, only carries what a recorded change would
+        change = TodoChange(
+            seq=seq, user_id=user_ids[target], todo_id=todo_id,
+            op=TodoChangeOp.UPDATE, data=event,
+        )
+        await publish_changes(broker, [change], {todo_id: encode_event(event)})
+    finished = time.time()
+    await broker.close()
+    return started, finished
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--connections", type=int, default=3000)
+    parser.add_argument("--connections-per-user", type=int, default=1)
+    parser.add_argument("--slow-connections", type=int, default=0)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--payload", type=int, default=300, help="Padding bytes per event")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--redis-url", default=settings.REDIS_DATABASE_URI)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Semaphore(0)
+    results = context.Queue()
+    workers = [
+        context.Process(target=worker_main, args=(index, args, ready, results))
+        for index in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.acquire()
+    # Subscriptions are confirmed asynchronously by redis
+    time.sleep(0.5)
+
+    started, published = asyncio.run(publish(args))
+
+    expected = 0
+    delivered = started
+    latencies: list[float] = []
+    for _ in workers:
+        worker_expected, worker_latencies, last_at = results.get()
+        expected += worker_expected
+        latencies.extend(worker_latencies)
+        delivered = max(delivered, last_at)
+    for worker in workers:
+        worker.join()
+
+    publish_seconds = published - started
+    print(
+        f"workers={args.workers} connections={args.connections} "
+        f"events={args.events} deliveries={len(latencies)}/{expected}"
+    )
+    print(f"publish      {args.events / publish_seconds:10.0f} events/s")
+    print(f"delivery     {len(latencies) / (delivered - started):10.0f} messages/s")
+    for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        print(f"latency {name}  {percentile(latencies, q) * 1000:10.2f} ms")
+    print(f"latency max  {max(latencies, default=0) * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
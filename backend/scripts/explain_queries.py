@@ -0,0 +1,185 @@
+"""
+Prints the Postgres plan of every read query of the crud modules.
+
+Each crud function is run once and the statements it issues are captured
+with their parameters, then explained as they were sent. By default a data
+set is seeded inside one outer transaction, analyzed and rolled back at the
+end. With --phone the queries run as that existing user instead.
+
+    python -m scripts.explain_queries --users 200 --todos 50
+    python -m scripts.explain_queries --phone 79001234567 --analyze
+"""
+import argparse
+import asyncio
+import uuid
+from collections.abc import Awaitable, Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_engine
+from app.crud import common
+from app.crud import invites as invites_crud
+from app.crud import todo_changes as todo_changes_crud
+from app.crud import todos as todos_crud
+from app.crud import users as users_crud
+from app.models import Invite, Todo, TodoChangeOp, TodoUserLink, User
+from app.schemas.utils import PageCursor, PageParams
+
+PHONE_BASE = 71000000000
+MEMBERS_PER_TODO = 3
+PAGE_SIZE = 20
+
+
+class StatementRecorder:
+    def __init__(self) -> None:
+        self.statements: list[tuple[str, object]] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((statement, parameters))
+
+
+async def seed(session: AsyncSession, users_count: int, todos_count: int) -> None:
+    users = [User(phone=PHONE_BASE + i) for i in range(users_count)]
+    session.add_all(users)
+    await session.flush()
+    for i, user in enumerate(users):
+        members = [users[(i + j) % users_count] for j in range(1, MEMBERS_PER_TODO)]
+        todos = [Todo(title=f"Todo {n}") for n in range(todos_count)]
+        session.add_all(todos)
+        await session.flush()
+        session.add_all(
+            TodoUserLink(user_id=member.id, todo_id=todo.id)
+            for todo in todos
+            for member in [user, *members]
+        )
+        session.add_all(
+            Invite(todo_id=todo.id, user_id=members[0].id, owner_id=user.id)
+            for todo in todos[: todos_count // 5]
+        )
+        await todo_changes_crud.record_changes(
+            session, {todo.id: {user.id: (TodoChangeOp.CREATE, {})} for todo in todos}
+        )
+    await session.commit()
+
+
+async def queries(
+    session: AsyncSession, user: User
+) -> list[tuple[str, Callable[[], Awaitable[object]]]]:
+    page, _ = await todos_crud.read_objects(session, user, PageParams(limit=PAGE_SIZE, skip=0))
+    todo_id = page[0].id if page else uuid.uuid4()
+    cursor = (
+        PageCursor(modified_at=page[-1].modified_at, id=page[-1].id) if page else None
+    )
+    invite = (
+        await session.exec(select(Invite).where(Invite.user_id == user.id).limit(1))
+    ).first()
+    last_seq = await todo_changes_crud.get_last_seq(session, user.id)
+    session.expunge_all()
+
+    return [
+        ("users.get_user_by_phone", lambda: users_crud.get_user_by_phone(
+            session, user.phone, options=users_crud.USER_OUT_OPTIONS
+        )),
+        ("common.get_object User", lambda: common.get_object(
+            session, User, user.id, options=users_crud.USER_OUT_OPTIONS
+        )),
+        ("common.get_object Todo", lambda: common.get_object(
+            session, Todo, todo_id, options=todos_crud.TODO_OUT_OPTIONS
+        )),
+        ("todos.read_objects", lambda: todos_crud.read_objects(
+            session, user, PageParams(limit=PAGE_SIZE, skip=0, with_total=True),
+            options=todos_crud.TODO_OUT_OPTIONS,
+        )),
+        ("todos.read_objects cursor", lambda: todos_crud.read_objects(
+            session, user, PageParams(limit=PAGE_SIZE, skip=0, cursor=cursor),
+            options=todos_crud.TODO_OUT_OPTIONS,
+        )),
+        ("todos.read_objects_by_ids", lambda: todos_crud.read_objects_by_ids(
+            session, [todo.id for todo in page], options=todos_crud.TODO_MEMBERS_OPTIONS
+        )),
+        ("invites.read_objects", lambda: invites_crud.read_objects(
+            session, user, PageParams(limit=PAGE_SIZE, skip=0, with_total=True),
+            options=invites_crud.INVITE_OUT_OPTIONS,
+        )),
+        ("invites.get_unique_invite", lambda: invites_crud.get_unique_invite(
+            session,
+            invite.todo_id if invite else todo_id,
+            invite.user_id if invite else user.id,
+        )),
+        ("todo_changes.read_changes", lambda: todo_changes_crud.read_changes(
+            session, user.id, max(last_seq - PAGE_SIZE, 0), PAGE_SIZE
+        )),
+        ("todo_changes.get_last_seq", lambda: todo_changes_crud.get_last_seq(
+            session, user.id
+        )),
+        ("todo_changes.get_pruned_seq", lambda: todo_changes_crud.get_pruned_seq(
+            session, user.id
+        )),
+    ]
+
+
+async def explain(connection: AsyncConnection, args: argparse.Namespace) -> None:
+    session = AsyncSession(
+        bind=connection, expire_on_commit=False, join_transaction_mode="create_savepoint"
+    )
+    if args.phone:
+        user = await users_crud.get_user_by_phone(session, args.phone)
+        if not user:
+            raise SystemExit(f"No user with phone {args.phone}")
+    else:
+        await seed(session, args.users, args.todos)
+        # Fresh statistics, the planner would otherwise assume empty tables
+        for table in (
+            "users", "todos", "todouserlink", "invites", "todo_changes", "todo_change_seqs"
+        ):
+            await connection.exec_driver_sql(f"ANALYZE {table}")
+        user = await users_crud.get_user_by_phone(session, PHONE_BASE)
+
+    options = "ANALYZE, BUFFERS" if args.analyze else "COSTS"
+    recorder = StatementRecorder()
+    for name, query in await queries(session, user):
+        recorder.statements.clear()
+        event.listen(async_engine.sync_engine, "before_cursor_execute", recorder)
+        try:
+            await query()
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", recorder)
+        session.expunge_all()
+
+        for number, (statement, parameters) in enumerate(recorder.statements, start=1):
+            print(f"=== {name} #{number}")
+            if args.sql:
+                print(statement)
+            result = await connection.exec_driver_sql(
+                f"EXPLAIN ({options}) {statement}", parameters
+            )
+            for (line,) in result:
+                print(line)
+            print()
+    await session.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=200, help="Seeded users")
+    parser.add_argument("--todos", type=int, default=50, help="Seeded todos per user")
+    parser.add_argument("--phone", type=int, help="Explain as this existing user, no seeding")
+    parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE, runs the queries")
+    parser.add_argument("--sql", action="store_true", help="Print the statements too")
+    args = parser.parse_args()
+
+    async with async_engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+            await explain(connection, args)
+        finally:
+            await transaction.rollback()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
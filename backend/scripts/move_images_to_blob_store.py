@@ -0,0 +1,51 @@
+"""
+Copies image bytes still stored in the "images.binary" column into the blob
+store configured in config.yaml and clears the column.
+
+Safe to run repeatedly, each batch is committed on its own and already moved
+rows are skipped.
+
+    python -m scripts.move_images_to_blob_store
+"""
+import asyncio
+
+from sqlalchemy import text
+
+from app.core.db import async_engine
+from app.core.storage import blob_store
+
+BATCH_SIZE = 100
+
+
+async def main() -> None:
+    moved = 0
+    while True:
+        async with async_engine.begin() as connection:
+            rows = (
+                await connection.execute(
+                    text(
+                        'SELECT id, "binary" FROM images '
+                        'WHERE blob_key IS NULL AND "binary" IS NOT NULL '
+                        "LIMIT :limit FOR UPDATE SKIP LOCKED"
+                    ),
+                    {"limit": BATCH_SIZE},
+                )
+            ).all()
+            if not rows:
+                break
+            for image_id, data in rows:
+                blob_key = await blob_store.put(bytes(data))
+                await connection.execute(
+                    text(
+                        "UPDATE images SET blob_key = :blob_key, size = :size, "
+                        '"binary" = NULL WHERE id = :id'
+                    ),
+                    {"blob_key": blob_key, "size": len(data), "id": image_id},
+                )
+            moved += len(rows)
+            print(f"moved {moved} images")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+"""
+Removes todo changes older than websockets.CHANGE_LOG_RETENTION_DAYS.
+
+Clients resuming the todos websocket from a pruned change are told to
+reload their todos. Meant to run daily, e.g. from cron.
+
+    python -m scripts.prune_todo_changes
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import async_engine
+from app.crud import todo_changes as todo_changes_crud
+
+
+async def main() -> None:
+    before = datetime.now() - timedelta(days=settings.websockets.CHANGE_LOG_RETENTION_DAYS)
+    async with AsyncSession(async_engine) as session:
+        pruned = await todo_changes_crud.prune_changes(session, before)
+    print(f"pruned {pruned} changes older than {before:%Y-%m-%d %H:%M}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
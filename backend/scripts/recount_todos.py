@@ -0,0 +1,28 @@
+"""
+Corrects the per-user todo counters behind GET /todos/summary.
+
+The API keeps them in the transaction of every todo write. Todos written
+around it, by hand or by a script, leave them off until this runs. Safe
+while the API serves writes.
+
+    python -m scripts.recount_todos
+"""
+import asyncio
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_engine
+from app.crud import todo_counters as todo_counters_crud
+
+
+async def main() -> None:
+    async with AsyncSession(async_engine) as session:
+        changes = await todo_counters_crud.recount(session)
+    for (user_id, status), count in sorted(changes.items(), key=str):
+        print(f"{user_id} {status.value:12} {count:+}")
+    print(f"corrected {len(changes)} counters")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,11 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+
+def percentile(values: list[float], q: float) -> float:
+    """The value below which a `q` fraction of `values` falls, 0 when empty."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
@@ -1,6 +1,8 @@
 from uvicorn import Config, Server
 from uvicorn.supervisors import ChangeReload
 
+from app.core.config import settings
+
 
 def main(host="127.0.0.1", port=8000, log_level="info", reload=True):
     config = Config(
@@ -9,6 +11,10 @@ def main(host="127.0.0.1", port=8000, log_level="info", reload=True):
         port=port,
         log_level=log_level,
         reload=reload,
+        # Same websocket pings as gunicorn_conf.UvicornWorker
+        ws="websockets",
+        ws_ping_interval=settings.websockets.PING_INTERVAL_SECONDS,
+        ws_ping_timeout=settings.websockets.PING_TIMEOUT_SECONDS,
     )
     server = Server(config)
 